@@ -0,0 +1,290 @@
+import asyncio
+import collections
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+import openai
+import events
+import flickTools
+import tracing
+
+# Load settings using flickTools. Every OpenAI call goes through the shared clients
+# below, so connections are reused across prompt, speech and voiceRecognition.
+# 'apiRetries' is how many times a failed call is retried, and a '<kind>Timeout'
+# setting overrides a call kind's timeout, e.g. chatTimeout=20.
+# 'apiHedging' sends a second copy of a slow transcription, speech or image query
+# call once the first has taken longer than most recent ones, and uses whichever
+# answers first. It trades a little extra API use for a shorter tail.
+settings = flickTools.loadSettings()
+retries = settings.get("apiRetries", 2)
+hedging = settings.get("apiHedging", False)
+
+# Default seconds each kind of call may take before it's abandoned and retried.
+defaultTimeouts = {
+    "chat": 30,
+    "digest": 20,
+    "imageQuery": 10,
+    "transcribe": 15,
+    "speech": 20,
+}
+
+# Calls that are cheap and safe to send twice. Chat replies are neither.
+hedgeable = {"imageQuery", "transcribe", "speech"}
+minHedgeSamples = 10 # Latencies needed before the hedge delay is trusted
+
+# Errors worth retrying: the connection, a timeout, rate limits and server errors.
+retryable = (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, openai.InternalServerError)
+
+# Connection pool shared by every call. Idle connections are kept open for two
+# minutes, so a turn doesn't pay a new TLS handshake for each API it calls.
+limits = httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=120)
+connectTimeout = httpx.Timeout(30, connect=5)
+try:
+    import h2 # HTTP/2 lets concurrent calls share one connection when it's installed
+    http2 = True
+except ImportError:
+    http2 = False
+
+# Shared clients. The SDK's own retries are turned off, since call() retries with jitter.
+client = openai.OpenAI(
+    api_key="",
+    max_retries=0,
+    http_client=httpx.Client(limits=limits, timeout=connectTimeout, http2=http2)
+)
+# Async client for the asyncio orchestrator, so cancelling a stage aborts its request.
+asyncClient = openai.AsyncOpenAI(
+    api_key="",
+    max_retries=0,
+    http_client=httpx.AsyncClient(limits=limits, timeout=connectTimeout, http2=http2)
+)
+
+# Recent latencies of each kind of call, for the hedge delay, and when the client last sent a request.
+_latencies = collections.defaultdict(lambda: collections.deque(maxlen=50))
+_lastRequest = 0.0
+_hedgePool = ThreadPoolExecutor(max_workers=4)
+
+# The latest connectivity check of each server, as (monotonic time, reachable), and
+# the servers being checked right now. A check is trusted for 'connectivityCacheSeconds'.
+connectivityCacheSeconds = 20
+_reachable = {}
+_checking = set()
+_reachableLock = threading.Lock()
+
+def timeout(kind):
+    """
+    Looks up how long a kind of call may take.
+
+    Args:
+        kind (str): The kind of call, e.g. "chat".
+
+    Returns:
+        float: The timeout in seconds.
+    """
+    return settings.get(f"{kind}Timeout", defaultTimeouts[kind])
+
+def hedgeDelay(kind):
+    """
+    Works out how long to wait before hedging a call: the 90th percentile of its
+    recent latencies, so only the slowest tenth of calls get a second copy.
+
+    Args:
+        kind (str): The kind of call.
+
+    Returns:
+        float: The delay in seconds, or None if this call shouldn't be hedged.
+    """
+    if not hedging or kind not in hedgeable or len(_latencies[kind]) < minHedgeSamples:
+        return None
+    return tracing.percentile(list(_latencies[kind]), 0.9)
+
+def backoff(attempt):
+    """
+    Picks how long to wait before a retry: exponential, with jitter so retries from
+    several calls that failed together don't all land at the same moment.
+
+    Args:
+        attempt (int): The number of the retry, starting at 0.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    return 0.5 * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+def call(kind, function, **kwargs):
+    """
+    Makes an API call with the kind's timeout, retrying failures with jittered
+    backoff, and hedging it when 'apiHedging' is on.
+
+    Args:
+        kind (str): The kind of call, for its timeout, hedging and logging.
+        function (callable): The client method to call, e.g. client.chat.completions.create.
+        **kwargs: The arguments for the method.
+
+    Returns:
+        The method's result.
+    """
+    global _lastRequest
+    kwargs.setdefault("timeout", timeout(kind))
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        _lastRequest = time.monotonic()
+        try:
+            delay = None if kwargs.get("stream") else hedgeDelay(kind)
+            if delay is None:
+                result = function(**kwargs)
+            else:
+                result = _hedged(kind, delay, function, kwargs)
+            _latencies[kind].append(time.perf_counter() - start)
+            return result
+        except retryable as e:
+            if attempt == retries:
+                raise
+            pause = backoff(attempt)
+            print(f"API   | {kind} call failed ({type(e).__name__}), retrying in {pause:.1f}s")
+            time.sleep(pause)
+
+def _hedged(kind, delay, function, kwargs):
+    """
+    Sends a call, and a second copy if the first hasn't answered after the delay.
+    The first to succeed wins; the other is left to finish in the background.
+    """
+    first = _hedgePool.submit(function, **kwargs)
+    done, pending = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    print(f"API   | {kind} call is slower than {delay:.2f}s, sending a hedge")
+    second = _hedgePool.submit(function, **kwargs)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    return first.result() # Both failed: raise the first one's error
+
+async def callAsync(kind, function, **kwargs):
+    """
+    Async version of call() for the asyncio orchestrator. Cancelling it aborts the
+    request, and a losing hedge is cancelled.
+
+    Args:
+        kind (str): The kind of call, for its timeout, hedging and logging.
+        function (callable): The async client method to call.
+        **kwargs: The arguments for the method.
+
+    Returns:
+        The method's result.
+    """
+    kwargs.setdefault("timeout", timeout(kind))
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            delay = None if kwargs.get("stream") else hedgeDelay(kind)
+            if delay is None:
+                result = await function(**kwargs)
+            else:
+                result = await _hedgedAsync(kind, delay, function, kwargs)
+            _latencies[kind].append(time.perf_counter() - start)
+            return result
+        except retryable as e:
+            if attempt == retries:
+                raise
+            pause = backoff(attempt)
+            print(f"API   | {kind} call failed ({type(e).__name__}), retrying in {pause:.1f}s")
+            await asyncio.sleep(pause)
+
+async def _hedgedAsync(kind, delay, function, kwargs):
+    """
+    Async version of _hedged(). The slower request is cancelled once one succeeds.
+    """
+    tasks = [asyncio.ensure_future(function(**kwargs))]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            print(f"API   | {kind} call is slower than {delay:.2f}s, sending a hedge")
+            tasks.append(asyncio.ensure_future(function(**kwargs)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        return tasks[0].result() # Both failed: raise the first one's error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def warmUp():
+    """
+    Opens a connection to the API ahead of the next turn, in a background thread,
+    if the pooled one may have gone idle. Called when the student starts talking,
+    so the TLS handshake happens while they speak instead of after.
+    """
+    global _lastRequest
+    if time.monotonic() - _lastRequest < limits.keepalive_expiry:
+        return
+    _lastRequest = time.monotonic()
+
+    def run():
+        try:
+            client.models.list(timeout=5) # A free call that's only made to open the connection
+        except Exception as e:
+            print(f"API   | Couldn't warm up the connection: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+def reachable(host, port=443):
+    """
+    Says whether a server could be reached when it was last checked, without waiting.
+    A check older than 'connectivityCacheSeconds' is redone in a background thread by
+    opening a TCP connection, so a turn never waits on DNS or a connect timeout.
+    A server that hasn't been checked yet counts as reachable, since a failed call
+    still fails over.
+
+    Args:
+        host (str): The server's host name.
+        port (int): The port to connect to.
+
+    Returns:
+        bool: False if the last check couldn't connect.
+    """
+    now = time.monotonic()
+    with _reachableLock:
+        checkedAt, result = _reachable.get((host, port), (None, True))
+        stale = checkedAt is None or now - checkedAt > connectivityCacheSeconds
+        if stale and (host, port) not in _checking:
+            _checking.add((host, port))
+            threading.Thread(target=_checkReachable, args=(host, port), daemon=True).start()
+    return result
+
+def recheckReachable(host, port=443):
+    """
+    Forgets the last check of a server after a call to it failed, so the next
+    reachable() checks it again.
+
+    Args:
+        host (str): The server's host name.
+        port (int): The port to connect to.
+    """
+    with _reachableLock:
+        if (host, port) in _reachable:
+            _reachable[(host, port)] = (None, _reachable[(host, port)][1])
+
+def _checkReachable(host, port):
+    """
+    Opens and closes a TCP connection to a server and stores whether it worked.
+    """
+    try:
+        socket.create_connection((host, port), timeout=1).close()
+        result = True
+    except OSError:
+        result = False
+        print(f"API   | Can't reach {host}")
+    with _reachableLock:
+        _reachable[(host, port)] = (time.monotonic(), result)
+        _checking.discard((host, port))
+
+events.subscribe(events.LISTENING_STARTED, warmUp)
@@ -0,0 +1,476 @@
+"""
+Offline benchmark for Flick's turn pipeline.
+
+Runs main.respond() (or the asyncio orchestrator's turn) end-to-end against local
+fake HTTP servers that stand in for the OpenAI chat, transcription and speech
+endpoints and for Google Custom Search, using a synthetic recording.
+Reports turn latency percentiles, CPU time and peak RSS, so pipeline regressions
+can be caught without live keys or API credits.
+
+Example:
+    python benchmark.py --turns 20 --latency chat=0.8,speech=0.5 --stream
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Directory holding Flick's modules, so they can be imported from a scratch working directory.
+repoDir = os.path.dirname(os.path.abspath(__file__))
+
+# Settings written to the scratch working directory when no real settings file is used.
+benchmarkSettings = {
+    "name": "Student",
+    "grade": 8,
+    "info": "Benchmark run",
+    "course": "Science",
+    "speed": 1.0,
+    "volumeIncr": 0,
+}
+
+def parseLatency(spec):
+    """
+    Parses per-endpoint latencies such as "chat=0.8,speech=0.5".
+    A bare number applies to every endpoint.
+
+    Args:
+        spec (str): The latency specification.
+
+    Returns:
+        dict: Maps "chat", "transcribe", "speech", "search" and "image" to seconds.
+    """
+    latency = dict.fromkeys(["chat", "transcribe", "speech", "search", "image"], 0.0)
+    for part in filter(None, spec.split(",")):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            latency[key.strip()] = float(value)
+        else:
+            latency = dict.fromkeys(latency, float(part))
+    return latency
+
+def makeResponseText(size, withImage):
+    """
+    Builds a Flick-style response of roughly the given size.
+
+    Args:
+        size (int): Number of characters to generate.
+        withImage (bool): Whether to mention a diagram, which triggers the image search.
+
+    Returns:
+        str: The response text.
+    """
+    paragraph = "Here's the deal.\nA squared plus b squared equals c squared.\nSo c is five!\n\n"
+    text = (paragraph * (size // len(paragraph) + 1))[:size]
+    if withImage:
+        text += "\n\nI also found a diagram for you, go ahead and click the image button!"
+    return text
+
+def makeSpeechPayload(seconds):
+    """
+    Encodes silence as an MP3, like the speech endpoint would return.
+
+    Args:
+        seconds (float): Length of the audio.
+
+    Returns:
+        bytes: The MP3 payload.
+    """
+    from pydub import AudioSegment
+    buffer = io.BytesIO()
+    AudioSegment.silent(duration=int(seconds * 1000), frame_rate=24000).export(buffer, format="mp3")
+    return buffer.getvalue()
+
+def makeImagePayload(size):
+    """
+    Encodes a square test image as a PNG, like a downloaded search result.
+
+    Args:
+        size (int): Width and height in pixels.
+
+    Returns:
+        bytes: The PNG payload.
+    """
+    import pygame
+    surface = pygame.Surface((size, size))
+    surface.fill((109, 230, 254))
+    buffer = io.BytesIO()
+    pygame.image.save(surface, buffer, "image.png")
+    return buffer.getvalue()
+
+def serve(port, options):
+    """
+    Runs the fake API server until the process is terminated.
+
+    Args:
+        port (int): Port to listen on.
+        options (dict): Latencies and payload sizes from the command line.
+    """
+    latency = parseLatency(options["latency"])
+    responseText = makeResponseText(options["responseChars"], options["images"])
+    # Structured requests get the same answer as JSON, with the image decision and query.
+    structuredText = json.dumps({"needsImage": options["images"],
+                                 "imageQuery": "pythagorean theorem diagram" if options["images"] else "",
+                                 "text": responseText})
+    speechPayload = makeSpeechPayload(options["speechSeconds"])
+    pcmPayload = bytes(int(options["speechSeconds"] * 24000) * 2) # Raw 24 kHz 16-bit silence
+    imagePayload = makeImagePayload(options["imageSize"])
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Keep connections alive like the real APIs
+
+        def log_message(self, format, *args):
+            pass # Keep the benchmark output readable
+
+        def reply(self, body, contentType):
+            self.send_response(200)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            path = urllib.parse.urlparse(self.path).path
+            if path.endswith("/chat/completions"):
+                time.sleep(latency["chat"])
+                request = json.loads(body)
+                text = structuredText if "response_format" in request else responseText
+                if request.get("stream"):
+                    self.streamChat(text)
+                elif "search queries" in str(request["messages"][0].get("content")):
+                    # Image query requests get a short query instead of a full answer.
+                    self.reply(json.dumps(chatCompletion("pythagorean theorem diagram")).encode(), "application/json")
+                else:
+                    self.reply(json.dumps(chatCompletion(text)).encode(), "application/json")
+            elif path.endswith("/audio/transcriptions"):
+                time.sleep(latency["transcribe"])
+                self.reply(json.dumps({"text": "What is the Pythagorean theorem?"}).encode(), "application/json")
+            elif path.endswith("/audio/speech"):
+                # An outage stalls the request like a dropped classroom connection.
+                time.sleep(600 if options["ttsOutage"] else latency["speech"])
+                if json.loads(body).get("response_format") == "pcm":
+                    self.reply(pcmPayload, "audio/pcm")
+                else:
+                    self.reply(speechPayload, "audio/mpeg")
+            else:
+                self.send_error(404)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == "/customsearch/v1":
+                time.sleep(latency["search"])
+                num = int(urllib.parse.parse_qs(url.query).get("num", ["10"])[0])
+                items = [{"link": f"http://127.0.0.1:{port}/images/{i}.png"} for i in range(num)]
+                self.reply(json.dumps({"items": items}).encode(), "application/json")
+            elif url.path.startswith("/images/"):
+                time.sleep(latency["image"])
+                self.reply(imagePayload, "image/png")
+            else:
+                self.send_error(404)
+
+        def streamChat(self, text):
+            """
+            Sends the response as server-sent events, a few words per chunk.
+            """
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = text.split(" ")
+            for i in range(0, len(words), 3):
+                piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+                chunk = chatCompletion(piece, chunk=True)
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(options["tokenInterval"])
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+def chatCompletion(content, chunk=False):
+    """
+    Builds a chat completion body in the shape the OpenAI client expects.
+
+    Args:
+        content (str): The reply, or the piece of it for a streamed chunk.
+        chunk (bool): Whether to build a streaming chunk instead of a full completion.
+
+    Returns:
+        dict: The response body.
+    """
+    if chunk:
+        return {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+    return {"id": "bench", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+
+class LocalImagesSearch:
+    """
+    Stand-in for GoogleImagesSearch that talks to the fake Custom Search endpoint
+    over HTTP, with the same search()/results()/download() surface imageScrape uses.
+    """
+
+    class Image:
+        def __init__(self, url):
+            self.url = url
+            self.path = None
+
+        def download(self, path):
+            with urllib.request.urlopen(self.url) as response:
+                data = response.read()
+            self.path = os.path.join(path, os.path.basename(urllib.parse.urlparse(self.url).path))
+            with open(self.path, "wb") as file:
+                file.write(data)
+
+    def __init__(self, baseUrl):
+        self.baseUrl = baseUrl
+        self._results = []
+
+    def search(self, search_params, path_to_dir=None):
+        query = urllib.parse.urlencode({"q": search_params["q"], "num": search_params["num"]})
+        with urllib.request.urlopen(f"{self.baseUrl}/customsearch/v1?{query}") as response:
+            items = json.load(response).get("items", [])
+        self._results = [self.Image(item["link"]) for item in items]
+        if path_to_dir:
+            for image in self._results:
+                image.download(path_to_dir)
+
+    def results(self):
+        return self._results
+
+def makeRecording(seconds, samplerate=44100):
+    """
+    Builds a synthetic recording: a voice-like tone with a little noise.
+
+    Args:
+        seconds (float): Length of the recording.
+        samplerate (int): Samples per second.
+
+    Returns:
+        numpy.ndarray: The audio as float32.
+    """
+    import numpy as np
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    audio = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    audio += 0.01 * np.random.default_rng(0).standard_normal(len(t))
+    return audio.astype(np.float32)
+
+def measureStretch(seconds, speed):
+    """
+    Compares the CPU time of the old speed change, which respawned the pydub segment
+    at a new frame rate and resampled it, with timeStretch's pitch-preserving WSOLA.
+
+    Args:
+        seconds (float): Length of the synthetic speech.
+        speed (float): The speed to apply.
+
+    Returns:
+        dict: CPU milliseconds per second of audio for "spawn" and "wsola", and
+            milliseconds until WSOLA's first block is ready ("wsolaFirstBlock").
+    """
+    import numpy as np
+    from pydub import AudioSegment
+    import timeStretch
+    samples = makeRecording(seconds, timeStretch.rate)
+    sound = AudioSegment((samples * 32767).astype("<i2").tobytes(), frame_rate=timeStretch.rate, sample_width=2, channels=1)
+
+    start = time.process_time()
+    sound._spawn(sound.raw_data, overrides={"frame_rate": int(sound.frame_rate * speed)}).set_frame_rate(sound.frame_rate)
+    spawnSeconds = time.process_time() - start
+
+    start = time.process_time()
+    blocks = timeStretch.stretch(samples, speed)
+    next(blocks)
+    firstBlockSeconds = time.process_time() - start
+    for block in blocks:
+        pass
+    wsolaSeconds = time.process_time() - start
+
+    return {"spawn": 1000 * spawnSeconds / seconds, "wsola": 1000 * wsolaSeconds / seconds,
+            "wsolaFirstBlock": 1000 * firstBlockSeconds}
+
+def runBenchmark(args):
+    """
+    Starts the fake servers, runs the requested number of turns and reports the results.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        dict: The report that was printed and written to --output.
+    """
+    options = {
+        "latency": args.latency,
+        "responseChars": args.response_chars,
+        "images": args.images,
+        "speechSeconds": args.speech_seconds,
+        "imageSize": args.image_size,
+        "tokenInterval": args.token_interval,
+        "ttsOutage": args.tts_outage,
+    }
+    server = multiprocessing.Process(target=serve, args=(args.port, options), daemon=True)
+    server.start()
+    baseUrl = f"http://127.0.0.1:{args.port}"
+
+    # Wait for the fake server to accept connections.
+    for attempt in range(100):
+        try:
+            urllib.request.urlopen(f"{baseUrl}/health")
+        except urllib.error.HTTPError:
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    # Run in a scratch directory so the unit's resources and temp files are untouched.
+    workDir = args.workdir or tempfile.mkdtemp(prefix="flick-bench-")
+    os.makedirs(os.path.join(workDir, "resources", "images"), exist_ok=True)
+    os.makedirs(os.path.join(workDir, "temp"), exist_ok=True)
+    settingsPath = os.path.join(workDir, "resources", "settings.txt")
+    if not os.path.exists(settingsPath):
+        with open(settingsPath, "w") as file:
+            for key, value in benchmarkSettings.items():
+                file.write(f"{key}={value}\n")
+    os.chdir(workDir)
+    sys.path.insert(0, repoDir)
+
+    # Point every OpenAI client at the fake server before Flick's modules create them,
+    # and keep the GUI headless.
+    os.environ["OPENAI_BASE_URL"] = f"{baseUrl}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark") # Used when the modules' keys are left blank
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    import asyncio
+    import eyes, fillers, imageScrape, main, orchestrator, playback, responseCache, speech, speechCache, tracing, turnStages, voiceRecognition
+
+    eyes.pygame.display.init()
+    eyes.pygame.display.set_mode((1, 1)) # Needed to convert downloaded images
+    imageScrape.newSearch = lambda: LocalImagesSearch(baseUrl)
+    main.settings["streamSpeech"] = orchestrator.settings["streamSpeech"] = args.stream
+    if args.encoding:
+        voiceRecognition.uploadEncoding = args.encoding
+    voiceRecognition.sttBackend = args.stt
+    speech.ttsBackend = args.tts
+    if args.tts != "edge":
+        # Edge's voices are a real online service, so they're left out unless asked for.
+        speech.backends = [backend for backend in speech.backends if backend.name != "edge"]
+    responseCache.enabled = args.cache # Off by default, or every turn after the first would be a cache hit
+    speechCache.enabled = args.cache
+    fillers.enabled = args.fillers
+    if args.fillers:
+        fillers.build()
+    main.settings["speculativeImages"] = orchestrator.settings["speculativeImages"] = args.speculative
+    if not args.play:
+        # Decode and adjust the audio as usual but skip the sound card.
+        playback.silent = True
+
+    latencies = []
+    cpuTimes = []
+
+    async def runTurns():
+        """
+        Runs every turn inside one event loop, as orchestrator.run() does. With --async,
+        the async client's connections belong to the loop that opened them, so later
+        turns reuse them instead of reconnecting.
+        """
+        for turn in range(args.warmup + args.turns):
+            recordingSize = voiceRecognition.loadRecording(makeRecording(args.recording_seconds, voiceRecognition.samplerate))
+            cpuStart = time.process_time()
+            start = time.perf_counter()
+            tracing.startTurn()
+            turnStages.armFiller(recordingSize)
+            if args.use_async:
+                await orchestrator.runTurn(False, recordingSize)
+            else:
+                main.respond(recordingSize)
+            if turn >= args.warmup:
+                latencies.append(time.perf_counter() - start)
+                cpuTimes.append(time.process_time() - cpuStart)
+            print(f"BENCH | Turn {turn + 1} took {time.perf_counter() - start:.3f}s")
+
+    asyncio.run(runTurns())
+
+    server.terminate()
+
+    report = {
+        "turns": args.turns,
+        "latency": {
+            "p50": tracing.percentile(latencies, 0.5),
+            "p95": tracing.percentile(latencies, 0.95),
+            "max": max(latencies) if latencies else None,
+        },
+        "cpuSecondsPerTurn": {
+            "p50": tracing.percentile(cpuTimes, 0.5),
+            "p95": tracing.percentile(cpuTimes, 0.95),
+        },
+        "peakRssKb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stages": tracing.summary(),
+        "options": options,
+    }
+    print(f"BENCH | Turn latency p50 {report['latency']['p50']:.3f}s, p95 {report['latency']['p95']:.3f}s")
+    print(f"BENCH | CPU per turn p50 {report['cpuSecondsPerTurn']['p50']:.3f}s, peak RSS {report['peakRssKb'] / 1024:.1f} MB")
+    if args.cache:
+        report["speechCache"] = dict(speechCache.stats, hitRate=speechCache.hitRate())
+        print(f"BENCH | Speech cache hit rate {speechCache.hitRate():.0%}, {speechCache.stats['bytesSaved'] / 1024:.0f} KB not downloaded")
+    if args.fillers:
+        # When the student first hears something each turn: a filler phrase or the answer.
+        firstAudio = [min(s["start"] for s in turn["spans"] if s["name"] in ("filler", "audioStart", "firstSentence"))
+                      for turn in tracing.turnBreakdowns()[args.warmup:]
+                      if any(s["name"] in ("filler", "audioStart", "firstSentence") for s in turn["spans"])]
+        report["firstAudio"] = {"p50": tracing.percentile(firstAudio, 0.5), "p95": tracing.percentile(firstAudio, 0.95)}
+        if firstAudio:
+            print(f"BENCH | First audio p50 {report['firstAudio']['p50']:.3f}s, p95 {report['firstAudio']['p95']:.3f}s after the recording ended")
+    if args.stretch:
+        report["stretchCpuMs"] = measureStretch(args.stretch, args.stretch_speed)
+        print(f"BENCH | Speed {args.stretch_speed}: _spawn resample {report['stretchCpuMs']['spawn']:.1f} ms, "
+              f"WSOLA {report['stretchCpuMs']['wsola']:.1f} ms CPU per audio second, "
+              f"first WSOLA block after {report['stretchCpuMs']['wsolaFirstBlock']:.1f} ms")
+    if args.wake_word:
+        # The spotter runs all the time, so its cost is reported as a share of one core.
+        import wakeWord
+        report["wakeWordCorePercent"] = wakeWord.measureCpu(args.wake_word)
+        print(f"BENCH | Wake word spotter uses {report['wakeWordCorePercent']:.2f}% of one core (budget {wakeWord.cpuBudget}%)")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Flick's turn pipeline against local fake APIs.")
+    parser.add_argument("--turns", type=int, default=10, help="number of measured turns")
+    parser.add_argument("--warmup", type=int, default=1, help="turns to run before measuring")
+    parser.add_argument("--latency", default="0", help='seconds per endpoint, e.g. "chat=0.8,speech=0.5" or "0.2"')
+    parser.add_argument("--response-chars", type=int, default=600, help="length of the fake chat response")
+    parser.add_argument("--images", action="store_true", help="mention a diagram so the image search runs")
+    parser.add_argument("--image-size", type=int, default=512, help="width and height of fake images in pixels")
+    parser.add_argument("--speech-seconds", type=float, default=5.0, help="length of the fake TTS audio")
+    parser.add_argument("--encoding", choices=["flac", "opus", "wav"], help="upload encoding for recordings")
+    parser.add_argument("--stt", choices=["auto", "openai", "local"], default="auto", help="speech-to-text backend to try first")
+    parser.add_argument("--tts", choices=["auto", "openai", "edge", "piper", "espeak"], default="auto", help="text-to-speech backend to try first")
+    parser.add_argument("--tts-outage", action="store_true", help="stall every TTS API request, to measure failover to the on-device voices")
+    parser.add_argument("--recording-seconds", type=float, default=4.0, help="length of the synthetic recording")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="delay between streamed chunks")
+    parser.add_argument("--stream", action="store_true", help="use the streaming response-to-speech mode")
+    parser.add_argument("--speculative", action="store_true", help="prefetch images from the question")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run turns on the asyncio orchestrator")
+    parser.add_argument("--wake-word", type=float, default=0, metavar="SECONDS", help="also measure the wake word spotter's CPU use on this much synthetic audio")
+    parser.add_argument("--stretch", type=float, default=0, metavar="SECONDS", help="also compare the speed change's CPU use on this much synthetic audio")
+    parser.add_argument("--stretch-speed", type=float, default=0.8, help="speed for --stretch")
+    parser.add_argument("--fillers", action="store_true", help="play filler phrases when a turn is slow, and report time to first audio")
+    parser.add_argument("--cache", action="store_true", help="answer repeated questions from the response cache and reuse cached speech")
+    parser.add_argument("--play", action="store_true", help="send audio to the sound card")
+    parser.add_argument("--port", type=int, default=8765, help="port for the fake API server")
+    parser.add_argument("--workdir", help="scratch directory (defaults to a new temp directory)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    runBenchmark(parser.parse_args())
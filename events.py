@@ -0,0 +1,81 @@
+import threading
+
+# Names of the events passed between the GUI and the pipeline thread.
+LISTENING_STARTED = "listeningStarted" # The student started talking to Flick
+LISTENING_STOPPED = "listeningStopped" # The student finished talking to Flick
+SNAP_TAKEN = "snapTaken"               # A camera snap is ready to be sent with the next prompt
+SNAP_CLEARED = "snapCleared"           # The camera snap was retaken or used up
+
+# Every event belongs to a topic. The bus remembers the latest event per topic,
+# so a waiter that arrives late still sees the current state instead of missing it.
+_topics = {
+    LISTENING_STARTED: "listening",
+    LISTENING_STOPPED: "listening",
+    SNAP_TAKEN: "snap",
+    SNAP_CLEARED: "snap",
+}
+
+# Latest event published on each topic, guarded by a condition variable that
+# wakes any thread blocked in waitFor().
+_latest = {"listening": LISTENING_STOPPED, "snap": SNAP_CLEARED}
+_condition = threading.Condition()
+
+# Callbacks registered with subscribe(), keyed by event name.
+_subscribers = {}
+
+def publish(event):
+    """
+    Publishes an event on the bus.
+    Wakes every thread waiting on the event's topic and runs its subscribers
+    on the calling thread.
+
+    Args:
+        event (str): The name of the event to publish, e.g. LISTENING_STARTED.
+    """
+    with _condition:
+        _latest[_topics[event]] = event # Record the new state of the topic
+        _condition.notify_all()         # Wake anything blocked in waitFor()
+
+    # Run callbacks outside the lock so they can publish events themselves.
+    for callback in list(_subscribers.get(event, [])):
+        callback()
+
+def subscribe(event, callback):
+    """
+    Registers a callback that runs every time an event is published.
+
+    Args:
+        event (str): The name of the event to listen for.
+        callback (callable): A function taking no arguments.
+    """
+    _subscribers.setdefault(event, []).append(callback)
+
+def isCurrent(event):
+    """
+    Checks whether an event is the latest one published on its topic.
+
+    Args:
+        event (str): The name of the event to check.
+
+    Returns:
+        bool: True if the event is the current state of its topic, False otherwise.
+    """
+    with _condition:
+        return _latest[_topics[event]] == event
+
+def waitFor(event, timeout=None):
+    """
+    Blocks the calling thread until an event is the latest one on its topic.
+    Returns straight away if it already is. The thread sleeps while it waits,
+    so an idle unit does not burn CPU.
+
+    Args:
+        event (str): The name of the event to wait for.
+        timeout (float): The maximum number of seconds to wait. None waits forever.
+
+    Returns:
+        bool: True if the event is current, False if the timeout ran out first.
+    """
+    topic = _topics[event]
+    with _condition:
+        return _condition.wait_for(lambda: _latest[topic] == event, timeout)
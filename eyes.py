@@ -7,6 +7,7 @@ from glob import glob
 import os
 import subprocess
 import flickTools
+import events
 
 # Load settings using flickTools.
 settings = flickTools.loadSettings()
@@ -23,6 +24,9 @@ snapped = False
 global text
 text = ""
 
+# Global colors, filled in by runGUI().
+colors = {}
+
 def initPygame(width=800, height=480):
     """
     Initializes Pygame, sets up the display, camera, and fonts.
@@ -86,6 +90,34 @@ def setMode(selectedMode):
     global mode
     mode = selectedMode
 
+def setListening(listeningTo):
+    """
+    Publishes a change to the listening state on the event bus so the pipeline
+    thread wakes up. syncListening() then updates the eyes.
+    """
+    events.publish(events.LISTENING_STARTED if listeningTo else events.LISTENING_STOPPED)
+
+def syncListening():
+    """
+    Updates the listening state and eye color from the event bus, so the eyes
+    follow along when something else ends the turn, like voice activity detection.
+    """
+    global listening
+    listening = events.isCurrent(events.LISTENING_STARTED)
+    setColor("eye", (209, 254, 183) if listening else (109, 230, 254)) # Change eye color based on listening state.
+
+def clearSnap():
+    """
+    Resets the snapped flag once the pipeline has used up the camera snap.
+    """
+    global snapped
+    snapped = False
+
+# Keep the camera preview and the eyes in sync with the event bus.
+events.subscribe(events.SNAP_CLEARED, clearSnap)
+events.subscribe(events.LISTENING_STARTED, syncListening)
+events.subscribe(events.LISTENING_STOPPED, syncListening)
+
 def setPage(pageTo):
     """
     Sets the current global page.
@@ -123,6 +155,23 @@ def refreshText():
 
     showImageButton = flickTools.checkImagesExist()
 
+def showResponse(response):
+    """
+    Determines whether to display the full text response or return to the 'eyes' page.
+    """
+    if len(response) > 150:
+        # If the response is long, set it as the text to be displayed.
+        setText(response)
+        # Refresh the text display on the GUI.
+        refreshText()
+        # Set the GUI page to display the text.
+        setPage("text")
+    else:
+        # If the response is short, revert to the 'eyes' display.
+        setPage("eyes")
+        # Reset the eye animation/state.
+        resetEyes()
+
 def refreshImages():
     """
     Reloads images and updates the image button visibility.
@@ -358,8 +407,7 @@ def runGUI():
                     if keyPress == pygame.K_ESCAPE:
                         running = False
                     elif keyPress == pygame.K_SPACE:
-                        listening = not listening
-                        setColor("eye", (209, 254, 183) if listening else (109, 230, 254)) # Change eye color based on listening state.
+                        setListening(not listening) # Toggle listening and wake the pipeline thread.
                         eyeOffset = 0 # Reset eye offset when listening state changes.
                     elif keyPress == pygame.K_1:
                         page = "camera"
@@ -383,8 +431,7 @@ def runGUI():
                         else:
                             showSettingsButton = True # Show settings button on first click.
                     else:
-                        listening = not listening
-                        setColor("eye", (209, 254, 183) if listening else (109, 230, 254))
+                        setListening(not listening)
                         eyeOffset = 0 # Reset eye offset when listening state changes.
 
             screen.fill(colors["bg"]) # Fill background.
@@ -451,7 +498,7 @@ def runGUI():
             # Display snapped image preview if available.
             if snapped:
                 try:
-                    frame = pygame.image.load("temp/image.jpg").convert()
+                    frame = pygame.image.load(flickTools.snapPath).convert()
                     frame = pygame.transform.scale(frame, (160, 120))
                     frame = applyRoundedCorners(frame, radius=15)
                     screen.blit(frame, (20, height - 140))
@@ -478,7 +525,8 @@ def runGUI():
                         snapPulse = 100 # Visual feedback for snap.
                         snapped = not snapped # Toggle snapped state.
                         if snapped:
-                            pygame.image.save(frameSurface, "temp/image.jpg") # Save captured image.
+                            pygame.image.save(frameSurface, flickTools.snapPath) # Save captured image.
+                        events.publish(events.SNAP_TAKEN if snapped else events.SNAP_CLEARED) # Tell the pipeline about the snap.
                     if exitButtonCamera.collidepoint(event.pos):
                         page = "eyes"
                         showSettingsButton = False
@@ -498,7 +546,7 @@ def runGUI():
 
             # Display live camera feed or snapped image.
             if snapped:
-                frame = pygame.image.load("temp/image.jpg").convert()
+                frame = pygame.image.load(flickTools.snapPath).convert()
                 frame = pygame.transform.scale(frame, (560, 420))
             else:
                 ret, frame = cam.read()
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+import numpy as np
+import flickTools
+import playback
+import speech
+import tracing
+
+# Load settings using flickTools. With 'fillers' on, Flick says a short phrase like
+# "Hmm, let me think..." when an answer is still being worked out 'fillerAfterMs'
+# after the question was transcribed, so the unit never sits there silent. Once the
+# answer is ready the phrase is faded out, so it never holds the answer up.
+settings = flickTools.loadSettings()
+enabled = settings.get("fillers", True)
+fillerAfterSeconds = settings.get("fillerAfterMs", 250) / 1000
+
+# The phrases for each kind of wait.
+phrases = {
+    "thinking": ["Hmm, let me think...", "Good question, one sec.", "Okay, let me see...", "Ooh, let me work that out."],
+    "snap": ["Let me take a look at that.", "Ooh, let me check out your picture.", "Okay, looking at your photo..."],
+    "images": ["Looking for some images for you...", "Let me find a good picture of that.", "Grabbing some diagrams..."],
+}
+
+# The synthesized phrases by kind, as 16-bit samples to keep the bank small
+# (a phrase is about 70 KB), the last one played of each kind so it isn't
+# repeated straight away, the timer waiting to play one, and the clips of the
+# phrase playing, so disarm() can end it.
+_bank = {}
+_lastPlayed = {}
+_lock = threading.Lock()
+_timer = None
+_playing = []
+
+def build():
+    """
+    Synthesizes every phrase into the bank. The speech goes through the speech
+    cache, so this only calls the TTS API the first time, or after the voice or
+    speed changes. A phrase that fails is left out.
+    """
+    for kind, texts in phrases.items():
+        clips = []
+        for text in texts:
+            try:
+                samples = speech.synthesize(text)
+            except Exception as e:
+                print(f"FILL  | Couldn't synthesize '{text}': {e}")
+                continue
+            clips.append((np.clip(samples, -1, 1) * 32767).astype(np.int16))
+        with _lock:
+            _bank[kind] = clips
+    size = sum(clip.nbytes for clips in _bank.values() for clip in clips)
+    print(f"FILL  | {sum(len(clips) for clips in _bank.values())} phrases ready, {size / 1024:.0f} KB")
+
+def start():
+    """
+    Fills the bank in a background thread at startup.
+    """
+    if enabled:
+        threading.Thread(target=build, daemon=True).start()
+
+def play(kind):
+    """
+    Plays a phrase of a kind straight away, unless something is already playing or
+    the bank isn't ready.
+
+    Args:
+        kind (str): "thinking", "snap" or "images".
+
+    Returns:
+        bool: True if a phrase was played.
+    """
+    with _lock:
+        return _play(kind)
+
+def _play(kind):
+    """
+    Does the work of play(). Call with the lock held, so disarm() can't miss the phrase.
+    """
+    global _playing
+    clips = _bank.get(kind)
+    if not enabled or not clips or playback.isPlaying():
+        return False
+    choices = [i for i in range(len(clips)) if i != _lastPlayed.get(kind)] or [0]
+    index = random.choice(choices)
+    _lastPlayed[kind] = index
+    _playing = []
+    speech.playSamples(clips[index].astype(np.float32) / 32768, clips=_playing)
+    return True
+
+def arm(kind, delay=None):
+    """
+    Plays a phrase of a kind if disarm() isn't called within the delay. Armed once
+    the recording is encoded (see turnStages.armFiller()), and disarmed if nothing was
+    said, the answer is cached, or once the answer starts playing.
+
+    Args:
+        kind (str): "thinking", "snap" or "images".
+        delay (float): Seconds to wait. Defaults to 'fillerAfterMs'.
+    """
+    global _timer
+    if not enabled:
+        return
+    delay = fillerAfterSeconds if delay is None else delay
+    armed = time.perf_counter()
+
+    def fire():
+        with _lock:
+            # disarm() may have run between the timer going off and taking the lock.
+            played = threading.current_thread() is _timer and _play(kind)
+        if played:
+            tracing.mark("filler", kind=kind, delay=time.perf_counter() - armed)
+            print(f"FILL  | Played a {kind} phrase after {time.perf_counter() - armed:.2f}s")
+
+    disarm()
+    with _lock:
+        _timer = threading.Timer(delay, fire)
+        _timer.daemon = True
+        _timer.start()
+
+def disarm():
+    """
+    Cancels the phrase waiting to be played, and fades out one that's already
+    playing, so the answer can start straight away.
+    """
+    global _timer, _playing
+    with _lock:
+        if _timer:
+            _timer.cancel()
+            _timer = None
+        playing, _playing = _playing, []
+    if playing and playback.fadeOut(playing):
+        print("FILL  | Cut the phrase short for the answer")
+
+if __name__ == "__main__":
+    # Run at install time to synthesize the phrases into the speech cache.
+    build()
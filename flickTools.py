@@ -1,4 +1,10 @@
-import textwrap, os
+import textwrap, os, re
+
+# Where the camera page saves a snap until it's sent with the next prompt.
+snapPath = "temp/image.jpg"
+
+# Matches the end of a sentence: closing punctuation followed by whitespace, or a line break.
+_sentenceEnd = re.compile(r"[.!?]+(?=\s)|(?=\n)")
 
 def blendColors(color1, color2, weight):
     """
@@ -72,6 +78,47 @@ def cutFirstSections(text):
     # Join the first two paragraphs (or fewer if less than two exist) with double newlines.
     return "\n\n".join(paragraphs[:2])
 
+def chunkSentences(pieces, maxParagraphs=None):
+    """
+    Groups streamed pieces of text into complete sentences or lines as soon as
+    each one is finished. The whole stream is always consumed, even after the
+    paragraph limit has been reached.
+
+    Args:
+        pieces (iterable): Pieces of text in the order they were generated.
+        maxParagraphs (int): Stop yielding after this many paragraphs, like
+                             cutFirstSections(). None yields everything.
+
+    Yields:
+        str: The next complete sentence or line.
+    """
+    buffer = ""     # Text received but not yet yielded
+    paragraphs = 0  # Number of paragraph breaks passed so far
+
+    for piece in pieces:
+        buffer += piece
+        while True:
+            stripped = buffer.lstrip()
+            if not stripped:
+                break # Only whitespace so far, wait for more text to count the line breaks
+
+            # A blank line between sentences starts a new paragraph.
+            if buffer[:len(buffer) - len(stripped)].count("\n") >= 2:
+                paragraphs += 1
+            buffer = stripped
+
+            match = _sentenceEnd.search(buffer)
+            if not match:
+                break # The current sentence isn't finished yet
+
+            sentence, buffer = buffer[:match.end()].strip(), buffer[match.end():]
+            if maxParagraphs is None or paragraphs < maxParagraphs:
+                yield sentence
+
+    # Flush whatever is left once the stream ends.
+    if buffer.strip() and (maxParagraphs is None or paragraphs < maxParagraphs):
+        yield buffer.strip()
+
 def checkImagesExist():
     """
     Checks if there are any image files present in the 'resources/images' directory.
@@ -84,11 +131,11 @@ def checkImagesExist():
 
 def deleteSnap():
     """
-    Deletes the 'image.jpg' file if it exists.
+    Deletes the snapped image if it exists.
     Prints a message upon successful deletion. Silently handles FileNotFoundError.
     """
     try:
-        os.remove("image.jpg")  # Attempt to remove the file
+        os.remove(snapPath)  # Attempt to remove the file
         print("TOOLS | Camera snap deleted")  # Confirm deletion
     except FileNotFoundError:
         pass  # Do nothing if the file does not exist
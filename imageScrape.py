@@ -1,9 +1,19 @@
 from google_images_search import GoogleImagesSearch
-import os, time
+import os
+import shutil
+import tempfile
 import flickTools
 
-# Initialize the Google Images Search client with API key and Project CX.
-gis = GoogleImagesSearch('', '')
+def newSearch():
+    """
+    Initializes a Google Images Search client with API key and Project CX.
+    Each search gets its own client, since a client keeps the results of its last
+    search and the speculative prefetch can run alongside the main search.
+
+    Returns:
+        GoogleImagesSearch: A new client.
+    """
+    return GoogleImagesSearch('', '')
 
 def clearImages(folderPath='resources/images'):
     """
@@ -25,16 +35,49 @@ def clearImages(folderPath='resources/images'):
         if os.path.isfile(filePath):
             os.remove(filePath) # Delete the file
 
-def getImage(query, num, folderPath='resources/images'):
+def promoteImages(fromFolder, toFolder='resources/images'):
+    """
+    Moves prefetched images into the folder the image viewer shows. Only finished
+    downloads are in the folder (see getImage()), so a half-written image is never shown.
+
+    Args:
+        fromFolder (str): The folder the images were prefetched into.
+        toFolder (str): The folder to move them to.
+
+    Returns:
+        int: The number of images moved.
+    """
+    if not os.path.isdir(fromFolder):
+        return 0
+    moved = 0
+    for filename in os.listdir(fromFolder):
+        if not os.path.isfile(os.path.join(fromFolder, filename)):
+            continue
+        shutil.move(os.path.join(fromFolder, filename), os.path.join(toFolder, filename))
+        moved += 1
+    return moved
+
+def discardImages(folderPath):
+    """
+    Deletes a folder of prefetched images that turned out not to be needed.
+
+    Args:
+        folderPath (str): The folder to delete.
+    """
+    shutil.rmtree(folderPath, ignore_errors=True)
+
+def getImage(query, num, folderPath='resources/images', onImage=None, cancelled=None):
     """
     Searches for images on Google Images and downloads a specified number of them
-    to a local folder. Includes a delay to account for download time and
-    checks if images were successfully downloaded.
+    to a local folder, one at a time, so each image can be shown as soon as it lands.
+    Checks if images were successfully downloaded.
 
     Args:
         query (str): The search query for images.
         num (int): The number of images to download.
         folderPath (str): The directory where images will be saved.
+        onImage (callable): Optional function called after each image is downloaded.
+        cancelled (threading.Event): Optional event that stops further downloads once set.
     """
     # Define search parameters for the Google Images Search API
     searchParams = {
@@ -43,18 +86,38 @@ def getImage(query, num, folderPath='resources/images'):
         'safe': 'active'    # Activates safe search to filter explicit content
     }
 
-    # Execute the image search and download images to the specified directory
-    gis.search(search_params=searchParams, path_to_dir=folderPath)
+    # Execute the image search without downloading, so the downloads can be reported one by one
+    gis = newSearch()
+    gis.search(search_params=searchParams)
 
     print("SCRAPE| Started image download")
 
-    # Introduce a delay to allow time for images to download.
-    # The delay is proportional to the number of images requested.
-    time.sleep(num * 0.5)
+    # Each image is downloaded into a scratch folder next to the destination and renamed
+    # into place once it's complete, so the viewer and promoteImages() never see a partial file.
+    os.makedirs(folderPath, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".downloading-", dir=os.path.dirname(os.path.abspath(folderPath)))
+    try:
+        # Download each result as soon as the search returns. The downloads are synchronous,
+        # so no fixed delay is needed to wait for them.
+        for image in gis.results():
+            if cancelled and cancelled.is_set():
+                print("SCRAPE| Download cancelled")
+                return
+            try:
+                image.download(staging)
+            except Exception as e:
+                print(f"SCRAPE| Skipped image: {e}")
+                continue
+            for filename in os.listdir(staging):
+                os.replace(os.path.join(staging, filename), os.path.join(folderPath, filename))
+            if onImage:
+                onImage()
+    finally:
+        discardImages(staging)
 
     # Check if any images were actually downloaded using a function from flickTools.
     # This might indicate if the Google Search JSON API limit has been reached.
     if not flickTools.checkImagesExist():
         print("SCRAPE| GS JSON API drained")
 
-    print("SCRAPE| Lifted blocker") # Indicates that the blocking operation (download + delay) is complete
+    print("SCRAPE| Lifted blocker") # Indicates that the blocking operation (download) is complete
@@ -1,6 +1,14 @@
-import eyes, flickTools, imageScrape, prompt, voiceRecognition, speech
+import eyes, events, fillers, flickTools, imageScrape, orchestrator, playback, voiceRecognition, tracing, turnStages, wakeWord
+import asyncio
 import threading
 
+# Load settings using flickTools. 'streamSpeech' turns on the streaming response-to-speech mode
+# and 'asyncPipeline' runs turns on the asyncio orchestrator instead of main().
+# 'speculativeImages' prefetches images from the question while the answer is generated;
+# it spends an extra Custom Search query on turns that end up not needing images.
+# 'wakeWord' starts a turn when the student says "Hey Flick" (see wakeWord.py).
+settings = flickTools.loadSettings()
+
 def main():
     """
     The main function that orchestrates the interaction loop of the AI assistant.
@@ -8,106 +16,90 @@ def main():
     finding and displaying images, and playing back speech.
     """
     while True: # Main loop for continuous interaction
-        # Wait until the 'eyes' module indicates it's listening for voice input.
-        while not eyes.listening: 
-            pass
-        
+        # Sleep until the 'eyes' module publishes that it's listening for voice input.
+        events.waitFor(events.LISTENING_STARTED)
+
         # Start recording user's voice input.
         voiceRecognition.startRecording()
         
-        # Wait while the 'eyes' module indicates it's still listening.
-        while eyes.listening: 
-            pass
-        
-        # Stop recording once listening mode is off.
-        voiceRecognition.endRecording()
-
-        # Update the status displayed on the 'eyes' (GUI) to "Thinking...".
-        eyes.setStatus("Thinking...")
-        # Set the GUI page to display the status.
-        eyes.setPage("status")
-
-        # Transcribe the recorded voice input into text.
-        userPrompt = voiceRecognition.transcribe()
-
-        # Update the status to indicate the AI is processing the response.
-        eyes.setStatus("Figuring out what to say...")
-
-        # Determine whether to include an image in the prompt based on a 'snapped' flag.
-        if eyes.snapped:
-            # If an image was snapped, prompt the AI with both text and the image.
-            response = prompt.promptImage(userPrompt)
-            # Delete the snapped image after it's been used.
-            flickTools.deleteSnap()
-            # Reset the snapped flag.
-            eyes.snapped = False
-        else: 
-            # If no image was snapped, prompt the AI with text only.
-            response = prompt.prompt(userPrompt)
-        
-        # Generate an audio file of the AI's response.
-        # It cuts down the response to its first sections for speech generation.
-        speech.generateFile(flickTools.cutFirstSections(response))
-
-        # Print the character count of the AI's response for debugging/monitoring.
-        print(f"FLICK | Characters in response: {len(response)}")
-
-        # Clear any existing images in the 'resources/images' directory.
-        print("MAIN  | Cleared images")
-        imageScrape.clearImages()
-
-        # Check if the AI's response suggests that an image or diagram would be helpful.
-        if "image" in response or "diagram" in response:
-            # Update status to indicate image search is in progress.
-            eyes.setStatus("Finding images...")
-            
-            def download():
-                """
-                Helper function to handle image downloading in a separate thread.
-                Encapsulates the image search and download logic.
-                """
-                try:
-                    # Generate an image search query based on the AI's response.
-                    query = prompt.generateImageQuery(response)
-                    # Download 10 images based on the generated query.
-                    imageScrape.getImage(query, 10)
-                except Exception as e:
-                    # Log any errors encountered during image download.
-                    print(f"IMG   | Download thread error: {e}")
-
-            # Create and start a new thread for downloading images to avoid blocking the main thread.
-            imgThread = threading.Thread(target=download)
-            imgThread.start()
-            # Wait for the image download thread to complete before proceeding.
-            imgThread.join()
-       
-            # Refresh the images displayed on the GUI.
-            eyes.refreshImages()
-
-        # Determine whether to display the full text response or return to the 'eyes' page.
-        if len(response) > 150:
-            # If the response is long, set it as the text to be displayed.
-            eyes.setText(response)
-            # Refresh the text display on the GUI.
-            eyes.refreshText()
-            # Set the GUI page to display the text.
-            eyes.setPage("text")
-        else:
-            # If the response is short, revert to the 'eyes' display.
-            eyes.setPage("eyes")
-            # Reset the eye animation/state.
-            eyes.resetEyes()
-
-        # Play the generated speech of the AI's response.
-        speech.playSpeech()
-
-# Clear images at the start of the application.
-imageScrape.clearImages()
-
-# Create and start a separate thread for the main interaction loop.
-# This allows the GUI (if run separately) to remain responsive.
-mainThread = threading.Thread(target=main)
-mainThread.start()
-
-# Run the GUI. This call is typically blocking and keeps the application window open.
-eyes.runGUI()
\ No newline at end of file
+        # Sleep until the 'eyes' module publishes that listening has stopped.
+        events.waitFor(events.LISTENING_STOPPED)
+
+        # Start a new turn in the latency trace. It counts from when the student
+        # stopped talking, so how long they spoke isn't part of Flick's latency.
+        tracing.startTurn()
+
+        with tracing.span("endRecording") as trace:
+            # Stop recording once listening mode is off.
+            # It's encoded in memory, ready to upload.
+            recordingSize = voiceRecognition.endRecording() or 0
+            trace["recordingSize"] = recordingSize
+        turnStages.armFiller(recordingSize)
+
+        # Handle everything after recording for this turn.
+        respond(recordingSize)
+
+def respond(recordingSize=0):
+    """
+    Runs the rest of a turn once the recording is encoded: transcribing it,
+    generating the response, finding images and playing back speech.
+    Kept separate from main() so the turn can be run without the GUI loop,
+    e.g. by benchmark.py. The stages are shared with the asyncio orchestrator
+    (see turnStages.py).
+
+    Args:
+        recordingSize (int): Size of the encoded recording in bytes, for the trace.
+    """
+    try:
+        turnStages.begin()
+
+        userPrompt = turnStages.transcribe(recordingSize)
+        # A recording with no speech in it ends the turn before any API call.
+        if not userPrompt.strip():
+            turnStages.skip()
+            return
+
+        # Determine whether to include an image in the prompt based on the latest snap event.
+        withImage = events.isCurrent(events.SNAP_TAKEN)
+        decision, streaming, speculation = turnStages.answer(userPrompt, withImage,
+            settings.get("streamSpeech", False), settings.get("speculativeImages", False))
+
+        # Run speech synthesis, image search and text layout side by side,
+        # and wait for every stage to finish before listening for the next turn.
+        futures = turnStages.runGraph(decision["text"], streaming, speculation, decision)
+        turnStages.finish(futures, streaming)
+    except Exception as e:
+        # A failed stage, e.g. no transcription backend or the API being down, ends
+        # the turn and returns to the eyes page, so the loop keeps listening.
+        print(f"MAIN  | Turn failed: {e}")
+        turnStages.cancel()
+        eyes.setPage("eyes")
+        eyes.resetEyes()
+    finally:
+        # Print this turn's breakdown and update the trace file.
+        tracing.endTurn()
+
+if __name__ == "__main__":
+    # Clear images at the start of the application.
+    imageScrape.clearImages()
+
+    # Open the audio output now, so the first answer starts playing straight away,
+    # and get the filler phrases ready.
+    playback.start()
+    fillers.start()
+
+    # Create and start a separate thread for the main interaction loop.
+    # This allows the GUI (if run separately) to remain responsive.
+    # The 'asyncPipeline' setting swaps in the asyncio orchestrator, which can cancel stalled turns.
+    if settings.get("asyncPipeline", False):
+        mainThread = threading.Thread(target=lambda: asyncio.run(orchestrator.run()))
+    else:
+        mainThread = threading.Thread(target=main)
+    mainThread.start()
+
+    # Listen for "Hey Flick" alongside the touch screen and space bar.
+    if settings.get("wakeWord", False):
+        wakeWord.start()
+
+    # Run the GUI. This call is typically blocking and keeps the application window open.
+    eyes.runGUI()
@@ -0,0 +1,136 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import events, eyes, flickTools, tracing, turnStages, voiceRecognition
+
+# Load settings using flickTools. A deadline can be overridden per stage with
+# a '<stage>Deadline' setting, e.g. promptDeadline=20. 'streamSpeech' and
+# 'speculativeImages' work the same as in main.respond().
+settings = flickTools.loadSettings()
+
+# Default number of seconds each stage of a turn may take before it is abandoned.
+defaultDeadlines = {
+    "transcribe": 20,
+    "prompt": 30,
+    "speech": 30,
+    "playback": 180,
+}
+
+# Blocking stages run in '_stagePool'. Waiting for the GUI and encoding the recording
+# have a thread of their own, so a stalled stage can't take it.
+_stagePool = ThreadPoolExecutor(max_workers=4)
+_listenerPool = ThreadPoolExecutor(max_workers=1)
+
+def deadline(stageName):
+    """
+    Looks up how long a stage may take.
+
+    Args:
+        stageName (str): The name of the stage, e.g. "prompt".
+
+    Returns:
+        float: The deadline in seconds.
+    """
+    return settings.get(f"{stageName}Deadline", defaultDeadlines[stageName])
+
+async def stage(stageName, work, *args):
+    """
+    Runs one of the shared turn stages (see turnStages.py) under its deadline. The
+    stage traces itself, like it does in main.respond().
+
+    Args:
+        stageName (str): The name of the stage, used for the deadline and logging.
+        work: A coroutine on the async clients, which is cancelled at the deadline,
+            aborting its request; or a blocking function, run in a worker thread.
+        *args: The function's arguments.
+
+    Returns:
+        The stage's result.
+
+    Raises:
+        asyncio.TimeoutError: If the stage takes longer than its deadline.
+    """
+    if asyncio.iscoroutine(work):
+        pending = work
+    else:
+        pending = asyncio.get_running_loop().run_in_executor(_stagePool, lambda: work(*args))
+    try:
+        return await asyncio.wait_for(pending, deadline(stageName))
+    except asyncio.TimeoutError:
+        print(f"ASYNC | Stage '{stageName}' timed out after {deadline(stageName)}s")
+        raise
+
+async def runTurn(withImage, recordingSize=0):
+    """
+    Runs everything after recording for one turn: transcription, the response,
+    speech, images and playback. Cancelling the task, or a stage missing its
+    deadline, aborts the API call in flight and stops what's left of the turn.
+
+    Args:
+        withImage (bool): Whether to send the snapped image along with the text.
+        recordingSize (int): Size of the encoded recording in bytes, for the trace.
+    """
+    try:
+        turnStages.begin()
+
+        userPrompt = await stage("transcribe", turnStages.transcribeAsync(recordingSize))
+        if not userPrompt.strip():
+            # A recording with no speech in it ends the turn before any API call.
+            turnStages.skip()
+            return
+
+        decision, streaming, speculation = await stage("prompt", turnStages.answerAsync(userPrompt, withImage,
+            settings.get("streamSpeech", False), settings.get("speculativeImages", False)))
+
+        # Image search and text layout run side by side in the turn graph, as in
+        # main.respond(), while the speech is made here on the async client.
+        futures = turnStages.runGraph(decision["text"], streaming, speculation, decision, speak=False)
+        if not streaming:
+            path = await stage("speech", turnStages.generateSpeechAsync(decision["text"]))
+            await asyncio.wrap_future(futures["showResponse"]) # Play once the right page is showing
+            await stage("playback", turnStages.playSpeech, path)
+            turnStages.imagesFiller(futures)
+        await stage("playback", turnStages.finish, futures, streaming)
+    except asyncio.CancelledError:
+        print("ASYNC | Turn cancelled")
+        turnStages.cancel() # Stop the audio, streamed sentences and downloads still running in threads
+        raise
+    except Exception as e:
+        # A failed or timed-out stage ends the turn and returns to the eyes page.
+        print(f"ASYNC | Turn failed: {e}")
+        turnStages.cancel()
+        eyes.setPage("eyes")
+        eyes.resetEyes()
+    finally:
+        # Print this turn's breakdown and update the trace file.
+        tracing.endTurn()
+
+async def run():
+    """
+    The asyncio version of main.main(). Each turn runs as a task, so starting a
+    new recording cancels whatever is left of the previous turn instead of
+    waiting behind it.
+    """
+    loop = asyncio.get_running_loop()
+    turn = None
+    while True:
+        # Wait for the GUI's listening events on a thread of their own, so stages
+        # stuck in the stage pool can never hold up the next recording.
+        await loop.run_in_executor(_listenerPool, events.waitFor, events.LISTENING_STARTED)
+        # apiClients.warmUp() is subscribed to the same event, so the API connection
+        # is reopened while the student talks here too.
+
+        if turn and not turn.done():
+            turn.cancel()
+            await asyncio.gather(turn, return_exceptions=True)
+
+        voiceRecognition.startRecording()
+        await loop.run_in_executor(_listenerPool, events.waitFor, events.LISTENING_STOPPED)
+
+        # The turn's latency counts from when the student stopped talking, as in main.main().
+        tracing.startTurn()
+        with tracing.span("endRecording") as trace:
+            recordingSize = await loop.run_in_executor(_listenerPool, voiceRecognition.endRecording) or 0
+            trace["recordingSize"] = recordingSize
+        turnStages.armFiller(recordingSize)
+
+        turn = asyncio.create_task(runTurn(events.isCurrent(events.SNAP_TAKEN), recordingSize))
@@ -0,0 +1,218 @@
+import collections
+import threading
+import time
+import numpy as np
+import sounddevice as sd
+import flickTools
+
+# Load settings using flickTools. Speech is played through one output stream that's
+# opened once and kept open between turns, so starting a clip only means handing its
+# samples to the sound card's callback: no decoding, no extra process and no device
+# setup on the way to the first sample. 'playbackBlockMs' is how much audio the
+# callback fills at a time; smaller blocks start sooner but wake the CPU more often.
+settings = flickTools.loadSettings()
+rate = 24000 # OpenAI's raw PCM speech is 24 kHz mono
+blockFrames = int(rate * settings.get("playbackBlockMs", 20) / 1000)
+
+# With 'silent' on, clips finish as soon as they're queued instead of going to the
+# sound card, e.g. for benchmark.py on a machine with no speakers.
+silent = False
+
+class Clip:
+    """
+    A piece of audio queued for playback, returned by play() so the caller can wait for it.
+    """
+    def __init__(self, samples):
+        """
+        Args:
+            samples (numpy.ndarray): Mono float32 samples at 'rate'.
+        """
+        self.samples = samples
+        self.position = 0                # Samples handed to the sound card so far
+        self.queued = time.perf_counter()
+        self.startDelay = None           # Seconds from play() until the first sample is heard
+        self.started = threading.Event()
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the clip has finished playing or was stopped.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            bool: True if the clip is done, False if the timeout ran out first.
+        """
+        return self.done.wait(timeout)
+
+# Clips waiting to be played, the first one playing, and the state shared with the
+# callback, which runs on the audio thread.
+_lock = threading.Lock()
+_clips = collections.deque()
+_paused = False
+_idle = threading.Event()
+_idle.set()
+_stream = None
+
+def start():
+    """
+    Opens the output stream if it isn't open yet. Called at startup, so the first
+    turn doesn't wait for the device to open.
+    """
+    global _stream
+    with _lock:
+        if _stream is not None or silent:
+            return
+        _stream = sd.OutputStream(samplerate=rate, channels=1, dtype="float32",
+                                  blocksize=blockFrames, latency="low", callback=_callback)
+    _stream.start()
+    print(f"PLAY  | Output stream open, {blockFrames} frame blocks at {rate} Hz")
+
+def _callback(outdata, frames, timeInfo, status):
+    """
+    Fills the sound card's next block from the queued clips, back to back, with
+    silence when there's nothing to play or playback is paused. Runs on the audio
+    thread, so it only copies samples.
+    """
+    out = outdata[:, 0]
+    filled = 0
+    with _lock:
+        while not _paused and filled < frames and _clips:
+            clip = _clips[0]
+            if clip.position == 0:
+                # How long until this block reaches the speaker, on top of the time spent queued.
+                latency = max(0.0, timeInfo.outputBufferDacTime - timeInfo.currentTime)
+                clip.startDelay = time.perf_counter() - clip.queued + latency
+                clip.started.set()
+            count = min(frames - filled, len(clip.samples) - clip.position)
+            out[filled:filled + count] = clip.samples[clip.position:clip.position + count]
+            clip.position += count
+            filled += count
+            if clip.position >= len(clip.samples):
+                _clips.popleft()
+                clip.done.set()
+        if not _clips:
+            _idle.set()
+    out[filled:] = 0
+
+def play(samples):
+    """
+    Queues audio to play after whatever is already queued, without waiting for it.
+
+    Args:
+        samples (numpy.ndarray): Mono float32 samples at 'rate'.
+
+    Returns:
+        Clip: The queued clip, to wait for or check on.
+    """
+    clip = Clip(samples)
+    if silent or len(samples) == 0:
+        clip.startDelay = 0.0
+        clip.started.set()
+        clip.done.set()
+        return clip
+    start()
+    with _lock:
+        _clips.append(clip)
+        _idle.clear()
+    return clip
+
+def stop():
+    """
+    Stops playback straight away and drops everything queued. Also ends a pause.
+    """
+    global _paused
+    with _lock:
+        _paused = False
+        stopped = list(_clips)
+        _clips.clear()
+        _idle.set()
+    for clip in stopped:
+        clip.started.set()
+        clip.done.set()
+    if stopped:
+        print(f"PLAY  | Stopped, dropped {len(stopped)} clips")
+
+def fadeOut(clips, seconds=0.03):
+    """
+    Ends some clips early and leaves the rest of the queue alone. Clips that haven't
+    started are dropped, and one that's playing fades out over 'seconds' rather than
+    cutting off with a click.
+
+    Args:
+        clips (list): The clips to end, as returned by play().
+        seconds (float): How long the fade takes.
+
+    Returns:
+        bool: True if any of the clips was still queued or playing.
+    """
+    ended = []
+    found = False
+    with _lock:
+        for clip in clips:
+            if not any(queued is clip for queued in _clips):
+                continue
+            found = True
+            if clip.position > 0:
+                # Keep what's been played, plus a short fade from where it is.
+                end = min(len(clip.samples), clip.position + int(seconds * rate))
+                samples = clip.samples[:end].copy()
+                samples[clip.position:] *= np.linspace(1, 0, end - clip.position, dtype=np.float32)
+                clip.samples = samples
+            else:
+                _clips.remove(clip)
+                ended.append(clip)
+        if not _clips:
+            _idle.set()
+    for clip in ended:
+        clip.started.set()
+        clip.done.set()
+    return found
+
+def pause():
+    """
+    Pauses playback where it is. The stream stays open, playing silence.
+    """
+    global _paused
+    with _lock:
+        _paused = True
+
+def resume():
+    """
+    Carries on playing after pause().
+    """
+    global _paused
+    with _lock:
+        _paused = False
+
+def isPlaying():
+    """
+    Checks whether anything is playing or queued.
+
+    Returns:
+        bool: True if there is audio left to play.
+    """
+    return not _idle.is_set()
+
+def queuedSeconds():
+    """
+    Works out how much audio is left to play.
+
+    Returns:
+        float: Seconds of audio queued, including what's left of the clip playing.
+    """
+    with _lock:
+        return sum(len(clip.samples) - clip.position for clip in _clips) / rate
+
+def wait(timeout=None):
+    """
+    Blocks until everything queued has been played or stopped.
+
+    Args:
+        timeout (float): The maximum number of seconds to wait. None waits forever.
+
+    Returns:
+        bool: True if playback is finished, False if the timeout ran out first.
+    """
+    return _idle.wait(timeout)
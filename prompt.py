@@ -1,15 +1,24 @@
-from openai import OpenAI
 import base64
+import collections
+import json
+import re
+import threading
+import time
+import apiClients
 import flickTools
+import sessionStore
+import snapProcessing
+import tracing
 
 # Load settings using a function from flickTools.
 # These settings likely contain user-specific information (name, grade, etc.).
 settings = flickTools.loadSettings()
 
-# Initialize the OpenAI client with the provided API key.
-client = OpenAI(
-    api_key=""
-)
+# The shared OpenAI clients, with pooled connections, timeouts and retries.
+client = apiClients.client
+
+# Async client used by the asyncio orchestrator, so cancelling a turn aborts its call.
+asyncClient = apiClients.asyncClient
 
 # Define the system message that sets the persona and guidelines for the AI assistant (Flick).
 # This message instructs the AI on its tone, formatting, and how to interact with users,
@@ -115,9 +124,528 @@ querySystemMessage = {
     )
 }
 
+# System message for folding old turns into the running digest of the conversation.
+digestSystemMessage = {
+    "role": "system",
+    "content": (
+        "You keep notes on a tutoring session between a student and Flick, their homework helper. "
+        "Merge the earlier notes and the new exchanges into one short summary of at most 120 words: "
+        "the topics covered, what the student struggled with or understood, and any facts about the "
+        "student worth remembering. Plain text only."
+    )
+}
+
+# A much shorter persona for small talk like "hi Flick" or "thanks!", which is sent
+# with only the last exchange instead of the whole history, and a short reply limit.
+quickSystemMessage = {
+    "role": "system",
+    "content": (
+        f"You're Flick, a fun and chill homework helper talking with {settings['name']}, a grade {settings['grade']} student. "
+        "This is small talk: reply in one or two short, friendly sentences of plain text, with no emojis or symbols. "
+        "If they seem ready to work, invite them to ask their homework question."
+    )
+}
+
+# Routing. With 'routing' on, each text turn is classified locally: small talk takes
+# the quick path and everything else the full one. Snaps always take the full path.
+# 'quickMaxWords' is the longest transcript that can count as small talk.
+routing = settings.get("routing", True)
+quickMaxWords = settings.get("quickMaxWords", 8)
+quickMaxTokens = 80
+# A turn is small talk only if it's nothing but these phrases, so "cool, tell me about
+# volcanoes" or "thanks, is seven a prime" still goes to the full tutor.
+smallTalk = re.compile(
+    r"^(?:(?:hi|hello|hey|yo|sup|hiya|howdy|good (?:morning|afternoon|evening|night)|thanks|thank you|thx|"
+    r"ok(?:ay)?|cool|nice|awesome|great|sweet|got it|i see|makes sense|bye|goodbye|see you|later|"
+    r"how are you(?: doing)?|how's it going|what's up|you're (?:awesome|the best|funny|cool)|nevermind|never mind|"
+    r"flick|so|so much|a lot|too|again|now)\b\W*)+$"
+)
+
+# Structured responses. With 'structuredResponse' on, a full turn asks for a JSON
+# reply that carries the answer together with whether images would help and what to
+# search for, so an image turn takes one completion instead of two. The spoken part
+# is still the first paragraphs of the answer, so the reply isn't written twice.
+structured = settings.get("structuredResponse", True)
+structuredSystemMessage = {
+    "role": "system",
+    "content": (
+        "Reply with a JSON object with these fields, in this order: "
+        "needsImage, true only if a diagram, chart or picture would really help the student understand, "
+        "and false for small talk, quick facts and simple answers; "
+        "imageQuery, a short Google Images search query for that diagram when needsImage is true, "
+        "otherwise an empty string; "
+        "text, your reply to the student, written exactly as described above. "
+        "Only say you found images when needsImage is true."
+    )
+}
+responseFormat = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "flickResponse",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "needsImage": {"type": "boolean"},
+                "imageQuery": {"type": "string"},
+                "text": {"type": "string"},
+            },
+            "required": ["needsImage", "imageQuery", "text"],
+            "additionalProperties": False,
+        },
+    },
+}
+# Where the text field starts in a streamed reply, and the pieces of a JSON string
+# that can be decoded on their own. A surrogate pair is only decoded once both halves are in.
+textFieldStart = re.compile(r'"text"\s*:\s*"')
+jsonStringPiece = re.compile(
+    r'[^"\\]+|\\u[dD][89abAB][0-9a-fA-F]{2}\\u[0-9a-fA-F]{4}|\\u(?![dD][89abAB])[0-9a-fA-F]{4}|\\["\\/bfnrt]'
+)
+
+# Recent latencies of each route, for logging what the quick path saves.
+_routeLatencies = {"quick": collections.deque(maxlen=50), "full": collections.deque(maxlen=50)}
+
 # Initialize the conversation messages with the system message.
-# This list will keep track of the conversation history.
+# This list will keep track of the conversation history. It is kept within
+# 'historyTokenBudget' tokens (roughly, not counting the system message): once it
+# grows past that, the oldest turns are folded into a digest message right after
+# the system message, so every request stays about the same size however long the
+# session runs. Snapped images are replaced by a short placeholder once they're
+# older than 'imageTurnsKept' turns.
+# With the session store on, the conversation carries on across restarts: the saved
+# digest and the turns it doesn't cover yet are loaded back in after the system message.
 messages = [systemMessage]
+historyTokenBudget = settings.get("historyTokenBudget", 2000)
+imageTurnsKept = settings.get("imageTurnsKept", 0)
+imagePlaceholder = "[The student sent a photo of their work here. It has been answered and isn't kept.]"
+
+# The digest message, once there is one, and locks for changing the history and
+# for running one compaction at a time.
+digestMessage = None
+_historyLock = threading.Lock()
+_compacting = threading.Lock()
+
+# Load the saved session, and count how many of its messages the digest already covers.
+_resumed = sessionStore.resume()
+_folded = _resumed["folded"]
+if _resumed["digest"]:
+    digestMessage = {"role": "system", "content": _resumed["digest"]}
+    messages.append(digestMessage)
+messages.extend(_resumed["messages"])
+
+def estimateTokens(message):
+    """
+    Roughly estimates how many tokens a message costs, at about four characters a token.
+    Images are counted at the vision model's cost rather than their base64 length.
+
+    Args:
+        message (dict): A chat message.
+
+    Returns:
+        int: The estimated token count.
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        return 4 + len(content) // 4
+    tokens = 4
+    for part in content:
+        if part["type"] == "text":
+            tokens += len(part["text"]) // 4
+        else:
+            tokens += 85 if part["image_url"].get("detail") == "low" else 765
+    return tokens
+
+def messageText(message):
+    """
+    Gets the text of a message, with a placeholder where a snapped image was.
+
+    Args:
+        message (dict): A chat message.
+
+    Returns:
+        str: The message's text.
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    text = " ".join(part["text"] for part in content if part["type"] == "text")
+    return f"{text}\n{imagePlaceholder}"
+
+def userMessage(userInput, withImage=False):
+    """
+    Builds the message for the student's turn.
+
+    Args:
+        userInput (str): The user's question or statement.
+        withImage (bool): Whether to include the snapped image.
+
+    Returns:
+        dict: The message, ready to be added to the conversation history.
+    """
+    return imageMessage(userInput) if withImage else {"role": "user", "content": userInput}
+
+def addMessage(message):
+    """
+    Adds a message to the conversation history and queues saving it to the session
+    store. Images are never saved, only their placeholder.
+
+    Args:
+        message (dict): The message to add.
+    """
+    with _historyLock:
+        messages.append(message)
+        sessionStore.append(message["role"], messageText(message))
+
+def takeBack(message):
+    """
+    Removes a message that never got a reply, so the history stays a clean
+    user/assistant sequence.
+
+    Args:
+        message (dict): The message to remove, if it's still the last one.
+    """
+    with _historyLock:
+        if messages and messages[-1] is message:
+            messages.pop()
+            sessionStore.removeLast()
+
+def recordExchange(userInput, reply):
+    """
+    Adds a question and an answer that didn't come from the model, such as a cached
+    answer, to the history so later turns can refer back to it.
+
+    Args:
+        userInput (str): The user's question or statement.
+        reply (str): The answer Flick gave.
+    """
+    addMessage(userMessage(userInput))
+    remember(reply)
+
+def requestMessages():
+    """
+    Takes a snapshot of the conversation to send, so a compaction finishing in the
+    background can't change the list while a request is being built.
+
+    Returns:
+        list: The messages to send.
+    """
+    with _historyLock:
+        return list(messages)
+
+def remember(reply):
+    """
+    Adds Flick's reply to the history and compacts the history in the background
+    if it's over budget, so the next turn doesn't wait for the summary.
+
+    Args:
+        reply (str): Flick's full reply.
+    """
+    addMessage({"role": "assistant", "content": reply})
+    threading.Thread(target=compactHistory, daemon=True).start()
+
+def dropImages():
+    """
+    Replaces the images in user messages older than 'imageTurnsKept' turns with a
+    text placeholder, freeing their base64 payloads. Call with the history lock held.
+    """
+    userTurns = [i for i, m in enumerate(messages) if m["role"] == "user"]
+    for i in userTurns[:max(0, len(userTurns) - imageTurnsKept)]:
+        if isinstance(messages[i]["content"], list):
+            messages[i] = {"role": "user", "content": messageText(messages[i])}
+
+def compactHistory():
+    """
+    Keeps the conversation history within 'historyTokenBudget'. The oldest turns are
+    taken off until what's left fits in about half the budget, and are folded into
+    the digest with a short summarization call, so compactions only happen every few
+    turns. The newest exchange is always kept. If the summary fails, the old turns
+    are dropped anyway to keep requests small.
+    """
+    global digestMessage, _folded
+    if not _compacting.acquire(blocking=False):
+        return # Another compaction is already running
+    try:
+        with _historyLock:
+            dropImages()
+            first = 2 if digestMessage else 1 # Index of the first turn after the system and digest messages
+            turns = messages[first:]
+            total = sum(estimateTokens(m) for m in turns)
+            if total <= historyTokenBudget:
+                return
+            evicted = []
+            while len(turns) > 2 and (total > historyTokenBudget // 2 or turns[0]["role"] != "user"):
+                total -= estimateTokens(turns[0])
+                evicted.append(turns.pop(0))
+            previousDigest = digestMessage["content"] if digestMessage else ""
+        if not evicted:
+            return
+
+        try:
+            summary = summarize(previousDigest, evicted)
+        except Exception as e:
+            print(f"HIST  | Couldn't summarize old turns, dropping them: {e}")
+            summary = previousDigest
+
+        with _historyLock:
+            # Only the evicted messages are removed, so turns added meanwhile are kept.
+            messages[:] = [m for m in messages if m is not digestMessage and not any(m is e for e in evicted)]
+            digestMessage = {"role": "system", "content": summary}
+            if summary:
+                messages.insert(1, digestMessage)
+            else:
+                digestMessage = None
+            total = sum(estimateTokens(m) for m in messages[1:])
+            # The evicted messages are always the oldest unsummarized ones, so a count is enough to resume from.
+            _folded += len(evicted)
+            sessionStore.saveDigest(summary, _folded)
+        print(f"HIST  | Folded {len(evicted)} old messages into the digest, history is about {total} tokens")
+    finally:
+        _compacting.release()
+
+def summarize(previousDigest, evicted):
+    """
+    Merges old turns into the running digest.
+
+    Args:
+        previousDigest (str): The digest so far, possibly empty.
+        evicted (list): The messages being taken out of the history.
+
+    Returns:
+        str: The new digest, introduced so the model knows what it is.
+    """
+    lines = [f"{'Student' if m['role'] == 'user' else 'Flick'}: {messageText(m)}" for m in evicted]
+    previousNotes = previousDigest.split("\n", 1)[-1] if previousDigest else "(none)"
+    completion = apiClients.call("digest", client.chat.completions.create,
+        model="gpt-4o-mini",
+        messages=[digestSystemMessage,
+                  {"role": "user", "content": f"Earlier notes:\n{previousNotes}\n\nNew exchanges:\n" + "\n".join(lines)}],
+        temperature=0.2,
+        max_tokens=200
+    )
+    return "Notes on the earlier part of this conversation:\n" + completion.choices[0].message.content.strip()
+
+def classify(userInput, withImage=False):
+    """
+    Decides locally, without an API call, whether a turn is small talk or needs
+    the full tutor.
+
+    Args:
+        userInput (str): The transcribed turn.
+        withImage (bool): Whether a snap is being sent with it.
+
+    Returns:
+        tuple: The route ("quick" or "full") and the reason, for the log.
+    """
+    text = userInput.lower().replace("’", "'").strip()
+    if not routing:
+        return "full", "routing off"
+    if withImage:
+        return "full", "snap"
+    if len(text.split()) > quickMaxWords:
+        return "full", "long"
+    # Greetings are matched after "hey flick" or "flick," so those don't count as a question.
+    stripped = re.sub(r"^(hey |hi |ok |okay )?flick\W*", "", text) or text
+    if not smallTalk.match(stripped):
+        return "full", "not small talk"
+    return "quick", "small talk"
+
+def routeMessages(route):
+    """
+    Picks the messages to send for a route. The quick path sends the short persona
+    with just the last exchange, so a greeting doesn't pay for the whole history.
+    Call after the user's message has been added.
+
+    Args:
+        route (str): "quick" or "full".
+
+    Returns:
+        list: The messages to send.
+    """
+    history = requestMessages()
+    if route == "full":
+        # The JSON instructions go right after the persona, ahead of the digest and history.
+        return history[:1] + [structuredSystemMessage] + history[1:] if structured else history
+    recent = [m for m in history[1:] if m["role"] != "system" and isinstance(m["content"], str)]
+    return [quickSystemMessage] + recent[-3:]
+
+def routeOptions(route):
+    """
+    Picks extra request options for a route.
+
+    Args:
+        route (str): "quick" or "full".
+
+    Returns:
+        dict: Keyword arguments for the completion call.
+    """
+    if route == "quick":
+        return {"max_tokens": quickMaxTokens}
+    return {"response_format": responseFormat} if structured else {}
+
+def parseStructured(content, route="full"):
+    """
+    Reads a reply into Flick's answer and the image decision. A reply that isn't the
+    expected JSON, e.g. with 'structuredResponse' off, is used as the answer as it is,
+    and the image decision is left to wantsImages()'s fallback.
+
+    Args:
+        content (str): The model's reply.
+        route (str): The route the reply came from. Quick replies are plain text and never need images.
+
+    Returns:
+        dict: The answer "text", "needsImage" (None if the reply didn't say) and "imageQuery".
+    """
+    if route == "quick":
+        return {"text": content, "needsImage": False, "imageQuery": ""}
+    if structured:
+        try:
+            parsed = json.loads(content)
+            if isinstance(parsed, dict) and isinstance(parsed.get("text"), str):
+                return {"text": parsed["text"], "needsImage": bool(parsed.get("needsImage")),
+                        "imageQuery": str(parsed.get("imageQuery") or "").strip()}
+        except ValueError:
+            pass
+    return {"text": content, "needsImage": None, "imageQuery": ""}
+
+def wantsImages(decision):
+    """
+    Decides whether to search for images for a response: the model's own decision
+    when it gave one, and otherwise whether the answer mentions an image or diagram.
+
+    Args:
+        decision (dict): A response from parseStructured().
+
+    Returns:
+        bool: True if images should be found and shown.
+    """
+    if decision.get("needsImage") is None:
+        return "image" in decision["text"] or "diagram" in decision["text"]
+    return decision["needsImage"]
+
+def streamedText(pieces, route):
+    """
+    Passes the answer through as it streams in. For a structured reply, the text
+    field is decoded from the JSON piece by piece, so speech can start on the first
+    sentence as usual.
+
+    Args:
+        pieces (iterable): The raw pieces of the model's reply.
+        route (str): The route the reply is coming from.
+
+    Yields:
+        str: The next piece of Flick's answer. The generator's return value is the
+            whole reply, decoded with parseStructured().
+    """
+    if route == "quick" or not structured:
+        raw = []
+        for piece in pieces:
+            raw.append(piece)
+            yield piece
+        return parseStructured("".join(raw), route)
+
+    raw = ""
+    position = None # Where the undecoded part of the text field starts, once it's been found
+    ended = False
+    for piece in pieces:
+        raw += piece
+        if position is None:
+            match = textFieldStart.search(raw)
+            if not match:
+                continue
+            position = match.end()
+        decoded = []
+        while not ended:
+            match = jsonStringPiece.match(raw, position)
+            if not match:
+                ended = raw.startswith('"', position)
+                break
+            text = match.group()
+            decoded.append(text if text[0] != "\\" else json.loads(f'"{text}"'))
+            position = match.end()
+        if decoded:
+            yield "".join(decoded)
+    reply = parseStructured(raw, route)
+    if position is None:
+        yield reply["text"] # Not the JSON that was asked for, so nothing was passed through yet
+    return reply
+
+def logRoute(route, reason, seconds):
+    """
+    Logs a routing decision with its latency and, for quick turns, how much faster
+    it was than a typical full turn, so the thresholds can be tuned.
+
+    Args:
+        route (str): "quick" or "full".
+        reason (str): Why the turn took this route.
+        seconds (float): How long the model call took.
+    """
+    _routeLatencies[route].append(seconds)
+    message = f"ROUTE | {route} path ({reason}) took {seconds:.2f}s"
+    fullTypical = tracing.percentile(list(_routeLatencies["full"]), 0.5)
+    if route == "quick" and fullTypical is not None:
+        message += f", about {fullTypical - seconds:.2f}s faster than a full turn (p50 {fullTypical:.2f}s)"
+    print(message)
+
+def promptResponse(userInput, withImage=False):
+    """
+    Sends a user's input to the OpenAI model and retrieves Flick's response along
+    with whether images would help and what to search for, all from one completion.
+    The conversation history is maintained in the 'messages' list.
+
+    Args:
+        userInput (str): The user's question or statement.
+        withImage (bool): Whether to send the snapped image along with the text.
+
+    Returns:
+        dict: Flick's answer as "text", with "needsImage" and "imageQuery" (see parseStructured()).
+    """
+    route, reason = classify(userInput, withImage)
+    message = userMessage(userInput, withImage)
+    addMessage(message) # Add user's message to history
+    start = time.perf_counter()
+    try:
+        completion = apiClients.call("chat", client.chat.completions.create,
+            model="gpt-4o-mini",            # Specify the OpenAI model to use
+            messages=routeMessages(route),  # Pass the conversation history, kept within its budget
+            **routeOptions(route)
+        )
+    except BaseException:
+        takeBack(message) # Drop the unanswered message
+        raise
+    reply = parseStructured(completion.choices[0].message.content, route) # Extract Flick's reply
+    logRoute(route, reason, time.perf_counter() - start)
+    remember(reply["text"]) # Add Flick's reply to history; an image is swapped for a placeholder
+    return reply
+
+async def promptResponseAsync(userInput, withImage=False):
+    """
+    Async version of promptResponse() for the asyncio orchestrator. Cancelling it
+    aborts the request and takes the question back out of the history.
+
+    Args:
+        userInput (str): The user's question or statement.
+        withImage (bool): Whether to send the snapped image along with the text.
+
+    Returns:
+        dict: Flick's answer as "text", with "needsImage" and "imageQuery" (see parseStructured()).
+    """
+    route, reason = classify(userInput, withImage)
+    message = userMessage(userInput, withImage)
+    addMessage(message) # Add user's message to history
+    start = time.perf_counter()
+    try:
+        completion = await apiClients.callAsync("chat", asyncClient.chat.completions.create,
+            model="gpt-4o-mini",            # Specify the OpenAI model to use
+            messages=routeMessages(route),  # Pass the conversation history, kept within its budget
+            **routeOptions(route)
+        )
+    except BaseException:
+        takeBack(message) # Drop the unanswered message
+        raise
+    reply = parseStructured(completion.choices[0].message.content, route) # Extract Flick's reply
+    logRoute(route, reason, time.perf_counter() - start)
+    remember(reply["text"]) # Add Flick's reply to history
+    return reply
 
 def prompt(userInput):
     """
@@ -130,14 +658,74 @@ def prompt(userInput):
     Returns:
         str: Flick's generated response.
     """
-    messages.append({"role": "user", "content": userInput}) # Add user's message to history
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini", # Specify the OpenAI model to use
-        messages=messages    # Pass the entire conversation history
-    )
-    reply = completion.choices[0].message.content # Extract Flick's reply
-    messages.append({"role": "assistant", "content": reply}) # Add Flick's reply to history
-    return reply
+    return promptResponse(userInput)["text"]
+
+def imageMessage(userInput):
+    """
+    Builds a user message containing both text and the snapped image.
+    The image is shrunk and recompressed by snapProcessing, then encoded in base64.
+
+    Args:
+        userInput (str): The user's question or statement related to the image.
+
+    Returns:
+        dict: The message, ready to be added to the conversation history.
+    """
+    snap = snapProcessing.prepareSnap()
+    # Record the upload size and image tokens, before and after, in the latency trace.
+    tracing.mark("snap", bytesSent=snap["bytes"], originalBytes=snap["originalBytes"],
+                 tokens=snap["tokens"], originalTokens=snap["originalTokens"], detail=snap["detail"])
+    image = base64.b64encode(snap["data"]).decode('utf-8')
+
+    # Construct the message payload including both text and image URL.
+    return {"role": "user",
+            "content": [
+                {"type": "text", "text": userInput},
+                {"type": "image_url", "image_url":
+                 { "url": f"data:image/jpeg;base64,{image}", "detail": snap["detail"]}}]}
+
+def promptStream(userInput, withImage=False, decision=None):
+    """
+    Sends a user's input to the OpenAI model and yields Flick's response piece by
+    piece as it is generated. The full reply is added to the conversation history
+    once the stream ends.
+
+    Args:
+        userInput (str): The user's question or statement.
+        withImage (bool): Whether to send the snapped image along with the text.
+        decision (dict): Filled in with the whole response once the stream ends
+            (see parseStructured()), for the image decision.
+
+    Yields:
+        str: The next piece of Flick's response.
+    """
+    route, reason = classify(userInput, withImage)
+    message = userMessage(userInput, withImage)
+    addMessage(message)
+    start = time.perf_counter()
+    try:
+        stream = apiClients.call("chat", client.chat.completions.create,
+            model="gpt-4o-mini",            # Specify the OpenAI model to use
+            messages=routeMessages(route),  # Pass the conversation history, kept within its budget
+            stream=True,                    # Receive the reply as it is generated
+            **routeOptions(route)
+        )
+
+        def pieces():
+            with stream: # Closes the connection if the reader stops early
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content: # Skip chunks that only carry metadata
+                        yield chunk.choices[0].delta.content
+
+        reply = yield from streamedText(pieces(), route)
+    except BaseException:
+        # The stream failed, or the turn was cancelled and stopped reading it.
+        takeBack(message) # Drop the unanswered message
+        raise
+    logRoute(route, reason, time.perf_counter() - start)
+    remember(reply["text"]) # Add Flick's reply to history
+    if decision is not None:
+        decision.update(reply)
 
 def promptImage(userInput):
     """
@@ -150,47 +738,40 @@ def promptImage(userInput):
     Returns:
         str: Flick's generated response based on the text and image.
     """
-    with open("image.jpg", "rb") as imageFile:
-        # Read the image file and encode it in base64 for API submission.
-        image = base64.b64encode(imageFile.read()).decode('utf-8')
-    
-    # Construct the message payload including both text and image URL.
-    message = {"role": "user",
-               "content": [
-                   {"type": "text", "text": userInput},
-                   {"type": "image_url", "image_url":
-                    { "url": f"data:image/jpeg;base64,{image}",}}]}
-    
-    messages.append(message) # Add the message (with image) to history
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini", # Specify the OpenAI model
-        messages=messages    # Pass the entire conversation history
-    )
-    reply = completion.choices[0].message.content # Extract Flick's reply
-    messages.append({"role": "assistant", "content": reply}) # Add Flick's reply to history
-    return reply
+    return promptResponse(userInput, withImage=True)["text"]
 
-def generateImageQuery(flickResponse):
+def imageQueryMessages(flickResponse):
     """
-    Generates a concise image search query based on Flick's explanation.
-    This uses a separate system message and a lower temperature for more focused results.
+    Builds the messages that ask the model for an image search query.
 
     Args:
         flickResponse (str): The explanation provided by Flick.
 
     Returns:
-        str: A short, specific query suitable for an image search engine.
+        list: The messages to send, using the specific query system message.
     """
     # Construct the user prompt for generating an image query.
     queryUserPrompt = {
         "role": "user",
         "content": f'What would be a good image search query for this topic or explanation?\n\n"{flickResponse}"'
     }
+    return [querySystemMessage, queryUserPrompt]
 
+def generateImageQuery(flickResponse):
+    """
+    Generates a concise image search query based on Flick's explanation.
+    This uses a separate system message and a lower temperature for more focused results.
+
+    Args:
+        flickResponse (str): The explanation provided by Flick.
+
+    Returns:
+        str: A short, specific query suitable for an image search engine.
+    """
     # Send the request to the OpenAI model using the 'querySystemMessage'.
-    completion = client.chat.completions.create(
+    completion = apiClients.call("imageQuery", client.chat.completions.create,
         model="gpt-4o-mini",
-        messages=[querySystemMessage, queryUserPrompt], # Use the specific query system message
+        messages=imageQueryMessages(flickResponse), # Use the specific query system message
         temperature=0.3 # Lower temperature for less creative, more direct output
     )
 
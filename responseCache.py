@@ -0,0 +1,283 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import flickTools
+
+# Load settings using flickTools. 'responseCache' (off by default) answers repeated questions from disk.
+# Their speech comes from the speech cache (see speechCache.py), keyed by the answer's text. Entries expire after 'cacheTtlHours', and
+# the least recently used ones are evicted past 'cacheMaxEntries' or 'cacheMaxMegabytes'.
+# 'cacheNearDuplicates' also matches questions worded slightly differently, as long as
+# they're at least 'cacheSimilarity' alike and mention the same numbers. Only questions
+# with at least 'cacheMinContentWords' words of their own are cached (see cacheable()).
+settings = flickTools.loadSettings()
+enabled = settings.get("responseCache", False)
+ttlSeconds = settings.get("cacheTtlHours", 168) * 3600
+maxEntries = settings.get("cacheMaxEntries", 200)
+maxBytes = settings.get("cacheMaxMegabytes", 50) * 1024 * 1024
+nearDuplicates = settings.get("cacheNearDuplicates", True)
+similarityThreshold = settings.get("cacheSimilarity", 0.9)
+minContentWords = settings.get("cacheMinContentWords", 1)
+
+# The settings the system prompt is built from. An answer is only reused for the same
+# student and course, since it was written for them.
+personaSettings = ("name", "grade", "info", "course")
+
+# How long after a change the index is written to disk, so a burst of hits and
+# stores costs one write, made in the background.
+saveDelaySeconds = 5
+
+# Where the index is kept between runs.
+cacheFolder = "resources/responseCache"
+indexPath = os.path.join(cacheFolder, "index.json")
+
+# Words that don't change what's being asked, and contractions to spell out so
+# "what's" and "what is" are the same question.
+fillerWords = {"hey", "flick", "um", "uh", "umm", "so", "like", "please", "okay", "ok", "can", "you", "tell", "me"}
+contractions = {"what's": "what is", "who's": "who is", "how's": "how is", "where's": "where is",
+                "it's": "it is", "that's": "that is", "there's": "there is", "what're": "what are"}
+
+# Questions that point back at the conversation only make sense with its history,
+# so they're never answered from the cache. That covers pronouns ("who were they"),
+# ordinals ("what about the second one") and asking for more ("tell me more").
+contextWords = {"it", "that", "this", "those", "these", "again", "previous", "last", "above", "next",
+                "he", "she", "they", "them", "him", "her", "his", "hers", "their", "theirs", "its",
+                "one", "ones", "first", "second", "third", "other", "another", "same", "more", "else",
+                "after", "before", "then", "instead"}
+followUpStarts = ("what about", "how about", "and", "but", "also", "or")
+
+# Words that only shape a question, so "who is" or "why not" has nothing to cache.
+functionWords = {"what", "who", "whom", "which", "where", "when", "how", "why", "is", "are", "was", "were", "be",
+                 "do", "does", "did", "the", "a", "an", "of", "to", "in", "on", "at", "for", "with",
+                 "about", "and", "or", "not", "yes", "no", "yeah", "nope", "sure", "i", "we", "my", "there"}
+
+# The cache index, keyed by normalized question, and the lock guarding it. '_saveTimer'
+# is the pending write of the index, if there is one.
+_lock = threading.Lock()
+_entries = {}
+_saveTimer = None
+
+def normalize(transcript):
+    """
+    Reduces a transcript to the words that matter for matching it against earlier questions.
+
+    Args:
+        transcript (str): The transcribed question.
+
+    Returns:
+        str: The normalized question.
+    """
+    text = transcript.lower().replace("’", "'")
+    for contraction, expanded in contractions.items():
+        text = text.replace(contraction, expanded)
+    words = re.findall(r"[a-z]+|\d+(?:\.\d+)?", text)
+    return " ".join(word for word in words if word not in fillerWords)
+
+def cacheable(key):
+    """
+    Checks whether a normalized question can be answered without the conversation history.
+    Follow-ups like "why?", "yes", "who were they" or "what about the second one" can't:
+    they have no words of their own to match on, or point back at earlier turns.
+
+    Args:
+        key (str): The normalized question.
+
+    Returns:
+        bool: True if the question stands on its own.
+    """
+    words = key.split()
+    if contextWords.intersection(words) or key.startswith(tuple(start + " " for start in followUpStarts)):
+        return False
+    return len([word for word in words if word not in functionWords]) >= minContentWords
+
+def persona():
+    """
+    Fingerprints the settings the system prompt is built from.
+
+    Returns:
+        str: A short hash that changes whenever the student or course does.
+    """
+    described = json.dumps([settings.get(name) for name in personaSettings])
+    return hashlib.sha256(described.encode("utf-8")).hexdigest()[:16]
+
+def similarity(a, b):
+    """
+    Compares two normalized questions by their sets of character trigrams. Spaces are
+    ignored, so a word transcribed as two ("photo synthesis") still matches.
+
+    Args:
+        a (str): The first question.
+        b (str): The second question.
+
+    Returns:
+        float: The Jaccard similarity, from 0 (nothing alike) to 1 (identical).
+    """
+    a, b = a.replace(" ", ""), b.replace(" ", "")
+    gramsA = {a[i:i + 3] for i in range(len(a) - 2)}
+    gramsB = {b[i:i + 3] for i in range(len(b) - 2)}
+    if not gramsA or not gramsB:
+        return float(a == b)
+    return len(gramsA & gramsB) / len(gramsA | gramsB)
+
+def numbers(key):
+    """
+    Lists the numbers in a normalized question, so "7 times 8" never matches "7 times 9".
+
+    Args:
+        key (str): The normalized question.
+
+    Returns:
+        list: The numbers in order.
+    """
+    return re.findall(r"\d+(?:\.\d+)?", key)
+
+def load():
+    """
+    Loads the cache index from disk. Speech files kept here by older versions are
+    deleted, since speech is now kept by the speech cache.
+    """
+    global _entries
+    try:
+        with open(indexPath) as file:
+            entries = json.load(file)
+    except (FileNotFoundError, ValueError):
+        entries = {}
+    for entry in entries.values():
+        if entry.pop("audio", None):
+            entry["size"] = len(entry["text"])
+    for name in os.listdir(cacheFolder) if os.path.isdir(cacheFolder) else []:
+        if name.endswith(".mp3"):
+            os.remove(os.path.join(cacheFolder, name))
+    with _lock:
+        _entries = entries
+
+def save():
+    """
+    Writes the cache index to disk. The index is written to a temporary file and
+    moved into place, so a power cut can't leave half an index behind.
+    """
+    global _saveTimer
+    with _lock:
+        _saveTimer = None
+        index = json.dumps(_entries)
+    os.makedirs(cacheFolder, exist_ok=True)
+    temporary = indexPath + ".tmp"
+    with open(temporary, "w") as file:
+        file.write(index)
+    os.replace(temporary, indexPath)
+
+def scheduleSave():
+    """
+    Writes the index 'saveDelaySeconds' from now in a background thread, unless a
+    write is already pending, which will include this change. Call with the lock held.
+    """
+    global _saveTimer
+    if _saveTimer is None:
+        _saveTimer = threading.Timer(saveDelaySeconds, save)
+        _saveTimer.daemon = True
+        _saveTimer.start()
+
+def flush():
+    """
+    Writes a pending change to the index straight away, e.g. when Flick shuts down.
+    """
+    with _lock:
+        timer = _saveTimer
+    if timer is not None:
+        timer.cancel()
+        save()
+
+def evict():
+    """
+    Removes expired entries, then the least recently used ones until the cache is
+    within its entry and size limits. Call with the lock held.
+    """
+    now = time.time()
+    expired = [key for key, entry in _entries.items() if now - entry["created"] > ttlSeconds]
+    byAge = sorted(_entries, key=lambda key: _entries[key]["used"])
+    total = sum(entry["size"] for entry in _entries.values())
+    for key in expired + byAge:
+        if key not in _entries:
+            continue
+        if key not in expired and len(_entries) <= maxEntries and total <= maxBytes:
+            break
+        total -= _entries.pop(key)["size"]
+
+def publicEntry(key, entry):
+    """
+    Builds the view of an entry handed to callers.
+
+    Returns:
+        dict: The entry's "key", response "text", and the image decision, "needsImage"
+            and "imageQuery", made with the response.
+    """
+    return {"key": key, "text": entry["text"],
+            "needsImage": entry.get("needsImage"), "imageQuery": entry.get("imageQuery", "")}
+
+def lookup(transcript):
+    """
+    Looks for an earlier answer to the same question, or a near duplicate of it.
+
+    Args:
+        transcript (str): The transcribed question.
+
+    Returns:
+        dict: The cached entry (see publicEntry()), or None on a miss.
+    """
+    key = normalize(transcript)
+    if not enabled or not cacheable(key):
+        return None
+    current = persona()
+    with _lock:
+        now = time.time()
+        entry = _entries.get(key)
+        if entry and entry.get("persona") != current:
+            entry = None # Answered for a different student or course
+        match, score = (key, 1.0) if entry else (None, 0.0)
+        if not entry and nearDuplicates:
+            # Compare against every cached question. The cache is small, so this takes well under a millisecond per entry.
+            for otherKey, other in _entries.items():
+                if other.get("persona") != current or numbers(otherKey) != numbers(key):
+                    continue
+                otherScore = similarity(key, otherKey)
+                if otherScore > score:
+                    match, score = otherKey, otherScore
+            if score < similarityThreshold:
+                match = None
+        if match is None or now - _entries[match]["created"] > ttlSeconds:
+            return None
+        _entries[match]["used"] = now
+        _entries[match]["hits"] = _entries[match].get("hits", 0) + 1
+        scheduleSave()
+        print(f"CACHE | Answering '{transcript}' from the cache" +
+              ("" if match == key else f" (similar to '{match}', {score:.2f})"))
+        return publicEntry(match, _entries[match])
+
+def store(transcript, text, decision=None):
+    """
+    Caches the answer to a question.
+
+    Args:
+        transcript (str): The transcribed question.
+        text (str): Flick's response.
+        decision (dict): The image decision made with the response, if any (see prompt.parseStructured()).
+
+    Returns:
+        dict: The new entry (see publicEntry()), or None if the question can't be cached.
+    """
+    key = normalize(transcript)
+    if not enabled or not cacheable(key):
+        return None
+    with _lock:
+        now = time.time()
+        _entries[key] = {"text": text, "size": len(text), "created": now, "used": now, "hits": 0, "persona": persona(),
+                         "needsImage": (decision or {}).get("needsImage"), "imageQuery": (decision or {}).get("imageQuery", "")}
+        evict()
+        scheduleSave()
+        return publicEntry(key, _entries[key]) if key in _entries else None
+
+load()
+atexit.register(flush)
@@ -0,0 +1,201 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+import flickTools
+
+# Load settings using flickTools. With 'sessionStore' on, the conversation is saved
+# to an SQLite database as it happens, and a restart within 'sessionResumeHours' of
+# the last turn picks the conversation back up. Sessions older than 'sessionKeepDays'
+# are deleted.
+settings = flickTools.loadSettings()
+enabled = settings.get("sessionStore", True)
+resumeSeconds = settings.get("sessionResumeHours", 12) * 3600
+keepSeconds = settings.get("sessionKeepDays", 30) * 86400
+databasePath = "resources/session.db"
+
+# Most messages loaded when resuming. The history budget keeps the unsummarized
+# part of a session well below this; it's only a guard so startup stays fast.
+maxResumeMessages = 100
+
+schema = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    lastActive REAL NOT NULL,
+    digest TEXT NOT NULL DEFAULT '',
+    folded INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (session, position)
+);
+CREATE INDEX IF NOT EXISTS sessionsByActivity ON sessions (lastActive);
+"""
+
+# Writes are queued and made by one background thread, so the turn pipeline never
+# waits on the disk. The thread owns its own connection.
+_writes = queue.Queue()
+_writer = None
+_session = None  # The id of the current session
+_position = 0    # Messages in the current session so far; only changed on the writer thread
+
+def connect():
+    """
+    Opens the database in write-ahead log mode, so appending a message is one
+    sequential write and reading never waits for a write to finish.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    os.makedirs(os.path.dirname(databasePath), exist_ok=True)
+    connection = sqlite3.connect(databasePath, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; a power cut can only lose the last commit
+    connection.executescript(schema)
+    return connection
+
+def resume():
+    """
+    Loads the session to continue: the latest one if it was active recently, or
+    a new one. Only the digest and the messages it doesn't cover are read, using
+    the primary key, so startup takes the same time however long the session is.
+    The messages always start with a question and end with its answer. Starts the writer thread.
+
+    Returns:
+        dict: The session's "digest" (possibly empty), its unsummarized "messages"
+            as role/content dictionaries, and how many messages are "folded" into the digest.
+    """
+    global _session, _position, _writer
+    empty = {"digest": "", "messages": [], "folded": 0}
+    if not enabled:
+        return empty
+    start = time.perf_counter()
+    connection = connect()
+    now = time.time()
+    row = connection.execute(
+        "SELECT id, lastActive, digest, folded FROM sessions ORDER BY lastActive DESC LIMIT 1").fetchone()
+    if row and now - row[1] <= resumeSeconds:
+        _session, _, digest, folded = row
+        rows = connection.execute(
+            "SELECT role, content FROM messages WHERE session = ? AND position > ? ORDER BY position DESC LIMIT ?",
+            (_session, folded, maxResumeMessages)).fetchall()
+        _position = connection.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM messages WHERE session = ?", (_session,)).fetchone()[0]
+        rows.reverse()
+        if rows and rows[-1][0] == "user":
+            # A question that never got a reply, e.g. Flick was closed mid-turn. Delete
+            # it like prompt.takeBack() would have, so the next question doesn't follow it.
+            connection.execute("DELETE FROM messages WHERE session = ? AND position = ?", (_session, _position))
+            connection.commit()
+            _position -= 1
+            rows.pop()
+        # The window has to start with a question, so an answer cut off from it is dropped too.
+        while rows and rows[0][0] != "user":
+            rows.pop(0)
+        # Messages past the guard are dropped from the context, so count them as folded.
+        folded = max(folded, _position - len(rows))
+        resumed = {"digest": digest, "messages": [{"role": r, "content": c} for r, c in rows], "folded": folded}
+        print(f"STORE | Resumed session {_session} with {len(rows)} messages in {time.perf_counter() - start:.3f}s")
+    else:
+        _session = connection.execute("INSERT INTO sessions (started, lastActive) VALUES (?, ?)", (now, now)).lastrowid
+        _position = 0
+        connection.commit()
+        resumed = empty
+        print(f"STORE | Started session {_session}")
+
+    _writer = threading.Thread(target=_writeLoop, args=(connection,), daemon=True)
+    _writer.start()
+    _writes.put(("prune", ()))
+    return resumed
+
+def append(role, content):
+    """
+    Queues a message to be saved to the current session.
+
+    Args:
+        role (str): "user" or "assistant".
+        content (str): The message text.
+    """
+    if _writer:
+        _writes.put(("append", (role, content, time.time())))
+
+def removeLast():
+    """
+    Queues removing the last message of the current session, for a question that never got a reply.
+    """
+    if _writer:
+        _writes.put(("removeLast", ()))
+
+def saveDigest(digest, folded):
+    """
+    Queues saving the session's digest.
+
+    Args:
+        digest (str): The digest text.
+        folded (int): How many of the session's messages, from the start, the digest covers.
+    """
+    if _writer:
+        _writes.put(("digest", (digest, folded)))
+
+def flush(timeout=2):
+    """
+    Waits for the queued writes to be saved, e.g. when the program exits.
+
+    Args:
+        timeout (float): The longest to wait in seconds.
+    """
+    if not _writer:
+        return
+    done = threading.Event()
+    _writes.put(("flush", (done,)))
+    done.wait(timeout)
+
+def _writeLoop(connection):
+    """
+    Saves queued writes. Everything waiting in the queue is written in one
+    transaction, so a burst of messages costs a single commit.
+    """
+    global _position
+    while True:
+        batch = [_writes.get()]
+        while True:
+            try:
+                batch.append(_writes.get_nowait())
+            except queue.Empty:
+                break
+        flushed = []
+        try:
+            for operation, args in batch:
+                if operation == "append":
+                    role, content, created = args
+                    _position += 1
+                    connection.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                                       (_session, _position, role, content, created))
+                    connection.execute("UPDATE sessions SET lastActive = ? WHERE id = ?", (created, _session))
+                elif operation == "removeLast":
+                    connection.execute("DELETE FROM messages WHERE session = ? AND position = ?", (_session, _position))
+                    _position = max(0, _position - 1)
+                elif operation == "digest":
+                    digest, folded = args
+                    connection.execute("UPDATE sessions SET digest = ?, folded = ? WHERE id = ?", (digest, folded, _session))
+                elif operation == "prune":
+                    cutoff = time.time() - keepSeconds
+                    connection.execute("DELETE FROM messages WHERE session IN (SELECT id FROM sessions WHERE lastActive < ?)", (cutoff,))
+                    connection.execute("DELETE FROM sessions WHERE lastActive < ?", (cutoff,))
+                elif operation == "flush":
+                    flushed.append(args[0])
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"STORE | Couldn't save the session: {e}")
+            connection.rollback()
+        for done in flushed:
+            done.set()
+
+atexit.register(flush)
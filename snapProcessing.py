@@ -0,0 +1,157 @@
+import math
+import os
+import threading
+import cv2
+import numpy as np
+import events
+import flickTools
+
+# Load settings using flickTools. Snaps are shrunk and recompressed before they are
+# sent to the vision model:
+# 'snapJpegQuality' is the JPEG quality to recompress at (75-85 keeps handwriting legible),
+# 'snapGrayscale' drops color, which worksheets rarely need,
+# 'snapDetail' forces the vision detail level ("low" or "high"); "auto" picks it from the
+# snap, using high detail only for snaps with lots of fine lines, like text.
+settings = flickTools.loadSettings()
+jpegQuality = settings.get("snapJpegQuality", 80)
+grayscale = settings.get("snapGrayscale", False)
+detailSetting = settings.get("snapDetail", "auto")
+edgeDensityForHigh = settings.get("snapEdgeDensity", 0.05) # Share of edge pixels above which a snap counts as text
+
+# How the vision model sizes images. Low detail is a fixed 512x512 thumbnail; high
+# detail fits the image in 2048x2048, scales its shortest side to 768 and cuts it
+# into 512 pixel tiles. Pixels beyond that are never seen, so they aren't sent.
+lowDetailSize = 512
+highDetailBox = 2048
+highDetailShortSide = 768
+tileSize = 512
+baseTokens = 85  # Tokens every image costs
+tileTokens = 170 # Tokens per tile at high detail
+
+# The last snap prepared, keyed by its path and modification time, so the work done
+# right after the snap is taken isn't repeated when the prompt is sent.
+_prepared = {}
+_lock = threading.Lock()
+
+def imageTokens(width, height, detail):
+    """
+    Calculates how many tokens the vision model charges for an image.
+
+    Args:
+        width (int): The image width in pixels.
+        height (int): The image height in pixels.
+        detail (str): "low" or "high".
+
+    Returns:
+        int: The token count.
+    """
+    if detail == "low":
+        return baseTokens
+    scale = min(1.0, highDetailBox / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, highDetailShortSide / min(width, height))
+    width, height = width * scale, height * scale
+    return baseTokens + tileTokens * math.ceil(width / tileSize) * math.ceil(height / tileSize)
+
+def chooseDetail(gray):
+    """
+    Picks the detail level from the snap's content. Text and diagrams have a lot of
+    thin edges and need high detail to be read; a photo of an object doesn't.
+
+    Args:
+        gray (numpy.ndarray): The snap in grayscale.
+
+    Returns:
+        str: "low" or "high".
+    """
+    if detailSetting in ("low", "high"):
+        return detailSetting
+    edges = cv2.Canny(gray, 80, 160)
+    return "high" if np.count_nonzero(edges) / edges.size > edgeDensityForHigh else "low"
+
+def targetSize(width, height, detail):
+    """
+    Finds the largest size worth sending for a detail level. At high detail the
+    image is also shrunk slightly if that saves a whole row or column of tiles.
+
+    Args:
+        width (int): The snap's width in pixels.
+        height (int): The snap's height in pixels.
+        detail (str): "low" or "high".
+
+    Returns:
+        tuple: The (width, height) to resize to, never larger than the snap.
+    """
+    if detail == "low":
+        scale = min(1.0, lowDetailSize / max(width, height))
+    else:
+        scale = min(1.0, highDetailBox / max(width, height), highDetailShortSide / min(width, height))
+        # Up to 10% smaller is fine for legibility if it means fewer tiles.
+        for side in (width, height):
+            tiles = math.ceil(side * scale / tileSize)
+            if tiles > 1 and side * scale <= (tiles - 1) * tileSize * 1.1:
+                scale = min(scale, (tiles - 1) * tileSize / side)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def prepareSnap(path=flickTools.snapPath):
+    """
+    Shrinks and recompresses a snap for the vision model and works out its detail level.
+
+    Args:
+        path (str): The snapped image.
+
+    Returns:
+        dict: The JPEG to upload under "data" and its "detail" level, with "bytes",
+            "tokens", "originalBytes" and "originalTokens" to report the savings.
+    """
+    key = (path, os.path.getmtime(path))
+    with _lock:
+        if key in _prepared:
+            return _prepared[key]
+
+    with open(path, "rb") as imageFile:
+        original = imageFile.read()
+    image = cv2.imdecode(np.frombuffer(original, np.uint8), cv2.IMREAD_COLOR)
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    detail = chooseDetail(gray)
+
+    newWidth, newHeight = targetSize(width, height, detail)
+    image = gray if grayscale else image
+    if (newWidth, newHeight) != (width, height):
+        image = cv2.resize(image, (newWidth, newHeight), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpegQuality])
+    if not ok:
+        raise ValueError(f"Couldn't encode {path} as JPEG")
+
+    snap = {
+        "data": encoded.tobytes(),
+        "detail": detail,
+        "bytes": len(encoded),
+        "tokens": imageTokens(newWidth, newHeight, detail),
+        "originalBytes": len(original),
+        "originalTokens": imageTokens(width, height, "high"), # What the default detail level costs
+    }
+    print(f"SNAP  | {width}x{height} -> {newWidth}x{newHeight}{' gray' if grayscale else ''}, "
+          f"{snap['originalBytes']} -> {snap['bytes']} bytes "
+          f"({100 * (1 - snap['bytes'] / snap['originalBytes']):.0f}% smaller), "
+          f"{detail} detail: {snap['originalTokens']} -> {snap['tokens']} tokens")
+    with _lock:
+        _prepared.clear() # Only the latest snap is ever sent
+        _prepared[key] = snap
+    return snap
+
+def prepareInBackground():
+    """
+    Prepares a new snap straight away in a worker thread, so the turn that sends
+    it doesn't wait for the resize and recompression.
+    """
+    def run():
+        try:
+            prepareSnap()
+        except Exception as e:
+            print(f"SNAP  | Couldn't prepare the snap: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+events.subscribe(events.SNAP_TAKEN, prepareInBackground)
@@ -1,62 +1,334 @@
-import edge_tts
 from pydub import AudioSegment
-from pydub.playback import play
 import os
-import openai
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
+import apiClients
+import events
 import flickTools # Assuming this module contains loadSettings()
+import playback
+import speechCache
+import timeStretch
+import tracing
+import ttsBackends
 
 # Load settings from flickTools. This likely includes preferences for speech speed and volume.
 settings = flickTools.loadSettings()
 
-# Initialize the OpenAI client with your API key.
-client = openai.OpenAI(api_key="")
+# The shared OpenAI clients, with pooled connections, timeouts and retries.
+client = apiClients.client
+# Async client used by the asyncio orchestrator, so cancelling a turn aborts its synthesis.
+asyncClient = apiClients.asyncClient
+
+# The OpenAI TTS model, voice and audio format, which are also part of the speech cache's key.
+# 'speechFormat' is "pcm" by default: raw 24 kHz 16-bit samples that go to the
+# playback engine without decoding. "mp3" downloads a sixth of the bytes but is
+# decoded with ffmpeg before it plays.
+ttsModel = "tts-1"
+ttsVoice = "fable"
+ttsFormat = settings.get("speechFormat", "pcm")
+
+# Text-to-speech backends, best voice first: OpenAI, Microsoft Edge's online voices,
+# an on-device Piper voice and espeak-ng. Each sentence goes to the best voice that's
+# up and expected to answer within 'ttsTimeout' seconds, and falls over to the next
+# if it fails or takes longer than that, so an offline unit still answers. 'ttsBackend' can name one to always try first ("openai", "edge", "piper" or
+# "espeak"); 'piperModel' is the path of a Piper .onnx voice, and an empty string turns it off.
+ttsBackend = settings.get("ttsBackend", "auto")
+ttsTimeout = settings.get("ttsTimeout", 8)
+backends = [ttsBackends.OpenAIBackend(client, asyncClient, ttsModel, ttsVoice, ttsFormat),
+            ttsBackends.EdgeBackend(settings.get("edgeVoice", "en-GB-RyanNeural"))]
+if settings.get("piperModel", "resources/piper/en_GB-alan-medium.onnx"):
+    backends.append(ttsBackends.PiperBackend(settings.get("piperModel", "resources/piper/en_GB-alan-medium.onnx")))
+backends.append(ttsBackends.EspeakBackend(settings.get("espeakVoice", "en-gb")))
+
+# With 'speedAtSynthesis' on, the 'speed' setting is sent to the TTS API, which
+# speaks faster or slower at no cost on the unit. Otherwise the speech is stretched
+# on playback by timeStretch. Either way the pitch stays the same.
+speedAtSynthesis = settings.get("speedAtSynthesis", True)
+
+# Where speech is written when the speech cache is off, with the backend's format as its extension.
+speechPath = "temp/speech"
+
+# Extra seconds allowed on top of a clip's length for it to start, and then to finish,
+# before the sound card is taken to be stuck and playback is stopped.
+playbackMarginSeconds = 2
+
+# Streaming speech: sentences are synthesized in parallel by the pool, and their
+# futures wait in the playback queue so they are always spoken in order.
+# Sentences queued before the last stopSpeech() are skipped, by their generation.
+_synthesisPool = ThreadPoolExecutor(max_workers=3)
+_playbackQueue = queue.Queue()
+_playbackThread = None
+_generation = 0
+
+def speed():
+    """
+    Reads the 'speed' setting, kept within the range the TTS API accepts.
+
+    Returns:
+        float: The speaking speed, where 1 is normal.
+    """
+    return min(4.0, max(0.25, settings["speed"]))
+
+def synthesisSpeed():
+    """
+    Picks the speed the backends are asked to speak at.
+
+    Returns:
+        float: The 'speed' setting with 'speedAtSynthesis' on, otherwise 1.
+    """
+    return speed() if speedAtSynthesis else 1
+
+def cached(speech):
+    """
+    Looks for speech already made for some text by the voice it would be made with
+    now, or a better one. A worse voice's copy, e.g. espeak's from an outage, is only
+    used while every better voice is unavailable, so it's remade once they're back.
+
+    Args:
+        speech (str): The text being spoken.
+
+    Returns:
+        tuple: The cached file's path and the options it was made with, or (None, None).
+    """
+    ranked = ttsBackends.rank(backends, len(speech), ttsBackend, ttsTimeout)
+    optionSets = []
+    for backend in sorted(backends, key=lambda b: (b.name != ttsBackend, b.qualityPenalty)):
+        optionSets.append(backend.options(synthesisSpeed()))
+        if ranked and backend is ranked[0]:
+            break # Nothing worse than the voice that would speak it now
+    return speechCache.lookup(speech, *optionSets)
 
 def generateFile(speech):
     """
-    Generates an MP3 audio file from the given text using OpenAI's Text-to-Speech (TTS) model.
-    The generated audio is saved to 'temp/speech.mp3'.
+    Generates an audio file from the given text with the best text-to-speech backend.
+    Speech that was made before is taken from the speech cache instead.
 
     Args:
         speech (str): The text content to be converted into speech.
+
+    Returns:
+        str: The path of the audio file, in the speech cache or at 'speechPath'.
     """
-    # Call OpenAI's audio speech creation API.
-    # 'model="tts-1"' specifies the TTS model to use.
-    # 'voice="fable"' selects a specific voice for the speech.
-    # 'input=speech' provides the text that will be spoken.
-    response = client.audio.speech.create(
-        model="tts-1",
-        voice="fable",
-        input=speech
-    )
-
-    # Define the output path for the MP3 file.
-    output_path = Path("temp/speech.mp3")
+    cachedPath, _ = cached(speech)
+    if cachedPath:
+        return cachedPath
+
+    # The backends fail over to each other, so this only raises if none can speak.
+    audio, options = ttsBackends.synthesize(backends, speech, synthesisSpeed(), ttsBackend, ttsTimeout)
+    return saveSpeech(speech, options, audio)
+
+async def generateFileAsync(speech):
+    """
+    Async version of generateFile() for the asyncio orchestrator.
+
+    Args:
+        speech (str): The text content to be converted into speech.
+
+    Returns:
+        str: The path of the audio file.
+    """
+    cachedPath, _ = cached(speech)
+    if cachedPath:
+        return cachedPath
+    audio, options = await ttsBackends.synthesizeAsync(backends, speech, synthesisSpeed(), ttsBackend, ttsTimeout)
+    return saveSpeech(speech, options, audio)
+
+def saveSpeech(speech, options, audio):
+    """
+    Keeps newly made speech in the speech cache, or writes it to 'speechPath' when the cache is off.
+
+    Args:
+        speech (str): The text that was spoken.
+        options (dict): The options it was made with, from the backend's options().
+        audio (bytes): The speech, in options["format"].
+
+    Returns:
+        str: The path of the audio file.
+    """
+    if speechCache.enabled:
+        return speechCache.store(speech, options, audio)
+
+    # Define the output path for the audio file.
+    output_path = Path(f"{speechPath}.{options['format']}")
     
     # Ensure the 'temp' directory exists.
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # Write the audio content received from the API to the MP3 file.
-    output_path.write_bytes(response.content)
+    # Write the audio content received from the backend to the file.
+    output_path.write_bytes(audio)
+    return str(output_path)
 
-def playSpeech():
+def decodeSpeech(audio, audioFormat):
     """
-    Plays the 'temp/speech.mp3' audio file.
-    Adjusts the playback speed and volume based on settings loaded from flickTools.
+    Turns speech into samples for the playback engine. Raw PCM is only reinterpreted;
+    anything else is decoded once with pydub.
+
+    Args:
+        audio (bytes): The speech.
+        audioFormat (str): Its format, e.g. "pcm", "mp3" or "wav".
+
+    Returns:
+        numpy.ndarray: Mono float32 samples at playback.rate.
     """
-    # Load the MP3 audio file into an AudioSegment object.
-    sound = AudioSegment.from_mp3("temp/speech.mp3")
+    if audioFormat == "pcm":
+        samples = np.frombuffer(audio, dtype="<i2")
+    else:
+        sound = AudioSegment.from_file(io.BytesIO(audio), format=audioFormat)
+        sound = sound.set_frame_rate(playback.rate).set_channels(1).set_sample_width(2)
+        samples = np.frombuffer(sound.raw_data, dtype="<i2")
+    return samples.astype(np.float32) / 32768
 
-    # Calculate the new frame rate based on the 'speed' setting.
-    # This effectively changes the playback speed without altering pitch.
-    newFrameRate = int(sound.frame_rate * settings["speed"])
-    
-    # Apply the new frame rate to the audio segment.
-    # ._spawn creates a new AudioSegment with the modified raw data and overrides.
-    # .set_frame_rate then sets the displayed frame rate to the original for proper playback interpretation
-    # by pydub's play function, while the speed change is handled by _spawn's raw data manipulation.
-    sound = sound._spawn(sound.raw_data, overrides={"frame_rate": newFrameRate}).set_frame_rate(sound.frame_rate)
-    
-    # Play the adjusted sound. The 'volumeIncr' setting is added to the sound
-    # which adjusts its decibels (volume).
-    play(sound + settings["volumeIncr"])
\ No newline at end of file
+def playSpeech(path, wait=True):
+    """
+    Plays an audio file through the playback engine, straight from the speech cache
+    when it came from there. Adjusts the playback speed and volume based on settings
+    loaded from flickTools, and records how long the first sample took to play.
+
+    Args:
+        path (str): The file returned by generateFile().
+        wait (bool): Whether to block until it has finished playing or was stopped.
+
+    Returns:
+        playback.Clip: The last clip of the speech.
+    """
+    # Read the whole file and turn it into samples in one go.
+    with open(path, "rb") as audioFile:
+        samples = decodeSpeech(audioFile.read(), os.path.splitext(path)[1].lstrip("."))
+
+    first, last = playSamples(samples, _generation)
+    if wait:
+        # Never wait forever on a sound card that stopped calling back.
+        seconds = len(samples) / playback.rate / (1 if speedAtSynthesis else speed()) + playbackMarginSeconds
+        if not first.started.wait(seconds):
+            print(f"TTS   | Speech didn't start playing within {seconds:.1f}s, stopping playback")
+            playback.stop()
+            return last
+        tracing.mark("audioStart", delay=first.startDelay)
+        if not last.wait(seconds):
+            print(f"TTS   | Speech didn't finish playing within {seconds:.1f}s, stopping playback")
+            playback.stop()
+    return last
+
+def playSamples(samples, generation=None, clips=None):
+    """
+    Queues speech on the playback engine block by block as its speed is adjusted,
+    so the first block plays while the rest is still being stretched. Stops early
+    if stopSpeech() is called meanwhile.
+
+    Args:
+        samples (numpy.ndarray): The speech's samples.
+        generation (int): The value of '_generation' when the speech was asked for.
+            Defaults to the current one.
+        clips (list): If given, every clip queued is added to it, e.g. to end them early.
+
+    Returns:
+        tuple: The first and last playback.Clip queued.
+    """
+    generation = _generation if generation is None else generation
+    first = last = None
+    playbackSpeed = 1 if speedAtSynthesis else speed()
+    for block in timeStretch.stretch(samples, playbackSpeed):
+        if generation != _generation:
+            break
+        last = playback.play(adjustSound(block))
+        first = first or last
+        if clips is not None:
+            clips.append(last)
+    if first is None:
+        first = last = playback.play(samples[:0]) # Already stopped: an empty clip that's done
+    return first, last
+
+def adjustSound(samples):
+    """
+    Applies the volume setting loaded from flickTools to a sound. The speed is
+    applied at synthesis or by timeStretch, which keep the pitch.
+
+    Args:
+        samples (numpy.ndarray): The sound's samples.
+
+    Returns:
+        numpy.ndarray: The adjusted samples, ready to play.
+    """
+    # The 'volumeIncr' setting adjusts the sound's volume in decibels.
+    return np.clip(samples * 10 ** (settings["volumeIncr"] / 20), -1, 1).astype(np.float32)
+
+def synthesize(speech):
+    """
+    Converts a piece of text into speech in memory, without writing a file.
+
+    Args:
+        speech (str): The text content to be converted into speech.
+
+    Returns:
+        numpy.ndarray: The speech's samples, ready for playSamples().
+    """
+    # Sentences said before, like "Boom. Triangle solved.", come from the speech cache.
+    cachedPath, options = cached(speech)
+    if cachedPath:
+        with open(cachedPath, "rb") as audioFile:
+            return decodeSpeech(audioFile.read(), options["format"])
+    audio, options = ttsBackends.synthesize(backends, speech, synthesisSpeed(), ttsBackend, ttsTimeout)
+    if speechCache.enabled:
+        speechCache.store(speech, options, audio)
+    return decodeSpeech(audio, options["format"])
+
+def queueSpeech(speech):
+    """
+    Starts synthesizing a sentence in the background and queues it for playback.
+    Queued sentences are played one after another in the order they were queued,
+    with no gap between them, while later ones are still being synthesized.
+
+    Args:
+        speech (str): The sentence to speak.
+    """
+    global _playbackThread
+    # Start the playback worker the first time speech is streamed.
+    if _playbackThread is None:
+        _playbackThread = threading.Thread(target=_playbackWorker, daemon=True)
+        _playbackThread.start()
+    _playbackQueue.put((_generation, _synthesisPool.submit(synthesize, speech)))
+
+def waitForSpeech():
+    """
+    Blocks until every queued sentence has been played, or stops playback if the
+    sound card stops calling back.
+    """
+    _playbackQueue.join()
+    # Never wait forever: allow the length of what's queued, plus the margin.
+    seconds = playback.queuedSeconds() + playbackMarginSeconds
+    if not playback.wait(seconds):
+        print(f"TTS   | Speech didn't finish playing within {seconds:.1f}s, stopping playback")
+        playback.stop()
+
+def stopSpeech():
+    """
+    Stops whatever Flick is saying, including streamed sentences that haven't
+    been synthesized yet. Called when the student starts talking again.
+    """
+    global _generation
+    _generation += 1
+    playback.stop()
+
+def _playbackWorker():
+    """
+    Hands queued sentences to the playback engine in order as soon as each one has
+    been synthesized. The engine plays them back to back.
+    """
+    while True:
+        generation, future = _playbackQueue.get()
+        try:
+            samples = future.result()
+            if generation == _generation: # Skip sentences from before the last stopSpeech()
+                playSamples(samples, generation)
+        except Exception as e:
+            # Skip a sentence that failed to synthesize rather than stalling the queue.
+            print(f"TTS   | Sentence playback error: {e}")
+        finally:
+            _playbackQueue.task_done()
+
+# The student talking over Flick stops the speech.
+events.subscribe(events.LISTENING_STARTED, stopSpeech)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import flickTools
+import tracing
+
+# Load settings using flickTools. 'speechCache' keeps every piece of speech that's made
+# on disk, named by a hash of its text and the options it was made with (backend, voice,
+# format, speed), so the same words are never synthesized twice: repeated answers, "say that again", and sentences Flick
+# uses a lot.
+# The least recently played files are deleted once the cache is over 'speechCacheMegabytes'.
+settings = flickTools.loadSettings()
+enabled = settings.get("speechCache", True)
+maxBytes = settings.get("speechCacheMegabytes", 100) * 1024 * 1024
+cacheFolder = "resources/speechCache"
+
+# The cached files by name, with their size and when they were last played. The play
+# time is also kept as the file's modification time, so the order survives a restart
+# without an index file.
+_lock = threading.Lock()
+_files = {}
+_totalBytes = 0
+
+# Counts for the hit rate and the bytes that didn't have to be downloaded again.
+stats = {"hits": 0, "misses": 0, "bytesSaved": 0}
+
+def key(text, options):
+    """
+    Names the speech for some text. Anything that changes the audio is part of the hash.
+
+    Args:
+        text (str): The text being spoken.
+        options (dict): The TTS options the speech is made with, e.g. backend, voice,
+            "format" and speed.
+
+    Returns:
+        str: The file name, a SHA-256 hex digest with the audio format as its extension.
+    """
+    described = json.dumps(options, sort_keys=True) + "\0" + text
+    return hashlib.sha256(described.encode("utf-8")).hexdigest() + "." + options.get("format", "mp3")
+
+def load():
+    """
+    Reads the cache folder into the index. Temporary files left by an interrupted write are deleted.
+    """
+    global _files, _totalBytes
+    files = {}
+    os.makedirs(cacheFolder, exist_ok=True)
+    for entry in os.scandir(cacheFolder):
+        if entry.name.endswith(".tmp"):
+            os.remove(entry.path)
+        elif entry.is_file():
+            stat = entry.stat()
+            files[entry.name] = {"size": stat.st_size, "used": stat.st_mtime}
+    with _lock:
+        _files = files
+        _totalBytes = sum(file["size"] for file in files.values())
+
+def lookup(text, *optionSets):
+    """
+    Looks for speech that's already been made for some text. Several option sets can
+    be given, e.g. one per TTS backend, and the first one found is used; it still
+    counts as a single lookup.
+
+    Args:
+        text (str): The text being spoken.
+        *optionSets (dict): The TTS options the speech may have been made with, best first.
+
+    Returns:
+        tuple: The path of the cached audio and the options it was made with, or (None, None) on a miss.
+    """
+    if not enabled:
+        return None, None
+    with _lock:
+        for options in optionSets:
+            name = key(text, options)
+            path = os.path.join(cacheFolder, name)
+            file = _files.get(name)
+            if file is not None and os.path.exists(path):
+                break
+            _files.pop(name, None)
+        else:
+            stats["misses"] += 1
+            return None, None
+        now = time.time()
+        file["used"] = now
+        os.utime(path, (now, now)) # Mark it as recently played for eviction after a restart
+        stats["hits"] += 1
+        stats["bytesSaved"] += file["size"]
+    tracing.mark("speechCache", bytesSaved=file["size"])
+    print(f"TTS   | Speech cache hit, {hitRate():.0%} of {stats['hits'] + stats['misses']} lookups, "
+          f"{stats['bytesSaved'] / 1024:.0f} KB saved")
+    return path, options
+
+def store(text, options, audio):
+    """
+    Saves newly made speech. The file is written under a temporary name and moved
+    into place, so a crash can't leave a half-written file to be played later.
+
+    Args:
+        text (str): The text being spoken.
+        options (dict): The TTS options the speech was made with.
+        audio (bytes): The speech.
+
+    Returns:
+        str: The path of the cached audio.
+    """
+    global _totalBytes
+    name = key(text, options)
+    path = os.path.join(cacheFolder, name)
+    os.makedirs(cacheFolder, exist_ok=True)
+    temporary = f"{path}.{threading.get_ident()}.tmp" # Per thread, as streamed sentences are made in parallel
+    with open(temporary, "wb") as file:
+        file.write(audio)
+    os.replace(temporary, path)
+    with _lock:
+        previous = _files.get(name)
+        _totalBytes += len(audio) - (previous["size"] if previous else 0)
+        _files[name] = {"size": len(audio), "used": time.time()}
+        evict(keep=name)
+    return path
+
+def evict(keep=None):
+    """
+    Deletes the least recently played files until the cache is within its size limit.
+    Call with the lock held.
+
+    Args:
+        keep (str): A file that mustn't be deleted, because it's about to be played.
+    """
+    global _totalBytes
+    if _totalBytes <= maxBytes:
+        return
+    for name in sorted(_files, key=lambda name: _files[name]["used"]):
+        if _totalBytes <= maxBytes:
+            break
+        if name == keep:
+            continue
+        _totalBytes -= _files.pop(name)["size"]
+        try:
+            os.remove(os.path.join(cacheFolder, name))
+        except FileNotFoundError:
+            pass
+
+def hitRate():
+    """
+    Works out the share of lookups answered from the cache.
+
+    Returns:
+        float: The hit rate from 0 to 1, or 0 before any lookups.
+    """
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+load()
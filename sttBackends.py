@@ -0,0 +1,284 @@
+import abc
+import asyncio
+import collections
+import threading
+import time
+import numpy as np
+import apiClients
+
+# How long a backend is skipped after it fails.
+failureCooldown = 30
+
+class Backend(abc.ABC):
+    """
+    A speech-to-text engine. Each backend keeps the latencies it has measured, so
+    the fastest one for a recording's length can be picked before sending it.
+
+    A recording is a dictionary with:
+        "file": a (filename, bytes) pair of encoded 16 kHz mono audio,
+        "pcm": the same audio as a 16 kHz int16 numpy array,
+        "seconds": its length in seconds.
+    """
+    name = "backend"
+    # Guessed fixed cost and cost per second of audio, used until enough latencies are measured.
+    priorOverhead = 1.0
+    priorPerSecond = 0.1
+
+    def __init__(self):
+        self._latencies = collections.deque(maxlen=20) # Recent (seconds of audio, seconds taken) pairs
+        self._downUntil = 0
+
+    def available(self):
+        """
+        Checks whether the backend can be used right now.
+
+        Returns:
+            bool: False while the backend is cooling down after a failure.
+        """
+        return time.monotonic() >= self._downUntil
+
+    def estimate(self, seconds):
+        """
+        Predicts how long transcribing a recording will take, with a straight-line
+        fit of the measured latencies against recording length.
+
+        Args:
+            seconds (float): The length of the recording.
+
+        Returns:
+            float: The predicted latency in seconds.
+        """
+        samples = list(self._latencies)
+        lengths = np.array([s[0] for s in samples])
+        if len(samples) >= 3 and np.ptp(lengths) > 0.5:
+            perSecond, overhead = np.polyfit(lengths, [s[1] for s in samples], 1)
+            return max(0.0, overhead) + max(0.0, perSecond) * seconds
+        if samples:
+            # Not enough spread in lengths for a fit yet: scale the prior to the average measured latency.
+            measured = np.mean([s[1] for s in samples])
+            predicted = np.mean([self.priorOverhead + self.priorPerSecond * s[0] for s in samples])
+            return (self.priorOverhead + self.priorPerSecond * seconds) * measured / predicted
+        return self.priorOverhead + self.priorPerSecond * seconds
+
+    def record(self, seconds, latency):
+        """
+        Stores a measured latency.
+
+        Args:
+            seconds (float): The length of the recording.
+            latency (float): How long the transcription took.
+        """
+        self._latencies.append((seconds, latency))
+
+    def markDown(self):
+        """
+        Takes the backend out of rotation for 'failureCooldown' seconds.
+        """
+        self._downUntil = time.monotonic() + failureCooldown
+
+    @abc.abstractmethod
+    def transcribe(self, recording):
+        """
+        Transcribes a recording.
+
+        Args:
+            recording (dict): The recording, as described on the class.
+
+        Returns:
+            str: The transcribed text.
+        """
+
+    async def transcribeAsync(self, recording):
+        """
+        Async version of transcribe(). Runs it in a worker thread unless the backend overrides it.
+
+        Args:
+            recording (dict): The recording, as described on the class.
+
+        Returns:
+            str: The transcribed text.
+        """
+        return await asyncio.to_thread(self.transcribe, recording)
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI's hosted Whisper model. Accurate, but every request pays a network round trip.
+    """
+    name = "openai"
+    priorOverhead = 1.5
+    priorPerSecond = 0.05
+
+    def __init__(self, client, asyncClient=None):
+        super().__init__()
+        self.client = client
+        self.asyncClient = asyncClient
+        self.online() # Start the first connectivity check in the background
+
+    def available(self):
+        return super().available() and self.online()
+
+    def address(self):
+        """
+        Returns:
+            tuple: The API server's host and port.
+        """
+        url = self.client.base_url
+        return url.host, url.port or (443 if url.scheme == "https" else 80)
+
+    def online(self):
+        """
+        Checks that the API server could be reached, from a connectivity check that's
+        refreshed in the background (see apiClients.reachable()), so it never blocks a turn.
+
+        Returns:
+            bool: False if the last check couldn't connect.
+        """
+        return apiClients.reachable(*self.address())
+
+    def markDown(self):
+        super().markDown()
+        apiClients.recheckReachable(*self.address()) # Check the connection again before the cooldown is over
+
+    def transcribe(self, recording):
+        return apiClients.call("transcribe", self.client.audio.transcriptions.create,
+                               model="whisper-1", file=recording["file"]).text
+
+    async def transcribeAsync(self, recording):
+        if self.asyncClient is None:
+            return await super().transcribeAsync(recording)
+        # The async client lets the orchestrator abort a stalled upload.
+        transcript = await apiClients.callAsync("transcribe", self.asyncClient.audio.transcriptions.create,
+                                                model="whisper-1", file=recording["file"])
+        return transcript.text
+
+class WhisperCppBackend(Backend):
+    """
+    A small Whisper model run on the CPU with whisper.cpp (the pywhispercpp package).
+    The model is loaded once in the background and warmed up, so the first turn
+    doesn't pay for loading it. Without pywhispercpp the backend is never available.
+    """
+    name = "local"
+    priorOverhead = 0.3
+    priorPerSecond = 0.5
+
+    def __init__(self, modelName="tiny.en", threads=4):
+        super().__init__()
+        self.modelName = modelName
+        self.threads = threads
+        self._model = None
+        self._lock = threading.Lock() # whisper.cpp contexts can only run one transcription at a time
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        """
+        Loads the model and runs it once on a second of silence to warm it up.
+        """
+        try:
+            from pywhispercpp.model import Model
+        except ImportError:
+            print("STT   | pywhispercpp isn't installed, on-device transcription is off")
+            return
+        try:
+            start = time.perf_counter()
+            model = Model(self.modelName, n_threads=self.threads, print_progress=False, print_realtime=False)
+            model.transcribe(np.zeros(16000, dtype=np.float32))
+            self._model = model
+            print(f"STT   | Loaded on-device model {self.modelName} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"STT   | Couldn't load on-device model {self.modelName}: {e}")
+
+    def available(self):
+        return self._model is not None and super().available()
+
+    def transcribe(self, recording):
+        audio = recording["pcm"].astype(np.float32) / 32768
+        with self._lock:
+            segments = self._model.transcribe(audio)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+def rank(backends, seconds, preferred="auto"):
+    """
+    Orders the available backends from fastest to slowest for a recording.
+
+    Args:
+        backends (list): The backends to choose from.
+        seconds (float): The length of the recording.
+        preferred (str): A backend name to always try first, or "auto".
+
+    Returns:
+        list: The available backends, best first.
+    """
+    usable = [b for b in backends if b.available()]
+    return sorted(usable, key=lambda b: (b.name != preferred, b.estimate(seconds)))
+
+def transcribe(backends, recording, preferred="auto"):
+    """
+    Transcribes a recording with the backend expected to be fastest, failing
+    over to the next one if it errors.
+
+    Args:
+        backends (list): The backends to choose from.
+        recording (dict): The recording, as described on Backend.
+        preferred (str): A backend name to always try first, or "auto".
+
+    Returns:
+        str: The transcribed text.
+
+    Raises:
+        RuntimeError: If no backend could transcribe the recording.
+    """
+    for backend in _choose(backends, recording, preferred):
+        start = time.perf_counter()
+        try:
+            text = backend.transcribe(recording)
+        except Exception as e:
+            print(f"STT   | {backend.name} failed: {e}")
+            backend.markDown()
+            continue
+        backend.record(recording["seconds"], time.perf_counter() - start)
+        return text
+    raise RuntimeError("No speech-to-text backend could transcribe the recording")
+
+async def transcribeAsync(backends, recording, preferred="auto"):
+    """
+    Async version of transcribe().
+
+    Args:
+        backends (list): The backends to choose from.
+        recording (dict): The recording, as described on Backend.
+        preferred (str): A backend name to always try first, or "auto".
+
+    Returns:
+        str: The transcribed text.
+
+    Raises:
+        RuntimeError: If no backend could transcribe the recording.
+    """
+    for backend in _choose(backends, recording, preferred):
+        start = time.perf_counter()
+        try:
+            text = await backend.transcribeAsync(recording)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"STT   | {backend.name} failed: {e}")
+            backend.markDown()
+            continue
+        backend.record(recording["seconds"], time.perf_counter() - start)
+        return text
+    raise RuntimeError("No speech-to-text backend could transcribe the recording")
+
+def _choose(backends, recording, preferred):
+    """
+    Ranks the backends for a recording and logs the choice.
+
+    Returns:
+        list: The available backends best first, or all of them if none look available.
+    """
+    ranked = rank(backends, recording["seconds"], preferred)
+    if not ranked:
+        # Nothing looks usable, e.g. the connectivity check failed behind a proxy. Try anyway.
+        return list(backends)
+    estimates = ", ".join(f"{b.name} {b.estimate(recording['seconds']):.2f}s" for b in ranked)
+    print(f"STT   | Using {ranked[0].name} for {recording['seconds']:.1f}s of audio (estimates: {estimates})")
+    return ranked
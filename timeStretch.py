@@ -0,0 +1,77 @@
+import numpy as np
+
+# Changes how fast speech plays without changing its pitch, with WSOLA (waveform
+# similarity overlap-add): short windows of the sound are laid down at the normal
+# spacing but taken from further apart (to speed up) or closer together (to slow
+# down), each one nudged to where it best lines up with the last so the waveform
+# stays continuous. Resampling, which the old 'speed' setting did, shifts the pitch.
+rate = 24000
+frameLength = 960   # 40 ms windows, long enough to hold a few pitch periods of a voice
+hop = frameLength // 2
+tolerance = 240     # How far, in samples, a window may be nudged to line up
+searchStep = 4      # Only every 4th sample is compared when lining up, which is plenty at 24 kHz
+
+# A periodic Hann window, whose copies at half-window spacing add up to exactly 1.
+window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frameLength) / frameLength)).astype(np.float32)
+
+def stretch(samples, speed, blockSeconds=0.25):
+    """
+    Speeds speech up or slows it down, keeping its pitch. The result is made in
+    blocks, so the first one can start playing while the rest is worked out.
+
+    Args:
+        samples (numpy.ndarray): Mono float32 samples at 'rate'.
+        speed (float): How fast to play, e.g. 0.8 for 80% speed.
+        blockSeconds (float): Roughly how much audio to yield at a time.
+
+    Yields:
+        numpy.ndarray: The next block of stretched samples.
+    """
+    if speed == 1 or len(samples) < frameLength:
+        yield samples
+        return
+
+    # Pad the start so the first window is centred on the first sample, and the end so
+    # every window and search region stays inside the array.
+    start = tolerance + hop
+    padded = np.concatenate([np.zeros(start, np.float32), samples,
+                             np.zeros(2 * frameLength + 2 * tolerance + int(hop * speed), np.float32)])
+    outLength = int(len(samples) / speed)
+    frames = (outLength + hop) // hop + 1
+    blockLength = max(hop, int(blockSeconds * rate))
+
+    overlap = np.zeros(frameLength, np.float32)
+    pieces = []
+    pending = 0
+    produced = -hop # The first hop is the padding's half-window ramp, which is dropped
+    previous = None
+    for k in range(frames):
+        ideal = tolerance + int(k * hop * speed)
+        if previous is None:
+            position = ideal
+        else:
+            # Find the window near the ideal position that best continues the last one.
+            natural = padded[previous + hop:previous + hop + frameLength:searchStep]
+            region = padded[ideal - tolerance:ideal + tolerance + frameLength:searchStep]
+            position = ideal - tolerance + searchStep * int(np.argmax(np.correlate(region, natural, "valid")))
+        overlap += padded[position:position + frameLength] * window
+        previous = position
+
+        # The first half of the overlap is complete once this window is added.
+        finished = overlap[:hop].copy()
+        overlap[:hop] = overlap[hop:]
+        overlap[hop:] = 0
+        if produced < 0:
+            produced += hop
+            continue
+        finished = finished[:max(0, outLength - produced)]
+        produced += len(finished)
+        pieces.append(finished)
+        pending += len(finished)
+        if pending >= blockLength:
+            yield np.concatenate(pieces)
+            pieces, pending = [], 0
+        if produced >= outLength:
+            break
+    if pieces:
+        yield np.concatenate(pieces)
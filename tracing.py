@@ -0,0 +1,145 @@
+import collections
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+import flickTools
+
+# Load settings using flickTools. 'traceFile' and 'traceBufferSize' control where
+# the per-turn breakdowns are written and how many spans are kept in memory.
+settings = flickTools.loadSettings()
+traceFile = settings.get("traceFile", "temp/trace.json")
+
+# Ring buffer of finished spans. Old spans fall off the end so memory stays bounded.
+_spans = collections.deque(maxlen=settings.get("traceBufferSize", 1000))
+
+# The turn new spans belong to, and when it started on the perf_counter clock.
+_turnId = 0
+_turnStart = time.perf_counter()
+_lock = threading.Lock()
+
+def startTurn():
+    """
+    Starts a new turn. Spans recorded from now on are grouped under it.
+
+    Returns:
+        int: The id of the new turn.
+    """
+    global _turnId, _turnStart
+    with _lock:
+        _turnId += 1
+        _turnStart = time.perf_counter()
+        return _turnId
+
+def endTurn():
+    """
+    Ends the current turn, prints its breakdown and writes the trace file.
+    """
+    turn = next((t for t in turnBreakdowns() if t["turn"] == _turnId), None)
+    if turn:
+        stages = ", ".join(f"{s['name']} {s['duration']:.2f}s" for s in turn["spans"])
+        print(f"TRACE | Turn {turn['turn']} took {turn['total']:.2f}s: {stages}")
+    dump()
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Times one stage of the current turn.
+    The yielded dictionary can be filled in during the stage with sizes such as
+    bytesSent, bytesReceived or responseSize.
+
+    Args:
+        name (str): The name of the stage, e.g. "transcribe".
+        **attributes: Extra values to store with the span.
+
+    Yields:
+        dict: The span record.
+    """
+    record = dict(attributes)
+    record["name"] = name
+    record["turn"] = _turnId
+    start = time.perf_counter()
+    record["start"] = start - _turnStart # Seconds since the turn started
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start
+        record["end"] = record["start"] + record["duration"]
+        _spans.append(record)
+
+def mark(name, **attributes):
+    """
+    Records a moment in the current turn, such as the first sentence being queued.
+
+    Args:
+        name (str): The name of the moment.
+        **attributes: Extra values to store with the mark.
+    """
+    with span(name, **attributes):
+        pass
+
+def percentile(values, fraction):
+    """
+    Finds a percentile of a list of numbers using the nearest-rank method.
+
+    Args:
+        values (list): The numbers.
+        fraction (float): The percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        float: The percentile, or None if the list is empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def turnBreakdowns():
+    """
+    Groups the spans in the ring buffer by turn.
+
+    Returns:
+        list: One dictionary per turn with its spans and total duration.
+    """
+    turns = {}
+    for record in list(_spans):
+        turns.setdefault(record["turn"], []).append(record)
+    breakdowns = []
+    for turnId, spans in sorted(turns.items()):
+        spans.sort(key=lambda s: s["start"])
+        total = max(s["end"] for s in spans) - min(s["start"] for s in spans)
+        breakdowns.append({"turn": turnId, "total": total, "spans": spans})
+    return breakdowns
+
+def summary():
+    """
+    Summarizes the duration of each stage across the spans in the ring buffer.
+
+    Returns:
+        dict: Maps each stage name to its count, p50 and p95 in seconds.
+    """
+    durations = {}
+    for record in list(_spans):
+        durations.setdefault(record["name"], []).append(record["duration"])
+    totals = [t["total"] for t in turnBreakdowns()]
+    if totals:
+        durations["turn"] = totals
+    return {name: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+            for name, values in durations.items()}
+
+def dump(path=None):
+    """
+    Writes the per-turn breakdowns and stage summaries to a JSON file.
+
+    Args:
+        path (str): Where to write the file. Defaults to the 'traceFile' setting.
+    """
+    path = path or traceFile
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"turns": turnBreakdowns(), "summary": summary()}, file, indent=2)
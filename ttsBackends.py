@@ -0,0 +1,440 @@
+import abc
+import asyncio
+import collections
+import concurrent.futures
+import io
+import shutil
+import subprocess
+import threading
+import time
+import wave
+import numpy as np
+import apiClients
+
+# How long a backend is skipped after it fails.
+failureCooldown = 30
+
+# Synchronous syntheses run here so one that stalls can be given up on. A backend
+# that's given up on keeps its thread until its own timeout, so there are spare workers.
+_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+def wavBytes(pcm, rate):
+    """
+    Wraps 16-bit mono samples in a WAV file.
+
+    Args:
+        pcm (bytes): The samples.
+        rate (int): Their sample rate.
+
+    Returns:
+        bytes: The WAV file.
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wavFile:
+        wavFile.setnchannels(1)
+        wavFile.setsampwidth(2)
+        wavFile.setframerate(rate)
+        wavFile.writeframes(pcm)
+    return buffer.getvalue()
+
+class Backend(abc.ABC):
+    """
+    A text-to-speech engine. Each backend keeps the latencies it has measured, so
+    one that would miss the deadline can be passed over before sending it.
+    """
+    name = "backend"
+    audioFormat = "wav"
+    # Guessed fixed cost and cost per character, used until enough latencies are measured.
+    priorOverhead = 1.0
+    priorPerChar = 0.005
+    # How much worse the voice is than the best one, as seconds of extra latency
+    # worth accepting to avoid it. Lower is a better voice. It orders the voices, and
+    # is added to the estimate when ordering the fallbacks.
+    qualityPenalty = 0.0
+
+    def __init__(self):
+        self._latencies = collections.deque(maxlen=20) # Recent (characters, seconds taken) pairs
+        self._downUntil = 0
+
+    def available(self):
+        """
+        Checks whether the backend can be used right now.
+
+        Returns:
+            bool: False while the backend is cooling down after a failure.
+        """
+        return time.monotonic() >= self._downUntil
+
+    def estimate(self, chars):
+        """
+        Predicts how long synthesizing some text will take, with a straight-line
+        fit of the measured latencies against text length.
+
+        Args:
+            chars (int): The length of the text.
+
+        Returns:
+            float: The predicted latency in seconds.
+        """
+        samples = list(self._latencies)
+        lengths = np.array([s[0] for s in samples])
+        if len(samples) >= 3 and np.ptp(lengths) > 50:
+            perChar, overhead = np.polyfit(lengths, [s[1] for s in samples], 1)
+            return max(0.0, overhead) + max(0.0, perChar) * chars
+        if samples:
+            # Not enough spread in lengths for a fit yet: scale the prior to the average measured latency.
+            measured = np.mean([s[1] for s in samples])
+            predicted = np.mean([self.priorOverhead + self.priorPerChar * s[0] for s in samples])
+            return (self.priorOverhead + self.priorPerChar * chars) * measured / predicted
+        return self.priorOverhead + self.priorPerChar * chars
+
+    def record(self, chars, latency):
+        """
+        Stores a measured latency.
+
+        Args:
+            chars (int): The length of the text.
+            latency (float): How long the synthesis took.
+        """
+        self._latencies.append((chars, latency))
+
+    def markDown(self):
+        """
+        Takes the backend out of rotation for 'failureCooldown' seconds.
+        """
+        self._downUntil = time.monotonic() + failureCooldown
+
+    def options(self, speed):
+        """
+        Describes the speech this backend makes, for the speech cache key.
+
+        Args:
+            speed (float): The speaking speed, where 1 is normal.
+
+        Returns:
+            dict: Everything that changes the audio, including its "format".
+        """
+        return {"backend": self.name, "format": self.audioFormat, "speed": speed}
+
+    @abc.abstractmethod
+    def synthesize(self, text, speed):
+        """
+        Converts text into speech.
+
+        Args:
+            text (str): The text to speak.
+            speed (float): The speaking speed, where 1 is normal.
+
+        Returns:
+            bytes: The speech, in 'audioFormat'.
+        """
+
+    async def synthesizeAsync(self, text, speed):
+        """
+        Async version of synthesize(). Runs it in a worker thread unless the backend overrides it.
+
+        Args:
+            text (str): The text to speak.
+            speed (float): The speaking speed, where 1 is normal.
+
+        Returns:
+            bytes: The speech, in 'audioFormat'.
+        """
+        return await asyncio.to_thread(self.synthesize, text, speed)
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI's hosted TTS. The best voice, but every request pays a network round trip.
+    Raw PCM is asked for by default, so it plays without decoding.
+    """
+    name = "openai"
+    priorOverhead = 0.8
+    priorPerChar = 0.004
+    qualityPenalty = 0.0
+
+    def __init__(self, client, asyncClient=None, model="tts-1", voice="fable", audioFormat="pcm"):
+        super().__init__()
+        self.client = client
+        self.asyncClient = asyncClient
+        self.model = model
+        self.voice = voice
+        self.audioFormat = audioFormat
+        apiClients.reachable(*self.address()) # Start the first connectivity check in the background
+
+    def address(self):
+        """
+        Returns:
+            tuple: The API server's host and port, for the connectivity check.
+        """
+        url = self.client.base_url
+        return url.host, url.port or (443 if url.scheme == "https" else 80)
+
+    def available(self):
+        # The connectivity check is refreshed in the background, so ranking never waits on it.
+        return super().available() and apiClients.reachable(*self.address())
+
+    def markDown(self):
+        super().markDown()
+        apiClients.recheckReachable(*self.address()) # Check the connection again before the cooldown is over
+
+    def options(self, speed):
+        return dict(super().options(speed), model=self.model, voice=self.voice)
+
+    def request(self, text, speed):
+        """
+        Builds the arguments for the speech API.
+        """
+        return {"model": self.model, "voice": self.voice, "response_format": self.audioFormat,
+                "speed": speed, "input": text}
+
+    def synthesize(self, text, speed):
+        return apiClients.call("speech", self.client.audio.speech.create, **self.request(text, speed)).content
+
+    async def synthesizeAsync(self, text, speed):
+        if self.asyncClient is None:
+            return await super().synthesizeAsync(text, speed)
+        # The async client lets the orchestrator abort a stalled synthesis.
+        response = await apiClients.callAsync("speech", self.asyncClient.audio.speech.create, **self.request(text, speed))
+        return response.content
+
+class EdgeBackend(Backend):
+    """
+    Microsoft Edge's online neural voices, through the edge-tts package. Free and
+    quick, a close second to OpenAI's voice. Without edge-tts the backend is never available.
+    """
+    name = "edge"
+    audioFormat = "mp3"
+    host = "speech.platform.bing.com"
+    priorOverhead = 0.6
+    priorPerChar = 0.003
+    qualityPenalty = 0.5
+
+    def __init__(self, voice="en-GB-RyanNeural"):
+        super().__init__()
+        self.voice = voice
+        try:
+            import edge_tts
+            self._edgeTts = edge_tts
+        except ImportError:
+            self._edgeTts = None
+            print("TTS   | edge-tts isn't installed, Edge voices are off")
+
+    def available(self):
+        return self._edgeTts is not None and super().available() and apiClients.reachable(self.host)
+
+    def markDown(self):
+        super().markDown()
+        apiClients.recheckReachable(self.host)
+
+    def options(self, speed):
+        return dict(super().options(speed), voice=self.voice)
+
+    def synthesize(self, text, speed):
+        return asyncio.run(self.synthesizeAsync(text, speed)) # Only called from threads without an event loop
+
+    async def synthesizeAsync(self, text, speed):
+        # edge-tts only has an async API, so this is the real implementation.
+        rate = f"{round((speed - 1) * 100):+d}%" # e.g. "-20%" for 0.8
+        communicate = self._edgeTts.Communicate(text, self.voice, rate=rate)
+        audio = bytearray()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        if not audio:
+            raise RuntimeError("edge-tts returned no audio")
+        return bytes(audio)
+
+class PiperBackend(Backend):
+    """
+    A Piper neural voice run on the CPU (the piper-tts package), for when the unit
+    is offline. The voice is loaded once in the background. Without piper-tts or
+    the model file the backend is never available.
+    """
+    name = "piper"
+    priorOverhead = 0.2
+    priorPerChar = 0.015
+    qualityPenalty = 1.5
+
+    def __init__(self, modelPath):
+        super().__init__()
+        self.modelPath = modelPath
+        self._voice = None
+        self._lock = threading.Lock() # One synthesis at a time keeps the Pi's cores for the rest of the turn
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        """
+        Loads the voice model.
+        """
+        try:
+            from piper import PiperVoice
+        except ImportError:
+            print("TTS   | piper-tts isn't installed, Piper voices are off")
+            return
+        try:
+            start = time.perf_counter()
+            self._voice = PiperVoice.load(self.modelPath)
+            print(f"TTS   | Loaded Piper voice {self.modelPath} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"TTS   | Couldn't load Piper voice {self.modelPath}: {e}")
+
+    def available(self):
+        return self._voice is not None and super().available()
+
+    def options(self, speed):
+        return dict(super().options(speed), model=self.modelPath)
+
+    def synthesize(self, text, speed):
+        with self._lock:
+            if hasattr(self._voice, "synthesize_stream_raw"):
+                # piper-tts 1.2
+                pcm = b"".join(self._voice.synthesize_stream_raw(text, length_scale=1 / speed))
+            else:
+                # piper-tts 1.3 and later
+                from piper import SynthesisConfig
+                chunks = self._voice.synthesize(text, syn_config=SynthesisConfig(length_scale=1 / speed))
+                pcm = b"".join(chunk.audio_int16_bytes for chunk in chunks)
+        return wavBytes(pcm, self._voice.config.sample_rate)
+
+class EspeakBackend(Backend):
+    """
+    The espeak-ng synthesizer. Robotic, but it's tiny, runs anywhere and answers in
+    a few tens of milliseconds, so there's always a voice even offline. Without the
+    espeak-ng (or espeak) program the backend is never available.
+    """
+    name = "espeak"
+    priorOverhead = 0.05
+    priorPerChar = 0.0005
+    qualityPenalty = 4.0
+    wordsPerMinute = 175 # espeak's normal speed
+
+    def __init__(self, voice="en-us"):
+        super().__init__()
+        self.voice = voice
+        self.program = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self):
+        return self.program is not None and super().available()
+
+    def options(self, speed):
+        return dict(super().options(speed), voice=self.voice)
+
+    def synthesize(self, text, speed):
+        result = subprocess.run(
+            [self.program, "--stdout", "-v", self.voice, "-s", str(int(self.wordsPerMinute * speed)), "--", text],
+            capture_output=True, timeout=30, check=True)
+        return result.stdout
+
+def rank(backends, chars, preferred="auto", timeout=8):
+    """
+    Orders the available backends for some text. The preferred backend, or else the
+    best voice, goes first unless it's down or expected to take longer than 'timeout',
+    so Flick doesn't change voice with the length of an answer. The rest follow by
+    expected latency plus each voice's quality penalty, as the order to fail over in.
+
+    Args:
+        backends (list): The backends to choose from.
+        chars (int): The length of the text.
+        preferred (str): A backend name to always try first, or "auto".
+        timeout (float): The longest a backend should be expected to take to go first.
+
+    Returns:
+        list: The available backends, best first.
+    """
+    usable = [b for b in backends if b.available()]
+    fallbacks = sorted(usable, key=lambda b: b.estimate(chars) + b.qualityPenalty)
+    for backend in sorted(usable, key=lambda b: (b.name != preferred, b.qualityPenalty)):
+        if backend.name == preferred or backend.estimate(chars) <= timeout:
+            return [backend] + [b for b in fallbacks if b is not backend]
+    return fallbacks
+
+def deadline(backend, chars, timeout):
+    """
+    Works out how long to wait for a backend before failing over to the next one.
+
+    Args:
+        backend (Backend): The backend.
+        chars (int): The length of the text.
+        timeout (float): The shortest wait.
+
+    Returns:
+        float: 'timeout', or twice the backend's estimate for long text on a slow backend.
+    """
+    return max(timeout, 2 * backend.estimate(chars))
+
+def synthesize(backends, text, speed, preferred="auto", timeout=8):
+    """
+    Converts text into speech with the best backend, failing over to the next one
+    if it errors or doesn't answer in time.
+
+    Args:
+        backends (list): The backends to choose from.
+        text (str): The text to speak.
+        speed (float): The speaking speed, where 1 is normal.
+        preferred (str): A backend name to always try first, or "auto".
+        timeout (float): Seconds to wait for a backend before trying the next, see deadline().
+
+    Returns:
+        tuple: The speech as bytes and the backend's options() it was made with.
+
+    Raises:
+        RuntimeError: If no backend could synthesize the text.
+    """
+    for backend in _choose(backends, text, preferred, timeout):
+        start = time.perf_counter()
+        try:
+            audio = _pool.submit(backend.synthesize, text, speed).result(timeout=deadline(backend, len(text), timeout))
+        except Exception as e:
+            print(f"TTS   | {backend.name} failed: {e or type(e).__name__}")
+            backend.markDown()
+            continue
+        backend.record(len(text), time.perf_counter() - start)
+        return audio, backend.options(speed)
+    raise RuntimeError("No text-to-speech backend could synthesize the text")
+
+async def synthesizeAsync(backends, text, speed, preferred="auto", timeout=8):
+    """
+    Async version of synthesize(). A backend that misses its deadline is cancelled,
+    which aborts its request, before failing over to the next.
+
+    Args:
+        backends (list): The backends to choose from.
+        text (str): The text to speak.
+        speed (float): The speaking speed, where 1 is normal.
+        preferred (str): A backend name to always try first, or "auto".
+        timeout (float): Seconds to wait for a backend before trying the next, see deadline().
+
+    Returns:
+        tuple: The speech as bytes and the backend's options() it was made with.
+
+    Raises:
+        RuntimeError: If no backend could synthesize the text.
+    """
+    for backend in _choose(backends, text, preferred, timeout):
+        start = time.perf_counter()
+        try:
+            audio = await asyncio.wait_for(backend.synthesizeAsync(text, speed), deadline(backend, len(text), timeout))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"TTS   | {backend.name} failed: {e or type(e).__name__}")
+            backend.markDown()
+            continue
+        backend.record(len(text), time.perf_counter() - start)
+        return audio, backend.options(speed)
+    raise RuntimeError("No text-to-speech backend could synthesize the text")
+
+def _choose(backends, text, preferred, timeout):
+    """
+    Ranks the backends for some text and logs the choice.
+
+    Returns:
+        list: The available backends best first, or all of them if none look available.
+    """
+    ranked = rank(backends, len(text), preferred, timeout)
+    if not ranked:
+        # Nothing looks usable, e.g. the connectivity checks failed behind a proxy. Try anyway.
+        return list(backends)
+    estimates = ", ".join(f"{b.name} {b.estimate(len(text)):.2f}s" for b in ranked)
+    print(f"TTS   | Using {ranked[0].name} for {len(text)} characters (estimates: {estimates})")
+    return ranked
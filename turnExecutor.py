@@ -0,0 +1,69 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import threading
+
+# Shared worker pool for the stages of a turn. A task is only handed to the pool
+# once all of its dependencies have finished, so workers don't sit waiting on each other.
+_pool = ThreadPoolExecutor(max_workers=6)
+
+def runGraph(tasks):
+    """
+    Runs the stages of a turn concurrently, respecting their dependencies.
+    Each task starts as soon as every task it depends on has finished, and
+    receives their results as positional arguments in the listed order.
+    If a dependency fails, the tasks depending on it fail with the same error.
+
+    Args:
+        tasks (dict): Maps a task name to a (function, [dependency names]) tuple.
+
+    Returns:
+        dict: Maps each task name to a Future holding its result.
+    """
+    futures = {name: Future() for name in tasks}
+    waitingOn = {name: len(dependencies) for name, (function, dependencies) in tasks.items()}
+    lock = threading.Lock()
+
+    def start(name):
+        """
+        Hands a task whose dependencies are all finished to the worker pool.
+        """
+        function, dependencies = tasks[name]
+
+        def run():
+            try:
+                args = [futures[dependency].result() for dependency in dependencies]
+                futures[name].set_result(function(*args))
+            except Exception as e:
+                futures[name].set_exception(e)
+
+        _pool.submit(run)
+
+    def dependencyDone(name):
+        """
+        Counts down a task's unfinished dependencies and starts it at zero.
+        """
+        with lock:
+            waitingOn[name] -= 1
+            ready = waitingOn[name] == 0
+        if ready:
+            start(name)
+
+    for name, (function, dependencies) in tasks.items():
+        if dependencies:
+            for dependency in dependencies:
+                futures[dependency].add_done_callback(lambda future, name=name: dependencyDone(name))
+        else:
+            start(name)
+
+    return futures
+
+def waitAll(futures):
+    """
+    Blocks until every task of a turn has finished and logs the ones that failed.
+
+    Args:
+        futures (dict): The task futures returned by runGraph().
+    """
+    wait(futures.values())
+    for name, future in futures.items():
+        if future.exception():
+            print(f"TURN  | Task '{name}' failed: {future.exception()}")
@@ -0,0 +1,484 @@
+import asyncio
+import os
+import tempfile
+import threading
+import eyes, events, fillers, flickTools, imageScrape, prompt, responseCache, voiceRecognition, speech, tracing, turnExecutor
+
+# The stages of a turn after recording, shared by main.respond() and the asyncio
+# orchestrator, so both pipelines transcribe, answer, speak and find images the same way.
+# The API calls of transcription, the answer and speech also come in async versions,
+# which the orchestrator runs on the async clients so a deadline or a cancel aborts them.
+
+# The current turn: set by begin(), and stopped by cancel() when a new recording
+# starts before it has finished.
+_turn = {"cancelled": threading.Event(), "speculation": None}
+
+class Cancelled(Exception):
+    """
+    Raised by a stage that finds its turn was cancelled while it was running, e.g.
+    an answer still coming in a worker thread after the orchestrator gave up on it.
+    """
+
+def begin():
+    """
+    Starts a new turn and shows that Flick is thinking.
+    """
+    global _turn
+    _turn = {"cancelled": threading.Event(), "speculation": None}
+    # Update the status displayed on the 'eyes' (GUI) to "Thinking...".
+    eyes.setStatus("Thinking...")
+    # Set the GUI page to display the status.
+    eyes.setPage("status")
+
+def cancel():
+    """
+    Stops what's left of the current turn: its speech, streamed sentences that are
+    still to come, and image downloads. Stages already running in a worker thread
+    finish their current step and then stop.
+    """
+    _turn["cancelled"].set()
+    if _turn["speculation"]:
+        discardSpeculation(_turn["speculation"])
+    fillers.disarm()
+    speech.stopSpeech()
+
+def armFiller(recordingSize):
+    """
+    Gets a filler ready as soon as the recording is encoded, so it can cover
+    transcription too. It's disarmed if nothing was said or the answer is cached.
+
+    Args:
+        recordingSize (int): Size of the encoded recording in bytes, 0 if there was none.
+    """
+    if recordingSize > 0:
+        # Say something like "Hmm, let me think..." if the answer takes a moment.
+        fillers.arm("snap" if events.isCurrent(events.SNAP_TAKEN) else "thinking")
+
+def transcribe(recordingSize=0):
+    """
+    Transcribes the recorded voice input into text.
+
+    Args:
+        recordingSize (int): Size of the encoded recording in bytes, for the trace.
+
+    Returns:
+        str: The transcript, empty if nothing was said.
+    """
+    with tracing.span("transcribe", bytesSent=recordingSize) as trace:
+        userPrompt = voiceRecognition.transcribe()
+        trace["responseSize"] = len(userPrompt)
+    return userPrompt
+
+async def transcribeAsync(recordingSize=0):
+    """
+    Async version of transcribe(), on the async client.
+    """
+    with tracing.span("transcribe", bytesSent=recordingSize) as trace:
+        userPrompt = await voiceRecognition.transcribeAsync()
+        trace["responseSize"] = len(userPrompt)
+    return userPrompt
+
+def skip():
+    """
+    Ends a turn whose recording had no speech in it, before any API call.
+    """
+    print("MAIN  | Nothing was said, skipping the turn")
+    fillers.disarm()
+    eyes.setPage("eyes")
+    eyes.resetEyes()
+
+def answer(userPrompt, withImage, streaming, speculate):
+    """
+    Gets Flick's response to the question: from the response cache if it was asked
+    before, streamed and spoken sentence by sentence, or in one completion.
+
+    Args:
+        userPrompt (str): The transcribed question from the user.
+        withImage (bool): Whether to send the snapped image along with the text.
+        streaming (bool): Whether to use the streaming response-to-speech mode.
+        speculate (bool): Whether to prefetch images from the question meanwhile.
+
+    Returns:
+        tuple: The response and image decision (see prompt.parseStructured()),
+            whether it is being streamed, and the speculation from startSpeculation(), if any.
+    """
+    cached, streaming, speculation = prepareAnswer(userPrompt, withImage, streaming, speculate)
+    decision = generateAnswer(userPrompt, withImage, streaming, cached)
+    return settleAnswer(userPrompt, withImage, decision, cached), streaming, speculation
+
+async def answerAsync(userPrompt, withImage, streaming, speculate):
+    """
+    Async version of answer(). A single completion goes through the async client,
+    so cancelling the task aborts it; a streamed one is read in a worker thread,
+    which stops reading once the turn is cancelled.
+    """
+    cached, streaming, speculation = prepareAnswer(userPrompt, withImage, streaming, speculate)
+    if cached or streaming:
+        decision = await asyncio.to_thread(generateAnswer, userPrompt, withImage, streaming, cached)
+    else:
+        with tracing.span("prompt", withImage=withImage) as trace:
+            decision = await prompt.promptResponseAsync(userPrompt, withImage)
+            trace["responseSize"] = len(decision["text"])
+    return settleAnswer(userPrompt, withImage, decision, cached), streaming, speculation
+
+def prepareAnswer(userPrompt, withImage, streaming, speculate):
+    """
+    Looks the question up in the response cache, and starts prefetching images if
+    asked to.
+
+    Returns:
+        tuple: The cached entry or None, whether to stream, and the speculation, if any.
+    """
+    # Update the status to indicate the AI is processing the response.
+    eyes.setStatus("Figuring out what to say...")
+
+    # Questions asked before are answered from the response cache, and their speech from the speech cache.
+    # Snaps make every question different, so those turns never use it.
+    cached = None if withImage else responseCache.lookup(userPrompt)
+    if cached:
+        streaming = False # The whole answer is known, and its speech is most likely in the speech cache
+        fillers.disarm() # No wait to cover
+
+    # Start looking for images from the question while the answer is generated.
+    speculation = startSpeculation(userPrompt) if speculate else None
+    _turn["speculation"] = speculation
+    return cached, streaming, speculation
+
+def generateAnswer(userPrompt, withImage, streaming, cached):
+    """
+    Produces the response: the cached one, a streamed one, or a single completion.
+
+    Returns:
+        dict: The response and image decision (see prompt.parseStructured()).
+    """
+    turn = _turn
+    # The response comes with the model's decision on images, and the query to search for.
+    if cached:
+        with tracing.span("prompt", cached=True) as trace:
+            if turn["cancelled"].is_set():
+                raise Cancelled("the turn was cancelled")
+            decision = cached
+            prompt.recordExchange(userPrompt, decision["text"]) # Keep the history complete for follow-ups
+            trace["responseSize"] = len(decision["text"])
+    elif streaming:
+        # Speak the response sentence by sentence while it is still being generated.
+        decision = streamResponse(userPrompt, withImage)
+    else:
+        with tracing.span("prompt", withImage=withImage) as trace:
+            # If an image was snapped, the AI is prompted with both text and the image.
+            decision = prompt.promptResponse(userPrompt, withImage)
+            trace["responseSize"] = len(decision["text"])
+    return decision
+
+def settleAnswer(userPrompt, withImage, decision, cached):
+    """
+    Caches the response and uses up the snap it answered. Nothing is done for a
+    turn cancelled meanwhile, whose snap may already be the student's next one.
+
+    Returns:
+        dict: The decision, unchanged.
+
+    Raises:
+        Cancelled: If the turn was cancelled while the response was coming.
+    """
+    if _turn["cancelled"].is_set():
+        raise Cancelled("the turn was cancelled")
+    response = decision["text"]
+
+    if not cached and not withImage:
+        responseCache.store(userPrompt, response, decision)
+
+    if withImage:
+        # Delete the snapped image after it's been used.
+        flickTools.deleteSnap()
+        # Publish that the snap was used up, which also resets the GUI's snapped flag.
+        events.publish(events.SNAP_CLEARED)
+
+    # Print the character count of the AI's response for debugging/monitoring.
+    print(f"FLICK | Characters in response: {len(response)}")
+    return decision
+
+def streamResponse(userPrompt, withImage):
+    """
+    Streams Flick's response and starts speaking it sentence by sentence while
+    the rest is still being generated. Like the non-streaming mode, only the
+    first two paragraphs are spoken.
+
+    Args:
+        userPrompt (str): The transcribed question from the user.
+        withImage (bool): Whether to send the snapped image along with the text.
+
+    Returns:
+        dict: Flick's full response and image decision (see prompt.parseStructured()).
+    """
+    pieces = []
+    decision = {}
+    turn = _turn
+
+    def collect():
+        """
+        Passes the streamed pieces through while keeping a copy of the full response.
+        """
+        for piece in prompt.promptStream(userPrompt, withImage, decision):
+            pieces.append(piece)
+            yield piece
+
+    # Each finished sentence goes straight to speech synthesis and the playback queue.
+    with tracing.span("prompt", streamed=True) as trace:
+        sentences = flickTools.chunkSentences(collect(), maxParagraphs=2)
+        for sentence in sentences:
+            if turn["cancelled"].is_set():
+                # Stop reading, which closes the stream and takes the question back out of the history.
+                sentences.close()
+                raise Cancelled("the turn was cancelled")
+            if "firstSentence" not in trace:
+                trace["firstSentence"] = len(sentence)
+                tracing.mark("firstSentence") # Time-to-first-audio starts from here
+                fillers.disarm() # The answer is about to be spoken
+            speech.queueSpeech(sentence)
+        trace["responseSize"] = sum(len(piece) for piece in pieces)
+
+    return decision
+
+def startSpeculation(userPrompt):
+    """
+    Starts generating an image query from the student's question and prefetching
+    images into a scratch folder, in parallel with the main completion.
+    The images are kept or discarded once the response decides whether they're needed.
+
+    Args:
+        userPrompt (str): The transcribed question from the user.
+
+    Returns:
+        dict: The scratch folder, the cancel event and the task futures.
+    """
+    os.makedirs("temp", exist_ok=True)
+    folder = tempfile.mkdtemp(prefix="prefetch-", dir="temp")
+    cancelled = threading.Event()
+
+    def speculativeQuery():
+        with tracing.span("speculativeQuery") as trace:
+            query = prompt.generateImageQuery(userPrompt)
+            trace["responseSize"] = len(query)
+        return query
+
+    def prefetchImages(query):
+        with tracing.span("prefetchImages") as trace:
+            imageScrape.getImage(query, 10, folderPath=folder, cancelled=cancelled)
+            trace["bytesReceived"] = folderSize(folder)
+
+    futures = turnExecutor.runGraph({
+        "speculativeQuery": (speculativeQuery, []),
+        "prefetchImages": (prefetchImages, ["speculativeQuery"]),
+    })
+    return {"folder": folder, "cancelled": cancelled, "futures": futures}
+
+def discardSpeculation(speculation):
+    """
+    Stops a speculative prefetch that turned out not to be needed and deletes
+    its images once the download in flight has finished.
+
+    Args:
+        speculation (dict): The speculation returned by startSpeculation().
+    """
+    speculation["cancelled"].set()
+
+    def discard(future):
+        if future.exception():
+            print(f"MAIN  | Speculative prefetch failed: {future.exception()}")
+        imageScrape.discardImages(speculation["folder"])
+
+    speculation["futures"]["prefetchImages"].add_done_callback(discard)
+    print("MAIN  | Discarded speculative images")
+
+def folderSize(folderPath):
+    """
+    Adds up the size of the files in a folder, for the trace.
+
+    Args:
+        folderPath (str): The folder to measure.
+
+    Returns:
+        int: The total size in bytes.
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(folderPath) if entry.is_file())
+
+def buildTurnGraph(response, streaming, speculation=None, decision=None, speak=True):
+    """
+    Builds the dependency graph of the work left in a turn once the response is known.
+    Speech synthesis, the image search and the text layout start together, playback
+    starts as soon as the audio and the text page are ready, and images are shown
+    in the viewer as each one lands.
+
+    Args:
+        response (str): Flick's full response.
+        streaming (bool): Whether the response is already being spoken by the streaming mode.
+        speculation (dict): Images being prefetched by startSpeculation(), if any.
+        decision (dict): Whether the response needs images and the query to search
+            for, from the same completion (see prompt.parseStructured()).
+        speak (bool): Whether the graph speaks the response. The orchestrator speaks
+            it itself, with generateSpeechAsync() and playSpeech().
+
+    Returns:
+        dict: The tasks for turnExecutor.runGraph().
+    """
+    decision = decision or {"text": response, "needsImage": None, "imageQuery": ""}
+    turn = _turn
+
+    def clearImages():
+        """
+        Clears any existing images in the 'resources/images' directory.
+        """
+        with tracing.span("clearImages"):
+            imageScrape.clearImages()
+        print("MAIN  | Cleared images")
+
+    def showResponse(cleared):
+        """
+        Shows the response on the GUI once the old images are cleared.
+        """
+        with tracing.span("layout", responseSize=len(response)):
+            eyes.showResponse(response)
+
+    def findImageQuery():
+        """
+        Generates an image search query based on the AI's response, unless the
+        response already came with one.
+        """
+        # Update status to indicate image search is in progress.
+        eyes.setStatus("Finding images...")
+        if decision["imageQuery"]:
+            print(f"QUERY | Looked up: {decision['imageQuery']} (from the response)")
+            return decision["imageQuery"]
+        with tracing.span("imageQuery") as trace:
+            query = prompt.generateImageQuery(response)
+            trace["responseSize"] = len(query)
+        return query
+
+    def downloadImages(query, cleared):
+        """
+        Downloads 10 images, refreshing the viewer as each one lands.
+        """
+        with tracing.span("images") as trace:
+            imageScrape.getImage(query, 10, onImage=eyes.refreshImages, cancelled=turn["cancelled"])
+            trace["bytesReceived"] = folderSize("resources/images")
+
+    def keepSpeculation(cleared):
+        """
+        Shows the prefetched images that have already landed, then the rest once the prefetch ends.
+        """
+        imageScrape.promoteImages(speculation["folder"])
+        eyes.refreshImages()
+        turnExecutor.waitAll(speculation["futures"])
+        imageScrape.promoteImages(speculation["folder"])
+        imageScrape.discardImages(speculation["folder"])
+        eyes.refreshImages()
+
+    tasks = {
+        "clearImages": (clearImages, []),
+        "showResponse": (showResponse, ["clearImages"]),
+    }
+
+    if speak and not streaming:
+        tasks["generateSpeech"] = (lambda: generateSpeech(response), [])
+        # Plays the generated speech as soon as it is ready and the right page is showing.
+        tasks["playSpeech"] = (lambda generated, shown: playSpeech(generated, turn), ["generateSpeech", "showResponse"])
+
+    # Check if the AI decided that an image or diagram would be helpful.
+    if prompt.wantsImages(decision):
+        if speculation:
+            # Keep the images prefetched from the question.
+            tasks["keepSpeculation"] = (keepSpeculation, ["clearImages"])
+        else:
+            tasks["findImageQuery"] = (findImageQuery, [])
+            tasks["downloadImages"] = (downloadImages, ["findImageQuery", "clearImages"])
+    elif speculation:
+        discardSpeculation(speculation)
+
+    return tasks
+
+def runGraph(response, streaming, speculation=None, decision=None, speak=True):
+    """
+    Starts speech synthesis, image search and text layout side by side.
+
+    Args:
+        See buildTurnGraph().
+
+    Returns:
+        dict: The task futures from turnExecutor.runGraph().
+    """
+    turn = _turn
+    futures = turnExecutor.runGraph(buildTurnGraph(response, streaming, speculation, decision, speak))
+    if "playSpeech" in futures:
+        futures["playSpeech"].add_done_callback(lambda future: imagesFiller(futures, turn))
+    return futures
+
+def generateSpeech(response):
+    """
+    Generates an audio file of the AI's response.
+    It cuts down the response to its first sections for speech generation.
+    Speech said before, like a repeated answer, comes from the speech cache.
+
+    Args:
+        response (str): Flick's full response.
+
+    Returns:
+        str: The path of the audio file to play.
+    """
+    spoken = flickTools.cutFirstSections(response)
+    with tracing.span("speech", bytesSent=len(spoken.encode("utf-8"))) as trace:
+        path = speech.generateFile(spoken)
+        trace["bytesReceived"] = os.path.getsize(path)
+    return path
+
+async def generateSpeechAsync(response):
+    """
+    Async version of generateSpeech(), on the async client.
+    """
+    spoken = flickTools.cutFirstSections(response)
+    with tracing.span("speech", bytesSent=len(spoken.encode("utf-8"))) as trace:
+        path = await speech.generateFileAsync(spoken)
+        trace["bytesReceived"] = os.path.getsize(path)
+    return path
+
+def playSpeech(path, turn=None):
+    """
+    Plays the generated speech, unless the turn has been cancelled.
+
+    Args:
+        path (str): The audio file from generateSpeech().
+        turn (dict): The turn it belongs to. Defaults to the current one.
+    """
+    if (turn or _turn)["cancelled"].is_set():
+        return
+    fillers.disarm() # The answer is about to be spoken
+    with tracing.span("playback"):
+        speech.playSpeech(path)
+
+def imagesFiller(futures, turn=None):
+    """
+    Says something like "Grabbing some diagrams..." if the images are still loading
+    once the answer has been spoken.
+
+    Args:
+        futures (dict): The task futures from runGraph().
+        turn (dict): The turn they belong to. Defaults to the current one.
+    """
+    if "downloadImages" in futures and not futures["downloadImages"].done() and not (turn or _turn)["cancelled"].is_set():
+        fillers.play("images")
+
+def finish(futures, streaming):
+    """
+    Waits for every stage of a turn to finish before listening for the next one.
+
+    Args:
+        futures (dict): The task futures from runGraph().
+        streaming (bool): Whether the response is being spoken by the streaming mode.
+    """
+    turnExecutor.waitAll(futures)
+
+    if streaming:
+        # Let the queued sentences finish before listening for the next turn.
+        with tracing.span("playback"):
+            speech.waitForSpeech()
+    fillers.disarm() # In case nothing was spoken at all
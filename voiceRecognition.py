@@ -1,85 +1,573 @@
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
-from openai import OpenAI
+import io
+import asyncio
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import apiClients
+import flickTools
+import events
+import sttBackends
+import wakeWord
 
-# Initialize the OpenAI client with your API key.
-client = OpenAI(api_key="")
+# Load settings using flickTools. 'streamingTranscription' transcribes the recording
+# in segments, cut at pauses, while the student is still speaking.
+settings = flickTools.loadSettings()
+
+# The shared OpenAI clients, with pooled connections, timeouts and retries.
+client = apiClients.client
+# Async client used by the asyncio orchestrator, so cancelling a turn aborts its upload.
+asyncClient = apiClients.asyncClient
+
+# Speech-to-text backends: OpenAI's Whisper API and a small on-device Whisper model.
+# Each recording goes to whichever is expected to answer first, based on the latencies
+# measured so far and whether the API can be reached. 'sttBackend' can name one to
+# always try first ("openai" or "local"); 'localSttModel' picks the on-device model,
+# and an empty string turns it off.
+sttBackend = settings.get("sttBackend", "auto")
+backends = [sttBackends.OpenAIBackend(client, asyncClient)]
+if settings.get("localSttModel", "tiny.en"):
+    backends.append(sttBackends.WhisperCppBackend(settings.get("localSttModel", "tiny.en"), settings.get("localSttThreads", 4)))
 
 # Define audio recording parameters.
 samplerate = 44100  # Samples per second (standard for audio CDs)
 channels = 1        # Number of audio channels (1 for mono, 2 for stereo)
-defaultFilename = "temp/recording.wav" # Default file path to save recordings
+defaultFilename = "temp/recording.wav" # Default file path to save recordings for debugging
+
+# Recordings are uploaded as 16 kHz 16-bit mono, which is all Whisper uses.
+# 'uploadEncoding' picks the container: "flac" (lossless), "opus" (smallest) or "wav".
+uploadRate = 16000
+uploadEncoding = settings.get("uploadEncoding", "flac")
+
+# Voice activity detection. Audio is split into short frames, and a frame counts as
+# speech when it's loud enough, or a little quieter but with the high zero-crossing
+# rate of sounds like "s" and "f". Both levels are set from the room's noise floor,
+# so the steady hiss of a fan or microphone, which also crosses zero a lot, isn't speech.
+silenceThreshold = settings.get("silenceThreshold", 0.002)     # Lowest RMS level that counts as speech, for a quiet room and microphone
+maxSpeechThreshold = settings.get("maxSpeechThreshold", 0.04)  # Highest it's raised to by a noisy room, so speech with few pauses still counts
+vadFrameSeconds = 0.02                                     # Length of one VAD frame
+vadPaddingSeconds = 0.2                                    # Silence kept around speech when trimming
+minSpeechSeconds = settings.get("minSpeechSeconds", 0.2)   # Less speech than this counts as an empty recording
+# Auto stop is on by default with the wake word, so a turn can be hands-free from start to end.
+autoStopSeconds = settings.get("autoStopSeconds", 1.5 if settings.get("wakeWord", False) else 0) # Pause that ends the turn by itself (0 turns it off)
+
+# Pause detection for streaming transcription.
+pauseSeconds = settings.get("pauseSeconds", 0.7)           # Silence needed to cut a segment
+minSegmentSeconds = settings.get("minSegmentSeconds", 1.5) # Shortest segment worth sending on its own
+
+# Longest recording kept in memory. Anything older is overwritten by the ring buffer.
+maxRecordSeconds = settings.get("maxRecordSeconds", 60)
 
 # Global variables to manage the audio stream and recorded frames.
 _stream = None      # Will hold the SoundDevice InputStream object
-_audioFrames = []   # List to store audio data chunks
+_buffer = None      # Preallocated ring buffer the audio callback writes into
+_written = 0        # Total frames written during the current recording
+_overflows = 0      # Input overflows reported by the audio callback
+_upload = None      # The last recording prepared for transcription, as a sttBackends recording dictionary
+
+# Background monitor state: the thread watching the recording for pauses, the signal
+# that stops it, and the transcriptions of the segments cut so far, in order.
+_monitor = None
+_stopMonitoring = threading.Event()
+_segments = []
+_segmentBytes = 0   # Encoded size of the segments sent so far
+_segmentPool = ThreadPoolExecutor(max_workers=2)
 
 def startRecording():
     """
     Starts an audio recording session.
-    It initializes an input stream and continuously appends audio data to _audioFrames.
+    It initializes an input stream that writes audio data into the ring buffer.
+    The buffer is allocated once and reused, so the audio callback never allocates.
     """
-    global _stream, _audioFrames
-    _audioFrames = []  # Clear any previous audio frames
+    global _stream, _buffer, _written, _overflows
+    capacity = int(maxRecordSeconds * samplerate)
+    if _buffer is None or len(_buffer) != capacity:
+        _buffer = np.zeros((capacity, channels), dtype=np.float32)
+    _written = 0   # Start the new recording at the beginning of the buffer
+    _overflows = 0
 
     def callback(indata, frames, time, status):
         """
         Callback function for the audio stream.
         This function is called automatically by sounddevice whenever new audio data is available.
+        It copies the block into the ring buffer in place, wrapping around at the end.
         """
-        _audioFrames.append(indata.copy()) # Append a copy of the incoming audio data
+        global _written, _overflows
+        if status.input_overflow:
+            _overflows += 1
+        start = _written % capacity
+        end = start + frames
+        if end <= capacity:
+            _buffer[start:end] = indata
+        else:
+            split = capacity - start
+            _buffer[start:] = indata[:split]
+            _buffer[:end - capacity] = indata[split:]
+        _written += frames
+
+    # A tap on the screen starts a turn while the wake word spotter may still be
+    # reading the microphone, so wait for it to let go first.
+    wakeWord.release()
 
     # Create an InputStream object with the defined parameters and the callback function.
-    _stream = sd.InputStream(callback=callback, channels=channels, samplerate=samplerate)
+    _stream = sd.InputStream(callback=callback, channels=channels, samplerate=samplerate, dtype="float32")
     _stream.start() # Start the audio stream
     print("STT   | Recording started")
 
-def endRecording(filename=defaultFilename):
+    # Watch for pauses in the background, to transcribe segments while the student
+    # is still speaking and to end the turn by itself after a long pause.
+    if settings.get("streamingTranscription", False) or autoStopSeconds:
+        startMonitoring()
+
+def endRecording(filename=None):
     """
-    Stops the current recording, saves the recorded audio to a WAV file, and cleans up the stream.
+    Stops the current recording, encodes it in memory for upload, and cleans up the stream.
 
     Args:
-        filename (str): The path and name of the file to save the recording.
-                        Defaults to "temp/recording.wav".
+        filename (str): Optional path to also save the full-quality recording as a WAV file.
+                        The 'saveRecording' setting saves it to "temp/recording.wav".
 
     Returns:
-        str or None: The filename of the saved recording if successful, None otherwise.
+        int or None: The size of the encoded recording in bytes if successful, None otherwise.
     """
-    global _stream, _audioFrames
+    global _stream
     if _stream: # Check if a recording stream is active
         _stream.stop()  # Stop the audio stream
         _stream.close() # Close the audio stream
         _stream = None  # Reset the stream variable
 
-        # Concatenate all recorded audio frames into a single NumPy array.
-        audio = np.concatenate(_audioFrames, axis=0)
-        
-        # Save the concatenated audio data to a WAV file.
-        sf.write(filename, audio, samplerate)
-        print(f"STT   | Recording saved to {filename}")
-        return filename
+        # Send whatever was said since the last pause.
+        if _monitor:
+            stopMonitoring()
+
+        if _overflows:
+            print(f"STT   | {_overflows} input overflows during recording")
+        if _written > len(_buffer):
+            print(f"STT   | Recording longer than {maxRecordSeconds}s, kept the end")
+
+        if filename is None and settings.get("saveRecording", False):
+            filename = defaultFilename
+        if filename:
+            # Save the recorded audio to a WAV file, straight from the ring buffer.
+            sf.write(filename, recordedAudio(), samplerate)
+            print(f"STT   | Recording saved to {filename}")
+        return prepareUpload()
     else:
         print("STT   | No active recording to stop")
         return None
 
-def transcribe(filename=defaultFilename):
+def loadRecording(audio):
+    """
+    Puts audio into the ring buffer as if it had just been recorded and encodes it
+    for upload, e.g. for benchmark.py.
+
+    Args:
+        audio (numpy.ndarray): The audio at 'samplerate', shaped (frames,) or (frames, channels).
+
+    Returns:
+        int: The size of the encoded recording in bytes.
+    """
+    global _buffer, _written
+    audio = np.asarray(audio, dtype=np.float32).reshape(len(audio), -1)[:, :channels]
+    capacity = int(maxRecordSeconds * samplerate)
+    if _buffer is None or len(_buffer) != capacity:
+        _buffer = np.zeros((capacity, channels), dtype=np.float32)
+    audio = audio[-capacity:]
+    _buffer[:len(audio)] = audio
+    _written = len(audio)
+    takeSegments() # Segments only come from a live recording
+    return prepareUpload()
+
+def frameStats(audio):
+    """
+    Splits mono audio into VAD frames and measures each one, all frames at once.
+
+    Args:
+        audio (numpy.ndarray): The mono audio at 'samplerate'.
+
+    Returns:
+        tuple: The RMS level and the zero-crossing rate of each frame, as numpy arrays.
+    """
+    frameLength = int(samplerate * vadFrameSeconds)
+    count = max(len(audio) // frameLength, 1 if len(audio) else 0)
+    frameLength = min(frameLength, len(audio)) or 1
+    frames = audio[:count * frameLength].reshape(count, frameLength)
+
+    energy = np.sqrt(np.mean(np.square(frames), axis=1))
+    crossings = np.mean(np.diff(np.signbit(frames), axis=1), axis=1) if frameLength > 1 else np.zeros(count)
+    return energy, crossings
+
+def noiseFloorOf(energy):
+    """
+    Estimates the background noise level from frame levels: the quietest tenth of
+    the frames, which are the pauses between words even while someone is speaking.
+
+    Args:
+        energy (numpy.ndarray): The RMS level of each frame, from frameStats().
+
+    Returns:
+        float: The noise floor.
+    """
+    return float(np.percentile(energy, 10)) if len(energy) else 0.0
+
+def speechFrames(audio, noiseFloor=None):
+    """
+    Classifies short frames of mono audio as speech or silence, all frames at once.
+    A frame is speech when it's well above the noise floor: at least twice it,
+    between silenceThreshold and maxSpeechThreshold. Quieter frames with a high zero-crossing rate
+    also count, as long as they're three times the noise floor, since broadband
+    noise crosses zero as often as an "s" does.
+
+    Args:
+        audio (numpy.ndarray): The mono audio at 'samplerate'.
+        noiseFloor (float): The background noise level. Defaults to the one in the audio itself.
+
+    Returns:
+        numpy.ndarray: One boolean per frame, True where there's speech.
+    """
+    energy, crossings = frameStats(audio)
+    return classifyFrames(energy, crossings, noiseFloorOf(energy) if noiseFloor is None else noiseFloor)
+
+def classifyFrames(energy, crossings, noiseFloor):
+    """
+    The decision behind speechFrames(), for frames that are already measured.
+
+    Args:
+        energy (numpy.ndarray): The RMS level of each frame, from frameStats().
+        crossings (numpy.ndarray): The zero-crossing rate of each frame.
+        noiseFloor (float): The background noise level.
+
+    Returns:
+        numpy.ndarray: One boolean per frame, True where there's speech.
+    """
+    threshold = min(max(silenceThreshold, 2 * noiseFloor), maxSpeechThreshold)
+    return (energy >= threshold) | ((energy >= max(threshold / 2, 3 * noiseFloor)) & (crossings >= 0.3))
+
+def trimSilence(audio, noiseFloor=None):
+    """
+    Cuts the silence before and after the speech in a recording, keeping a little padding.
+
+    Args:
+        audio (numpy.ndarray): The audio at 'samplerate', shaped (frames, channels).
+        noiseFloor (float): The background noise level. Defaults to the one in the audio itself.
+
+    Returns:
+        numpy.ndarray: A view of the speech part, or an empty view if there's too little speech.
+    """
+    mask = speechFrames(audio.mean(axis=1), noiseFloor)
+    frameLength = int(samplerate * vadFrameSeconds)
+    if mask.sum() * vadFrameSeconds < minSpeechSeconds:
+        return audio[:0]
+    speech = np.flatnonzero(mask)
+    padding = int(vadPaddingSeconds / vadFrameSeconds)
+    start = max(0, (speech[0] - padding) * frameLength)
+    end = min(len(audio), (speech[-1] + 1 + padding) * frameLength)
+    return audio[start:end]
+
+def resample(audio, fromRate, toRate):
     """
-    Transcribes the audio from a specified WAV file into text using OpenAI's Whisper model.
+    Resamples mono audio with a short windowed-sinc low-pass filter and linear
+    interpolation. Cheap enough for the Pi, and clean enough for speech recognition.
 
     Args:
-        filename (str): The path and name of the audio file to transcribe.
-                        Defaults to "temp/recording.wav".
+        audio (numpy.ndarray): The mono audio.
+        fromRate (int): The audio's sample rate.
+        toRate (int): The sample rate to convert to.
+
+    Returns:
+        numpy.ndarray: The resampled audio as float32.
+    """
+    if fromRate == toRate or len(audio) == 0:
+        return audio.astype(np.float32)
+    if toRate < fromRate:
+        # Remove everything above the new Nyquist frequency so it doesn't fold back as noise.
+        taps = 31
+        cutoff = 0.45 * toRate / fromRate # Cycles per input sample
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        audio = np.convolve(audio, (kernel / kernel.sum()).astype(np.float32), mode="same")
+    positions = np.arange(int(len(audio) * toRate / fromRate)) * (fromRate / toRate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+def encodeForUpload(audio, rate=samplerate):
+    """
+    Converts audio to 16 kHz 16-bit mono and encodes it in memory with the
+    'uploadEncoding' setting. Falls back to FLAC if this libsndfile can't write Opus.
+    The raw samples are kept alongside the encoded file for on-device transcription.
+
+    Args:
+        audio (numpy.ndarray): The audio, shaped (frames, channels).
+        rate (int): The audio's sample rate.
+
+    Returns:
+        dict: The recording for sttBackends, with the (filename, bytes) pair to upload
+            under "file", the int16 samples under "pcm" and the length under "seconds".
+    """
+    mono = audio.mean(axis=1) if audio.ndim > 1 else audio
+    pcm = (np.clip(resample(mono, rate, uploadRate), -1, 1) * 32767).astype(np.int16)
+    formats = {
+        "flac": ("recording.flac", "FLAC", "PCM_16"),
+        "opus": ("recording.ogg", "OGG", "OPUS"),
+        "wav": ("recording.wav", "WAV", "PCM_16"),
+    }
+    name, fileFormat, subtype = formats.get(uploadEncoding, formats["flac"])
+    buffer = io.BytesIO()
+    try:
+        sf.write(buffer, pcm, uploadRate, format=fileFormat, subtype=subtype)
+    except Exception as e:
+        print(f"STT   | Couldn't encode {uploadEncoding}, using FLAC: {e}")
+        name, fileFormat, subtype = formats["flac"]
+        buffer = io.BytesIO()
+        sf.write(buffer, pcm, uploadRate, format=fileFormat, subtype=subtype)
+    return {"file": (name, buffer.getvalue()), "pcm": pcm, "seconds": len(pcm) / uploadRate}
+
+def prepareUpload():
+    """
+    Encodes the current recording for upload and keeps it in memory for transcribe().
+    When the recording was sent in segments while the student spoke, those are what
+    transcribe() uses, so the whole recording isn't encoded again.
+
+    Returns:
+        int: The size of the encoded recording in bytes (or of its segments), 0 if there was no speech.
+    """
+    global _upload
+    if _segments:
+        _upload = None
+        print(f"STT   | Sent {len(_segments)} segments, {_segmentBytes} bytes")
+        return _segmentBytes
+    recording = recordedAudio()
+    audio = trimSilence(recording)
+    if len(audio) == 0:
+        # Nothing was said, so there's nothing to transcribe.
+        _upload = None
+        print("VAD   | No speech in the recording")
+        return 0
+    _upload = encodeForUpload(audio)
+    rawBytes = recording.size * 2 # The untrimmed audio as 16-bit PCM at the capture rate
+    name, data = _upload["file"]
+    print(f"STT   | Upload is {len(data)} bytes as {name} ({rawBytes} bytes raw, "
+          f"{(len(recording) - len(audio)) / samplerate:.1f}s of silence trimmed)")
+    return len(data)
+
+def readFrames(start, end):
+    """
+    Reads part of the current recording from the ring buffer.
+    Returns a view into the buffer when the range doesn't wrap around its end,
+    so no audio is copied; otherwise the two halves are joined.
+    Frames older than maxRecordSeconds have been overwritten and are skipped.
+
+    Args:
+        start (int): The first frame, counted from the start of the recording.
+        end (int): The frame after the last one.
+
+    Returns:
+        numpy.ndarray: The audio, shaped (frames, channels).
+    """
+    capacity = len(_buffer)
+    start = max(start, end - capacity, 0)
+    first, last = start % capacity, end % capacity
+    if end - start == 0:
+        return _buffer[:0]
+    if first < last or last == 0:
+        return _buffer[first:last or capacity]
+    return np.concatenate((_buffer[first:], _buffer[:last]))
+
+def recordedAudio():
+    """
+    Returns the whole current recording, as a view into the ring buffer when possible.
+
+    Returns:
+        numpy.ndarray: The audio, shaped (frames, channels).
+    """
+    return readFrames(0, _written)
+
+def startMonitoring():
+    """
+    Starts the background monitor for the current recording.
+    """
+    global _monitor, _segments, _segmentBytes
+    _segments = []
+    _segmentBytes = 0
+    _stopMonitoring.clear()
+    _monitor = threading.Thread(target=_monitorWorker, daemon=True)
+    _monitor.start()
+
+def stopMonitoring():
+    """
+    Stops the background monitor and sends the final segment.
+    """
+    global _monitor
+    _stopMonitoring.set()
+    _monitor.join()
+    _monitor = None
+
+def _monitorWorker():
+    """
+    Watches the ring buffer for pauses. With streaming transcription, it cuts a
+    segment at each pause and sends it to be transcribed straight away; segments
+    with no speech in them are dropped. With auto stop, it publishes that listening
+    has stopped once the student has been quiet for 'autoStopSeconds'.
+    """
+    streaming = settings.get("streamingTranscription", False)
+    windowFrames = 1024  # Frames checked for speech at a time
+    scanned = 0          # Frames checked so far
+    segmentStart = 0     # First frame of the current segment
+    silentSamples = 0    # Samples of silence since the last speech
+    heardSpeech = False  # Whether the current segment has any speech in it
+    spoke = False        # Whether the student has said anything yet
+    autoStopped = False  # Whether the turn has already been ended by auto stop
+    levels = collections.deque(maxlen=int(10 / vadFrameSeconds)) # Frame levels of the last 10 s, for the noise floor
+    pauseSamples = int(pauseSeconds * samplerate)
+    minSamples = int(minSegmentSeconds * samplerate)
+    autoStopSamples = int(autoStopSeconds * samplerate)
+
+    while True:
+        stopping = _stopMonitoring.wait(0.1)
+        written = _written
+        while written - scanned >= windowFrames or (stopping and scanned < written):
+            end = min(scanned + windowFrames, written)
+            energy, crossings = frameStats(readFrames(scanned, end).mean(axis=1))
+            levels.extend(energy)
+            if classifyFrames(energy, crossings, noiseFloorOf(np.array(levels))).any():
+                heardSpeech = spoke = True
+                silentSamples = 0
+            else:
+                silentSamples += end - scanned
+            scanned = end
+
+            # Cut at a pause once the segment is long enough to transcribe well.
+            if streaming and heardSpeech and silentSamples >= pauseSamples and scanned - segmentStart >= minSamples:
+                _sendSegment(segmentStart, scanned, noiseFloorOf(np.array(levels)))
+                segmentStart, heardSpeech = scanned, False
+
+            # End the turn once the student has stopped talking for long enough.
+            if autoStopSamples and spoke and not autoStopped and silentSamples >= autoStopSamples:
+                autoStopped = True
+                print(f"VAD   | Heard {autoStopSeconds}s of silence, ending the turn")
+                events.publish(events.LISTENING_STOPPED)
+
+        if stopping:
+            # Send whatever was said since the last cut.
+            if streaming and heardSpeech and segmentStart < written:
+                _sendSegment(segmentStart, written, noiseFloorOf(np.array(levels)))
+            return
+
+def _sendSegment(start, end, noiseFloor=None):
+    """
+    Trims the silence around a segment, encodes it in memory and queues it for transcription.
+
+    Args:
+        start (int): The segment's first frame.
+        end (int): The frame after the segment's last one.
+        noiseFloor (float): The recording's noise floor so far, from the monitor.
+    """
+    global _segmentBytes
+    audio = trimSilence(readFrames(start, end), noiseFloor)
+    if len(audio) == 0:
+        return
+    segment = encodeForUpload(audio)
+    _segmentBytes += len(segment["file"][1])
+    _segments.append(_segmentPool.submit(_transcribeSegment, segment, len(_segments) + 1))
+
+def _transcribeSegment(segment, number):
+    """
+    Transcribes one segment of a recording.
+
+    Args:
+        segment (dict): The encoded segment, as returned by encodeForUpload().
+        number (int): The segment's position in the recording, for logging.
+
+    Returns:
+        str: The segment's text.
+    """
+    name, data = segment["file"]
+    segment["file"] = (f"segment{number}-{name}", data)
+    text = sttBackends.transcribe(backends, segment, sttBackend)
+    print(f"STT   | Segment {number}: {text}")
+    return text.strip()
+
+def takeSegments():
+    """
+    Hands over the transcription futures of the last recording's segments, so
+    each recording is only stitched together once.
+
+    Returns:
+        list: The segment futures in order, or an empty list if the recording wasn't segmented.
+    """
+    global _segments
+    segments, _segments = _segments, []
+    return segments
+
+def uploadFile(filename=None):
+    """
+    Picks what to transcribe.
+
+    Args:
+        filename (str): Optional path of an audio file to transcribe instead of the last recording.
+
+    Returns:
+        dict: The recording for sttBackends, or None if the last recording had no speech.
+    """
+    if filename:
+        audio, rate = sf.read(filename, dtype="float32", always_2d=True)
+        return encodeForUpload(audio, rate)
+    return _upload
+
+def transcribe(filename=None):
+    """
+    Transcribes the last recording into text with the fastest available backend.
+    The recording is sent straight from memory, already encoded by endRecording().
+
+    Args:
+        filename (str): Optional path of an audio file to transcribe instead.
+
+    Returns:
+        str: The transcribed text.
+    """
+    # Stitch together the segments transcribed while the student was speaking.
+    segments = takeSegments()
+    if segments:
+        text = " ".join(filter(None, (segment.result() for segment in segments)))
+        print(f"STT   | You said: {text}")
+        return text
+
+    upload = uploadFile(filename)
+    if upload is None:
+        # Skip the API call for a recording with no speech.
+        print("STT   | Nothing to transcribe")
+        return ""
+
+    print("STT   | Transcribing...")
+    # Send the audio to whichever backend should answer first, falling back to the others.
+    text = sttBackends.transcribe(backends, upload, sttBackend)
+    print(f"STT   | You said: {text}")
+    return text
+
+async def transcribeAsync(filename=None):
+    """
+    Async version of transcribe() for the asyncio orchestrator.
+
+    Args:
+        filename (str): Optional path of an audio file to transcribe instead.
 
     Returns:
         str: The transcribed text.
     """
+    segments = takeSegments()
+    if segments:
+        texts = await asyncio.gather(*(asyncio.wrap_future(segment) for segment in segments))
+        text = " ".join(filter(None, texts))
+        print(f"STT   | You said: {text}")
+        return text
+
+    upload = uploadFile(filename)
+    if upload is None:
+        print("STT   | Nothing to transcribe")
+        return ""
+
     print("STT   | Transcribing...")
-    with open(filename, "rb") as f:
-        # Send the audio file to OpenAI's audio transcription API.
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1", # Specify the Whisper model for transcription
-            file=f             # Provide the audio file
-        )
-    print(f"STT   | You said: {transcript.text}")
-    return transcript.text
\ No newline at end of file
+    text = await sttBackends.transcribeAsync(backends, upload, sttBackend)
+    print(f"STT   | You said: {text}")
+    return text
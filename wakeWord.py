@@ -0,0 +1,391 @@
+import glob
+import os
+import threading
+import time
+import numpy as np
+import sounddevice as sd
+import soundfile as sf
+import events
+import flickTools
+import playback
+
+# Load settings using flickTools. 'wakeWord' turns on always-on listening for "Hey Flick".
+# The spotter compares short bursts of sound against recordings of the wake word in
+# 'wakeWordFolder'; run `python wakeWord.py` to record them.
+settings = flickTools.loadSettings()
+wakeWordFolder = settings.get("wakeWordFolder", "resources/wakeword")
+wakeWordThreshold = settings.get("wakeWordThreshold", None) # Largest match distance that counts; None calibrates from the recordings
+cpuBudget = settings.get("wakeWordCpuBudget", 5)            # Percent of one core the spotter should stay under
+
+# Audio parameters. The spotter opens its own small 16 kHz stream and reads it in
+# 100 ms blocks, keeping the last two seconds in a rolling buffer.
+rate = 16000
+blockFrames = 1600
+historySeconds = 2.0
+
+# A burst of sound between these lengths, followed by 'endSilenceBlocks' quiet blocks,
+# is compared against the wake word recordings. Anything longer is ordinary speech.
+minWakeSeconds = 0.3
+maxWakeSeconds = 1.5
+endSilenceBlocks = 3
+
+# Feature extraction: 25 ms frames every 10 ms, 20 mel bands from 100 Hz to 4 kHz, 12 cepstral coefficients.
+frameLength = 400
+hopLength = 160
+fftSize = 512
+melBands = 20
+cepstra = 12
+
+# How often the CPU usage of the listening thread is logged.
+cpuReportSeconds = 60
+
+def melFilterbank():
+    """
+    Builds triangular mel filters for the spotter's FFT size.
+
+    Returns:
+        numpy.ndarray: The filters, shaped (melBands, fftSize // 2 + 1).
+    """
+    def toMel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def toHz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    edges = toHz(np.linspace(toMel(100), toMel(4000), melBands + 2))
+    bins = np.fft.rfftfreq(fftSize, 1 / rate)
+    filters = np.zeros((melBands, len(bins)), dtype=np.float32)
+    for band in range(melBands):
+        low, center, high = edges[band:band + 3]
+        rising = (bins - low) / (center - low)
+        falling = (high - bins) / (high - center)
+        filters[band] = np.clip(np.minimum(rising, falling), 0, None)
+    return filters
+
+# Built once, so feature extraction is just a few matrix products.
+_window = np.hamming(frameLength).astype(np.float32)
+_filters = melFilterbank()
+_dct = np.cos(np.pi / melBands * (np.arange(melBands) + 0.5)[None, :] * np.arange(1, cepstra + 1)[:, None]).astype(np.float32)
+_frameOffsets = np.arange(frameLength)[None, :]
+
+def features(audio):
+    """
+    Turns a short clip into a sequence of normalized cepstral vectors. The mean is
+    removed so the microphone and room matter less, and each frame is scaled to
+    unit length so frames can be compared by cosine distance.
+
+    Args:
+        audio (numpy.ndarray): Mono 16 kHz audio.
+
+    Returns:
+        numpy.ndarray: The features, shaped (frames, cepstra).
+    """
+    count = 1 + (len(audio) - frameLength) // hopLength
+    if count < 2:
+        return np.zeros((0, cepstra), dtype=np.float32)
+    frames = audio[_frameOffsets + hopLength * np.arange(count)[:, None]] * _window
+    power = np.abs(np.fft.rfft(frames, fftSize)) ** 2
+    coefficients = np.log(power @ _filters.T + 1e-10) @ _dct.T
+    coefficients -= coefficients.mean(axis=0)
+    return coefficients / (np.linalg.norm(coefficients, axis=1, keepdims=True) + 1e-10)
+
+def matchDistance(a, b):
+    """
+    Compares two feature sequences with dynamic time warping, so the wake word
+    matches whether it's said quickly or slowly.
+
+    Args:
+        a (numpy.ndarray): The first feature sequence.
+        b (numpy.ndarray): The second feature sequence.
+
+    Returns:
+        float: The average cosine distance along the best alignment, 0 for identical clips.
+    """
+    if len(a) == 0 or len(b) == 0 or max(len(a), len(b)) > 2 * min(len(a), len(b)):
+        return np.inf # Too different in length to be the same phrase
+    cost = (1 - a @ b.T).tolist()
+    previous = [np.inf] * (len(b) + 1)
+    previous[0] = 0.0
+    for row in cost:
+        current = [np.inf] * (len(b) + 1)
+        for j, c in enumerate(row, 1):
+            current[j] = c + min(previous[j - 1], previous[j], current[j - 1])
+        previous = current
+    return previous[-1] / (len(a) + len(b))
+
+def trimToSpeech(audio):
+    """
+    Cuts the silence off both ends of a wake word recording.
+
+    Args:
+        audio (numpy.ndarray): Mono 16 kHz audio.
+
+    Returns:
+        numpy.ndarray: The audio from the first loud block to the last.
+    """
+    blocks = len(audio) // hopLength
+    levels = np.sqrt(np.mean(audio[:blocks * hopLength].reshape(blocks, hopLength) ** 2, axis=1))
+    loud = np.flatnonzero(levels > max(0.01, 4 * np.percentile(levels, 10)))
+    if len(loud) == 0:
+        return audio[:0]
+    return audio[loud[0] * hopLength:(loud[-1] + 1) * hopLength]
+
+class WakeWordDetector:
+    """
+    Spots the wake word in a stream of audio blocks. Each block costs one RMS
+    measurement; features and matching only run when a word-length burst of
+    sound has just ended, which keeps the spotter cheap while the room is quiet.
+    """
+
+    def __init__(self, templates, threshold=None):
+        """
+        Args:
+            templates (list): Feature sequences of wake word recordings.
+            threshold (float): Largest match distance that counts as the wake word.
+                None calibrates it from how far apart the recordings are from each other.
+        """
+        self.templates = templates
+        self.threshold = threshold if threshold is not None else self.calibrate(templates)
+        self._history = np.zeros(int(historySeconds * rate), dtype=np.float32)
+        self._noiseFloor = 0.005
+        self._burstBlocks = 0  # Blocks since the current burst started
+        self._silentBlocks = 0 # Quiet blocks since the burst's last loud block
+
+    @staticmethod
+    def calibrate(templates):
+        """
+        Picks a threshold a little above the largest distance between two recordings
+        of the wake word, so every way the student says it still matches.
+
+        Returns:
+            float: The threshold.
+        """
+        distances = [matchDistance(a, b) for i, a in enumerate(templates) for b in templates[i + 1:]]
+        distances = [d for d in distances if np.isfinite(d)]
+        return max(0.2, 1.25 * max(distances)) if distances else 0.35
+
+    def feed(self, block):
+        """
+        Adds a block of audio and checks whether it completed the wake word.
+
+        Args:
+            block (numpy.ndarray): Mono 16 kHz audio, usually 'blockFrames' long.
+
+        Returns:
+            bool: True if the wake word was just heard.
+        """
+        n = len(block)
+        self._history[:-n] = self._history[n:]
+        self._history[-n:] = block
+
+        level = float(np.sqrt(np.mean(block ** 2)))
+        loud = level > max(0.01, 3 * self._noiseFloor)
+        if not loud and not self._burstBlocks:
+            # Follow the background noise level while nobody is talking.
+            self._noiseFloor = 0.95 * self._noiseFloor + 0.05 * level
+            return False
+
+        if loud:
+            self._silentBlocks = 0
+        else:
+            self._silentBlocks += 1
+        self._burstBlocks += 1
+        if self._burstBlocks * n > maxWakeSeconds * rate:
+            # Far too long for the wake word. Let the noise floor creep up in case
+            # this is a new background noise, like a fan, rather than talking.
+            self._noiseFloor = 0.99 * self._noiseFloor + 0.01 * level
+
+        if self._silentBlocks < endSilenceBlocks:
+            return False
+
+        # The burst has ended. Compare it if it was about as long as the wake word.
+        blocks, self._burstBlocks = self._burstBlocks, 0
+        seconds = (blocks - self._silentBlocks) * n / rate
+        if not minWakeSeconds <= seconds <= maxWakeSeconds:
+            return False
+        start = len(self._history) - (blocks + 1) * n
+        end = len(self._history) - (self._silentBlocks - 1) * n
+        candidate = features(self._history[max(0, start):end])
+        distance = min(matchDistance(candidate, template) for template in self.templates)
+        print(f"WAKE  | Heard {seconds:.1f}s of sound, distance {distance:.2f} (needs {self.threshold:.2f})")
+        return distance <= self.threshold
+
+def loadTemplates(folderPath=None):
+    """
+    Loads the wake word recordings and turns them into feature sequences.
+
+    Args:
+        folderPath (str): The folder holding the WAV recordings. Defaults to 'wakeWordFolder'.
+
+    Returns:
+        list: One feature sequence per recording.
+    """
+    templates = []
+    for path in sorted(glob.glob(os.path.join(folderPath or wakeWordFolder, "*.wav"))):
+        audio, fileRate = sf.read(path, dtype="float32", always_2d=True)
+        if fileRate != rate:
+            print(f"WAKE  | Skipping {path}, it isn't {rate} Hz")
+            continue
+        audio = trimToSpeech(audio.mean(axis=1))
+        if len(audio):
+            templates.append(features(audio))
+    return templates
+
+# Listening thread state, and the CPU time it has used since it started.
+_thread = None
+_stop = threading.Event()
+_cpuSeconds = 0.0
+_wallStart = None
+
+# The spotter's microphone stream. The lock is held while a block is read, so
+# release() never closes the stream in the middle of a read.
+_stream = None
+_streamLock = threading.Lock()
+
+def start():
+    """
+    Starts listening for the wake word in a background thread.
+
+    Returns:
+        bool: True if listening started, False if there are no wake word recordings.
+    """
+    global _thread, _wallStart
+    templates = loadTemplates()
+    if not templates:
+        print(f"WAKE  | No wake word recordings in {wakeWordFolder}, run 'python wakeWord.py' to record some")
+        return False
+    detector = WakeWordDetector(templates, wakeWordThreshold)
+    print(f"WAKE  | Listening for the wake word with {len(templates)} recordings, threshold {detector.threshold:.2f}")
+    _stop.clear()
+    _wallStart = time.perf_counter()
+    _thread = threading.Thread(target=_listen, args=(detector,), daemon=True)
+    _thread.start()
+    return True
+
+def stop():
+    """
+    Stops listening for the wake word.
+    """
+    global _thread
+    _stop.set()
+    if _thread:
+        _thread.join()
+        _thread = None
+
+def cpuUsage():
+    """
+    Measures how busy the listening thread has kept the CPU.
+
+    Returns:
+        float: The thread's CPU time as a percentage of one core since it started.
+    """
+    if _wallStart is None:
+        return 0.0
+    return 100 * _cpuSeconds / max(time.perf_counter() - _wallStart, 1e-9)
+
+def _listen(detector):
+    """
+    Reads the microphone in small blocks and starts a turn when the wake word is heard.
+    The stream is closed while a turn is recording, so the two never compete for the
+    microphone, and while Flick is speaking, so its own voice can't wake it. It's
+    reopened once both are over.
+    """
+    global _cpuSeconds, _stream
+    reportAt = time.perf_counter() + cpuReportSeconds
+    while not _stop.is_set():
+        cpuStart = time.thread_time()
+        with _streamLock:
+            # Checked under the lock, so the stream is never reopened after release().
+            recording = events.isCurrent(events.LISTENING_STARTED)
+            busy = recording or playback.isPlaying()
+            if busy:
+                _close()
+            else:
+                if _stream is None:
+                    _stream = sd.InputStream(samplerate=rate, channels=1, dtype="float32", blocksize=blockFrames)
+                    _stream.start()
+                # Blocks (sleeping) until the next block has been recorded.
+                block, overflowed = _stream.read(blockFrames)
+
+        if busy:
+            _cpuSeconds += time.thread_time() - cpuStart
+            # Sleep until the turn's recording or Flick's speech ends.
+            if recording:
+                events.waitFor(events.LISTENING_STOPPED, timeout=0.5)
+            else:
+                playback.wait(timeout=0.5)
+            continue
+
+        if detector.feed(block[:, 0]):
+            print("WAKE  | Heard the wake word")
+            # Subscribers run on this thread and open the recording stream straight
+            # away, so the microphone has to be let go of before publishing.
+            release()
+            events.publish(events.LISTENING_STARTED) # The same path as tapping the screen
+        _cpuSeconds += time.thread_time() - cpuStart
+
+        if time.perf_counter() >= reportAt:
+            reportAt += cpuReportSeconds
+            usage = cpuUsage()
+            warning = f", over the {cpuBudget}% budget" if usage > cpuBudget else ""
+            print(f"WAKE  | Spotter is using {usage:.1f}% of one core{warning}")
+
+    release()
+
+def release():
+    """
+    Lets go of the microphone, waiting for the block being read to finish. Called by
+    voiceRecognition.startRecording() before it opens its own stream, since a tap on
+    the screen starts a turn while the spotter is still reading. The spotter reopens
+    its stream once the turn's recording and Flick's speech are over.
+    """
+    with _streamLock:
+        _close()
+
+def _close():
+    """
+    Stops and closes the spotter's stream if it's open. Called with '_streamLock' held.
+    """
+    global _stream
+    if _stream:
+        _stream.stop()
+        _stream.close()
+        _stream = None
+
+def measureCpu(seconds=60):
+    """
+    Measures the spotter's CPU cost without a microphone, by feeding it synthetic
+    audio: background noise with a word-length burst every few seconds, so the
+    matching runs as well as the level checks. Used by benchmark.py.
+
+    Args:
+        seconds (float): How much audio to feed through the spotter.
+
+    Returns:
+        float: The CPU time needed as a percentage of one core in real time.
+    """
+    generator = np.random.default_rng(0)
+    t = np.arange(int(0.6 * rate)) / rate
+    burst = (0.2 * np.sin(2 * np.pi * 220 * t * (1 + t)) * np.hanning(len(t))).astype(np.float32)
+    detector = WakeWordDetector([features(burst)] * 3, 0.0)
+
+    audio = (0.002 * generator.standard_normal(int(seconds * rate))).astype(np.float32)
+    for offset in range(rate, len(audio) - len(burst), 4 * rate):
+        audio[offset:offset + len(burst)] += burst
+
+    cpuStart = time.process_time()
+    for offset in range(0, len(audio) - blockFrames + 1, blockFrames):
+        detector.feed(audio[offset:offset + blockFrames])
+    return 100 * (time.process_time() - cpuStart) / seconds
+
+if __name__ == "__main__":
+    # Record the wake word a few times for the spotter to match against.
+    os.makedirs(wakeWordFolder, exist_ok=True)
+    existing = len(glob.glob(os.path.join(wakeWordFolder, "*.wav")))
+    for take in range(3):
+        input(f"Press Enter, then say \"Hey Flick\" ({take + 1} of 3)")
+        audio = sd.rec(int(2 * rate), samplerate=rate, channels=1, dtype="float32")
+        sd.wait()
+        path = os.path.join(wakeWordFolder, f"heyflick{existing + take + 1}.wav")
+        sf.write(path, audio, rate)
+        print(f"WAKE  | Saved {path} ({len(trimToSpeech(audio[:, 0])) / rate:.1f}s of speech)")